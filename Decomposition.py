@@ -0,0 +1,332 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from HeldKarp import MAX_VERTICES, HeldKarp
+from Heuristics import initial_solution, iterated_local_search
+from LocalSearch import post_optimize
+from Routes import objective_value, route_costs
+from TSPLIBReader import SymmetricDistanceMatrix, instance_points, read_TSPLIB_instance
+
+
+def submatrix(D, vertices):
+    """SymmetricDistanceMatrix of D restricted to vertices (in that order)."""
+
+    vertices = np.asarray(vertices, dtype=np.int64)
+    I, J = np.triu_indices(len(vertices), 1)
+    return SymmetricDistanceMatrix.from_upper(len(vertices), D.pairs(vertices[I], vertices[J]))
+
+
+def farthest_seeds(D, m: int, R: list):
+    """m seed vertices: those of R, then the vertex farthest from the seeds
+    taken so far, one at a time."""
+
+    seeds = list(R) if len(R) > 0 else [0]
+    nearest = np.min([D.row(v) for v in seeds], axis=0)
+    while len(seeds) < m:
+        v = int(np.argmax(nearest))
+        seeds.append(v)
+        nearest = np.minimum(nearest, D.row(v))
+    return seeds[:m]
+
+
+def assign(cost, L: int, U: int, R: list):
+    """Labels (0 to m-1) of the vertices for the nxm costs of assigning them
+    to each group, with L to U vertices per group and the k-th vertex of R in
+    group k. Vertices are assigned by decreasing regret to their cheapest
+    group with room, then the cheapest moves fill the groups under L."""
+
+    n, m = cost.shape
+    labels = np.full(n, -1, dtype=np.int64)
+    sizes = np.zeros(m, dtype=np.int64)
+    required = np.zeros(n, dtype=bool)
+    for k, v in enumerate(R):
+        labels[v] = k
+        sizes[k] += 1
+        required[v] = True
+
+    ranked = np.sort(cost, axis=1)
+    regret = ranked[:, 1] - ranked[:, 0] if m > 1 else np.zeros(n)
+    for v in np.argsort(-regret, kind="stable"):
+        if labels[v] >= 0:
+            continue
+        for k in np.argsort(cost[v], kind="stable"):
+            if sizes[k] < U:
+                labels[v] = k
+                sizes[k] += 1
+                break
+
+    while (sizes < L).any():
+        k = int(np.argmin(sizes))
+        movable = np.flatnonzero(~required & (sizes[labels] > L))
+        v = movable[np.argmin(cost[movable, k] - cost[movable, labels[movable]])]
+        sizes[labels[v]] -= 1
+        labels[v] = k
+        sizes[k] += 1
+
+    return labels
+
+
+def partition(D, m: int, L: int, U: int, R: list, P=None, iterations=20):
+    """Groups of vertices for the m routes, with L to U vertices each and
+    the k-th vertex of R in group k, or None if there are none.
+
+    Capacitated k-means over the points P (nx2) if they are given, or
+    k-medoids over the rows of D otherwise, from farthest_seeds."""
+
+    n = len(D)
+    if len(R) > m or m * L > n or n > m * U:
+        return None
+
+    centers = farthest_seeds(D, m, R)
+    if P is not None:
+        centers = P[centers]
+
+    labels = None
+    for _ in range(iterations):
+        if P is not None:
+            cost = np.linalg.norm(P[:, None, :] - centers[None, :, :], axis=2)
+        else:
+            cost = np.stack([D.row(c) for c in centers], axis=1).astype(np.float64)
+
+        new_labels = assign(cost, L, U, R)
+        if labels is not None and (new_labels == labels).all():
+            break
+        labels = new_labels
+
+        # centroids or medoids of the groups
+        for k in range(m):
+            S = np.flatnonzero(labels == k)
+            if P is not None:
+                centers[k] = P[S].mean(axis=0)
+            else:
+                centers[k] = S[np.argmin([D.row(v)[S].sum() for v in S])]
+
+    return [np.flatnonzero(labels == k).tolist() for k in range(m)]
+
+
+def route_group(D, pinned: bool, variant: str, routing: str, TimeLimit: float, MemLimit: float):
+    """Single route over all the vertices of D (the submatrix of a group),
+    starting at vertex 0 if pinned. The route is found with the iterated
+    local search (heuristic), with IP2 for m=1 (IP2), or exactly (exact:
+    Held-Karp for up to MAX_VERTICES vertices, IP2 otherwise). The iterated
+    local search also finds the route if IP2 fails or has no solution."""
+
+    start_time = time.perf_counter()
+    s = len(D)
+    R = [0] if pinned else []
+    if routing == "exact" and s <= MAX_VERTICES:
+        route, cost = HeldKarp(D, variant).optimize(list(range(s)), pinned)
+        return route
+
+    if routing == "exact" or routing == "IP2":
+        import IP2  # IP2 builds its MIP start with this module
+        try:
+            tours = IP2.solve(None, 1, 2, s, R=R, IQP=False, MemLimit=MemLimit, TimeLimit=TimeLimit,
+                              variant=variant, Threads=1, D=D, localSearch=False,
+                              info={"IP": "IP2", "m": 1, "U": s})[0]
+        except RuntimeError:
+            # the solver failed (e.g. a size-limited license)
+            tours = []
+        if len(tours) > 0:
+            return tours[0]
+    elif routing != "heuristic":
+        raise ValueError("Invalid routing method!")
+
+    # within the time left to the group
+    remaining = max(TimeLimit - (time.perf_counter() - start_time), 0)
+    routes = iterated_local_search(D, 1, 2, s, R, variant, "minsum", TimeLimit=remaining)[0]
+    return routes[0]
+
+
+def decompose(D, m: int, L: int, U: int, R: list, variant: str, P=None, routing="heuristic", TimeLimit=10,
+              MemLimit=0.01, workers=None):
+    """Cluster-first, route-second solution: the vertices are split by
+    partition and the route of each group is found by route_group, the
+    groups in parallel (in workers processes, default one per group and
+    core). The groups share TimeLimit seconds. Returns the routes, or None
+    if there is no partition."""
+
+    start_time = time.perf_counter()
+    groups = partition(D, m, L, U, R, P)
+    if groups is None:
+        return None
+
+    # the vertex of R of a group goes first
+    for k, v in enumerate(R):
+        groups[k].remove(v)
+        groups[k].insert(0, v)
+    pinned = [k < len(R) for k in range(m)]
+    matrices = [submatrix(D, group) for group in groups]
+
+    if workers is None:
+        workers = min(m, os.cpu_count() or 1)
+    if workers > 1:
+        # the groups run in ceil(m / workers) rounds within the remaining time
+        budget = max(TimeLimit - (time.perf_counter() - start_time), 0) / math.ceil(m / workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            routes = list(executor.map(route_group, matrices, pinned, [variant] * m, [routing] * m,
+                                       [budget] * m, [MemLimit] * m))
+    else:
+        routes = []
+        for k in range(m):
+            # the remaining time is split between the remaining groups
+            budget = max(TimeLimit - (time.perf_counter() - start_time), 0) / (m - k)
+            routes.append(route_group(matrices[k], pinned[k], variant, routing, budget, MemLimit))
+
+    return [[groups[k][v] for v in route] for k, route in enumerate(routes)]
+
+
+def initial_routes(D, m: int, L: int, U: int, R: list, variant: str, objective: str, MIPStart=True):
+    """Routes of the MIP start: the split of a giant tour (MIPStart true) or
+    a cluster-first, route-second solution ("decomposition") computed
+    sequentially over the rows of D within one second."""
+
+    if MIPStart == "decomposition":
+        return decompose(D, m, L, U, R, variant, TimeLimit=1, workers=1)
+    return initial_solution(D, m, L, U, R, variant, objective)
+
+
+def solve(file_instance: str, m: int, L: int, U: int, R=[], TimeLimit=10, objective="minsum", variant="CP",
+          routing="heuristic", MemLimit=0.01, localSearch=False, lazy=False, D=None):
+    start_time = time.perf_counter()
+
+    # the groups are built from the coordinates, when there are
+    P = None
+    if D is None:
+        D, I = read_TSPLIB_instance(file_instance, lazy=lazy)
+        if I.EDGE_WEIGHT_TYPE != "EXPLICIT" and len(I.NODE_COORD_SECTION) > 0:
+            P = instance_points(I)
+    n = len(D)
+    if U > n:
+        U = n
+
+    if L > U:
+        L = 2
+
+    tours = decompose(D, m, L, U, R, variant, P, routing, TimeLimit, MemLimit)
+    if tours is None:
+        tours = []
+        fitness = math.inf
+    else:
+        fitness = objective_value(route_costs(D, tours, variant), objective)
+    runtime = time.perf_counter() - start_time
+
+    # there is no lower bound to measure the gap
+    gap = math.inf
+
+    # post-optimization of the returned paths
+    improved = None
+    if localSearch:
+        improved = post_optimize(D, tours, L, U, R, variant, objective)
+
+    return tours, float(fitness), runtime, gap, improved, L, U
+
+
+def run_decomposition(conf, D=None):
+
+    inputparams = {"IP": conf["IP"]}  # register of input parameters
+
+    output_file = conf["outputFile"]
+    inputparams["outputFile"] = output_file
+    if os.path.exists(output_file):
+        os.remove(output_file)
+
+    file_instance = conf["instance"]
+    inputparams["instance"] = file_instance
+
+    m = conf["m"]
+    inputparams["m"] = m
+
+    L = conf["L"]
+    if L < 2:
+        L = 2
+    inputparams["L"] = L
+
+    U = conf["U"]
+    inputparams["U"] = U
+
+    R = conf["R"]
+    inputparams["R"] = R
+
+    objective = conf["objective"]
+    inputparams["objective"] = objective
+
+    variant = conf["variant"]
+    inputparams["variant"] = variant
+
+    TimeLimit = conf["TimeLimit"]
+    inputparams["TimeLimit"] = TimeLimit
+
+    routing = "heuristic"
+    if "routing" in conf:
+        routing = conf["routing"]
+        inputparams["routing"] = routing
+
+    MemLimit = 0.01
+    if "MemLimit" in conf:
+        MemLimit = conf["MemLimit"]
+        inputparams["MemLimit"] = MemLimit
+
+    localSearch = False
+    if "localSearch" in conf:
+        localSearch = conf["localSearch"]
+        inputparams["localSearch"] = localSearch
+
+    lazy = False
+    if "lazy" in conf:
+        lazy = conf["lazy"]
+        inputparams["lazy"] = lazy
+
+    tours, fitness, runtime, gap, improved, L, U = solve(file_instance=file_instance, m=m, L=L, U=U, R=R,
+                                                         TimeLimit=TimeLimit, objective=objective, variant=variant,
+                                                         routing=routing, MemLimit=MemLimit, localSearch=localSearch,
+                                                         lazy=lazy, D=D)
+    inputparams["L"] = L
+    inputparams["U"] = U
+
+    with open(output_file + ".tmp", "w") as writer:
+        ignored = conf.copy()
+
+        output_dict = {}
+        # input configuration
+        INPUT_dict = {}
+        INPUT_default = []
+        for key, value in inputparams.items():
+            INPUT_dict[key] = value
+            if ignored[key] != value:
+                INPUT_default.append(key)
+            else:
+                del ignored[key]
+
+        if len(INPUT_default) > 0:
+            INPUT_dict["default"] = INPUT_default
+        output_dict["INPUT"] = INPUT_dict
+
+        # print ignored parameters
+        if len(ignored) > 0:
+            output_dict["IGNORED_PARAMETERS"] = ignored
+
+        OUTPUT_dict = {}
+        # output
+        OUTPUT_dict["objval"] = str(fitness)
+        OUTPUT_dict["runtime"] = runtime
+        OUTPUT_dict["gap"] = str(gap)
+        OUTPUT_dict["paths"] = tours
+        if improved is not None:
+            OUTPUT_dict["improvedobjval"] = str(improved[1])
+            OUTPUT_dict["improvedpaths"] = improved[0]
+
+        output_dict["OUTPUT"] = OUTPUT_dict
+
+        import json
+        writer.write(json.dumps(output_dict))
+    os.replace(output_file + ".tmp", output_file)
+
+    print("output printed in {}".format(output_file))
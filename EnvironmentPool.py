@@ -0,0 +1,54 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import atexit
+import threading
+
+import gurobipy as gp
+
+
+class EnvironmentPool(object):
+    """Started gurobi environments reused across solves, so the license is
+    checked out once per environment and not once per model.
+
+    acquire returns an idle environment (a new one is started only if all
+    of them are in use) and release gives it back once its models are
+    disposed. close disposes every environment. params are set on each
+    environment before it is started (e.g., license parameters); model
+    parameters such as MemLimit are set on the models."""
+
+    def __init__(self, params=None) -> None:
+        self.params = {} if params is None else params
+        self.environments = []
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if len(self.idle) > 0:
+                return self.idle.pop()
+
+        env = gp.Env(empty=True)
+        for name, value in self.params.items():
+            env.setParam(name, value)
+        env.start()
+
+        with self.lock:
+            self.environments.append(env)
+        return env
+
+    def release(self, env):
+        with self.lock:
+            self.idle.append(env)
+
+    def close(self):
+        with self.lock:
+            for env in self.environments:
+                env.dispose()
+            self.environments = []
+            self.idle = []
+
+
+# environments of the solves of this process
+default_pool = EnvironmentPool()
+atexit.register(default_pool.close)
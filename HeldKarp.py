@@ -0,0 +1,109 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import numpy as np
+
+# routes with more vertices are not re-optimized (the tables take 2^n * n entries)
+MAX_VERTICES = 16
+
+
+class HeldKarp(object):
+    """Exact re-optimization of single routes with the Held-Karp dynamic
+    program. The order of the vertices of a route is replaced by an optimal
+    one, as a closed path (CP) or as an open path (OP). Optimal orders are
+    memoized by vertex set (and first vertex, for pinned open paths), so a
+    route already seen costs a dictionary lookup."""
+
+    def __init__(self, D, variant: str, limit=MAX_VERTICES) -> None:
+        if variant != "CP" and variant != "OP":
+            raise ValueError("Invalid variant!")
+
+        self.D = D
+        self.closed = variant == "CP"
+        self.limit = limit
+        self.cache = {}
+
+    def tables(self, c, first):
+        """f[S][j] is the cost of the best path over the vertex set S (a
+        bitmask) ending at j, and parent[S][j] the vertex before j. Paths
+        start at any vertex if first is None. Every layer (size of S) is
+        computed with one array operation per last vertex."""
+
+        s = len(c)
+        size = 1 << s
+        f = np.full((size, s), np.inf)
+        parent = np.full((size, s), -1, dtype=np.int8)
+        starts = range(s) if first is None else [first]
+        for j in starts:
+            f[1 << j, j] = 0
+
+        masks = np.arange(size)
+        bits = (masks[:, None] >> np.arange(s)) & 1
+        layer = bits.sum(axis=1)
+        for p in range(2, s + 1):
+            M = masks[layer == p]
+            for j in range(s):
+                S = M[bits[M, j] == 1]
+                values = f[S ^ (1 << j)] + c[:, j]
+                parent[S, j] = np.argmin(values, axis=1)
+                f[S, j] = values[np.arange(len(S)), parent[S, j]]
+
+        return f, parent
+
+    def solve(self, vertices, first):
+        """Optimal order of vertices (starting at vertices[first] if first is
+        not None) and its cost."""
+
+        s = len(vertices)
+        c = self.D.pairs(np.repeat(vertices, s), np.tile(vertices, s)).reshape(s, s).astype(np.float64)
+        f, parent = self.tables(c, first)
+
+        full = (1 << s) - 1
+        last = f[full] + c[:, first] if self.closed else f[full]
+        j = int(np.argmin(last))
+        cost = int(last[j])
+
+        order = []
+        S = full
+        while j >= 0:
+            order.append(vertices[j])
+            S, j = S ^ (1 << j), int(parent[S, j])
+        order.reverse()
+        return order, cost
+
+    def optimize(self, route: list, pinned=False):
+        """Optimal order of the vertices of route and its cost, or None if the
+        route has more than limit vertices. If pinned is True the route keeps
+        its first vertex (closed paths always start at route[0])."""
+
+        route = [int(v) for v in route]
+        if len(route) > self.limit:
+            return None
+        if len(route) < 2:
+            return route, 0
+
+        vertices = sorted(route)
+        if self.closed:
+            # a closed path can start at any of its vertices
+            key = (frozenset(route), None)
+            if key not in self.cache:
+                self.cache[key] = self.solve(vertices, 0)
+            order, cost = self.cache[key]
+            p = order.index(route[0])
+            return order[p:] + order[:p], cost
+
+        key = (frozenset(route), route[0] if pinned else None)
+        if key not in self.cache:
+            self.cache[key] = self.solve(vertices, vertices.index(route[0]) if pinned else None)
+        return self.cache[key]
+
+    def improve(self, routes: list, R: list):
+        """Copy of the routes with every route of up to limit vertices in an
+        optimal order. Routes starting at a vertex of R keep it first."""
+
+        R = set(R)
+        improved = []
+        for route in routes:
+            result = self.optimize(route, len(route) > 0 and route[0] in R)
+            improved.append(list(route) if result is None else result[0])
+        return improved
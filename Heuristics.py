@@ -0,0 +1,361 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import math
+import time
+
+import numpy as np
+
+from Routes import objective_value, route_costs
+
+
+def nearest_neighbor_tour(D, start=0, k=10):
+    """Giant tour over all the vertices of D built with the nearest neighbor
+    rule from start. The next vertex is taken from the k-nearest neighbor
+    lists, the whole row is scanned only if all of them were visited."""
+
+    n = len(D)
+    candidates = D.neighbors(k).tolist()
+    visited = np.zeros(n, dtype=bool)
+    visited[start] = True
+    tour = [start]
+
+    v = start
+    for _ in range(n - 1):
+        for u in candidates[v]:
+            if not visited[u]:
+                break
+        else:
+            row = D.row(v).astype(np.float64)
+            row[visited] = np.inf
+            u = int(np.argmin(row))
+
+        visited[u] = True
+        tour.append(u)
+        v = u
+
+    return np.array(tour, dtype=np.int64)
+
+
+SPLIT_LIMIT = 1000000
+
+
+def split_tour(D, tour, m: int, L: int, U: int, R: list, variant: str, objective: str):
+    """Optimal split of a giant tour into m routes of L to U vertices each,
+    where every vertex of R starts a route.
+
+    The vertices of R are taken out of the tour and each one may be put in
+    front of a route. f[r][e] is the best objective of the first P[e]
+    vertices left in the tour split into k routes, r of them starting at
+    the first r vertices of R (in the order of the tour); each layer k is
+    computed with one array operation per gap between the positions P
+    where routes start. P holds every position of the tour, unless there
+    are more than SPLIT_LIMIT pairs of them to try: then routes only start
+    every few positions or after the longest edges of the tour, and the
+    split is no longer optimal. Returns the routes, or None if there is no
+    such split."""
+
+    if objective != "minsum" and objective != "minmax":
+        raise ValueError("Invalid objective function!")
+
+    tour = np.asarray(tour, dtype=np.int64)
+    required = np.zeros(len(D), dtype=bool)
+    required[np.asarray(R, dtype=np.int64)] = True
+    depots = tour[required[tour]]
+    tour = tour[~required[tour]]
+    n = len(tour)
+
+    # the cost of the path tour[s], ..., tour[e-1] is prefix[e-1] - prefix[s]
+    edges = D.pairs(tour[:-1], tour[1:])
+    prefix = np.concatenate([[0], np.cumsum(edges)]).astype(np.float64)
+
+    # positions of the tour where routes start, last one at the end of the tour
+    shortest, longest = max(L - 1, 1), min(U, n)
+    if n * (longest - shortest + 1) <= SPLIT_LIMIT:
+        P = np.arange(n + 1)
+    else:
+        step = math.ceil(math.sqrt(n * (longest - shortest + 1) / SPLIT_LIMIT))
+        cuts = np.argsort(-edges, kind="stable")[:n // step] + 1
+        P = np.unique(np.concatenate([np.arange(0, n, step), cuts, [n]]))
+    N = len(P)
+
+    # distances from the vertices of R to the tour
+    rows = [D.row(v)[tour].astype(np.float64) for v in depots]
+
+    def combine(f, cost):
+        return f + cost if objective == "minsum" else np.maximum(f, cost)
+
+    def relax(g, r, value, s, e, gap, k, is_prefixed):
+        better = value < g[r, e]
+        g[r, e[better]] = value[better]
+        gaps[k, r, e[better]] = gap
+        prefixed[k, r, e[better]] = is_prefixed
+
+    f = np.full((len(depots) + 1, N), np.inf)
+    f[0, 0] = 0
+    gaps = np.zeros((m, len(depots) + 1, N), dtype=np.int64)
+    prefixed = np.zeros((m, len(depots) + 1, N), dtype=bool)
+    for k in range(m):
+        g = np.full_like(f, np.inf)
+        for gap in range(1, N):
+            s, e = np.arange(N - gap), np.arange(gap, N)
+            l = P[e] - P[s]
+            if l.min() > longest:
+                break
+            keep = (shortest <= l) & (l <= longest)
+            s, e, l = s[keep], e[keep], l[keep]
+            if len(s) == 0:
+                continue
+
+            first, last = P[s], P[e] - 1
+            path = prefix[last] - prefix[first]
+            whole = (L <= l) & (l <= U)
+            closed = path + D.pairs(tour[last], tour[first]) if variant == "CP" else path
+            for r in range(len(depots) + 1):
+                relax(g, r, np.where(whole, combine(f[r, s], closed), np.inf), s, e, gap, k, False)
+
+                # route starting at the r-th vertex of R
+                if r > 0:
+                    cost = rows[r - 1][first] + path
+                    if variant == "CP":
+                        cost = cost + rows[r - 1][last]
+                    value = np.where(l + 1 <= U, combine(f[r - 1, s], cost), np.inf)
+                    relax(g, r, value, s, e, gap, k, True)
+        f = g
+
+    if not np.isfinite(f[len(depots), N - 1]):
+        return None
+
+    routes = []
+    r, e = len(depots), N - 1
+    for k in range(m - 1, -1, -1):
+        gap = gaps[k, r, e]
+        route = tour[P[e - gap]:P[e]].tolist()
+        if prefixed[k, r, e]:
+            r -= 1
+            route.insert(0, int(depots[r]))
+        routes.append(route)
+        e -= gap
+
+    routes.reverse()
+    return routes
+
+
+def initial_solution(D, m: int, L: int, U: int, R: list, variant: str, objective: str):
+    """Feasible solution built by splitting a nearest neighbor giant tour,
+    or None if the giant tour can not be split under L, U and R."""
+
+    start = R[0] if len(R) > 0 else 0
+    return split_tour(D, nearest_neighbor_tour(D, start), m, L, U, R, variant, objective)
+
+
+def two_opt_moves(D, tour, position, candidates, I):
+    """Best 2-opt move of the cycle tour for every edge (a, b) = (tour[i],
+    tour[i+1]), i in I, among the edges (c, d) where c is a candidate
+    neighbor of a. Returns the gains and the positions i < j of a and c of
+    the moves (each move reverses tour[i+1], ..., tour[j])."""
+
+    n = len(tour)
+    A = tour[I]
+    B = tour[(I + 1) % n]
+    C = candidates[A]
+    J = position[C]
+    Dn = tour[(J + 1) % n]
+    gain = (D.pairs(A, B)[:, None] + D.pairs(C, Dn) -
+            D.pairs(np.broadcast_to(A[:, None], C.shape), C) - D.pairs(np.broadcast_to(B[:, None], C.shape), Dn))
+    gain[C == B[:, None]] = 0
+
+    rows = np.arange(len(I))
+    best = np.argmax(gain, axis=1)
+    j = J[rows, best]
+    return gain[rows, best], np.minimum(I, j), np.maximum(I, j)
+
+
+def or_opt_moves(D, tour, position, candidates, length: int, I):
+    """Best Or-opt move of the cycle tour for every segment of length
+    vertices starting at tour[i], i in I, which puts it next to a candidate
+    neighbor c of its first vertex, either after c or (reversed) before c.
+    Returns the gains of the moves, the positions of c and whether the
+    segment goes after c."""
+
+    n = len(tour)
+    p = tour[I - 1]
+    first = tour[I]
+    last = tour[(I + length - 1) % n]
+    q = tour[(I + length) % n]
+    removal = D.pairs(p, first) + D.pairs(last, q) - D.pairs(p, q)
+
+    C = candidates[first]
+    K = position[C]
+    inside = (K - I[:, None]) % n < length
+    first_c = D.pairs(np.broadcast_to(first[:, None], C.shape), C)
+
+    # p, first, ..., last, q becomes c, first, ..., last, e
+    e = tour[(K + 1) % n]
+    after = removal[:, None] - (first_c + D.pairs(np.broadcast_to(last[:, None], C.shape), e) - D.pairs(C, e))
+    after[inside | (C == p[:, None])] = 0
+
+    # b, c becomes b, last, ..., first, c
+    b = tour[K - 1]
+    before = removal[:, None] - (D.pairs(b, np.broadcast_to(last[:, None], C.shape)) + first_c - D.pairs(b, C))
+    before[inside | (C == q[:, None])] = 0
+
+    rows = np.arange(len(I))
+    best_after = np.argmax(after, axis=1)
+    best_before = np.argmax(before, axis=1)
+    gain_after, gain_before = after[rows, best_after], before[rows, best_before]
+    is_after = gain_after >= gain_before
+    return (np.where(is_after, gain_after, gain_before),
+            np.where(is_after, K[rows, best_after], K[rows, best_before]), is_after)
+
+
+def improve_tour(D, tour, candidates, max_length=3, deadline=math.inf):
+    """Local search over the cycle tour with 2-opt and Or-opt moves (segments
+    of up to max_length vertices) restricted to the candidate lists.
+
+    Every sweep evaluates the neighborhoods of the active vertices at once
+    and applies their improving moves, best first, as long as each one
+    changes a stretch of the tour untouched by the moves applied before it.
+    Only the endpoints of the edges changed by a sweep and the vertices of
+    the moves left out stay active for the next one (don't look bits), and
+    when none is left the whole tour is swept again. Stops when no move
+    improves the tour or at the deadline (a time.perf_counter() value)."""
+
+    tour = np.array(tour, dtype=np.int64)
+    n = len(tour)
+    if n < 5:
+        return tour
+
+    position = np.empty(n, dtype=np.int64)
+    active = np.ones(n, dtype=bool)
+    while time.perf_counter() < deadline:
+        position[tour] = np.arange(n)
+        I = np.flatnonzero(active[tour])
+        if len(I) == 0:
+            # one last sweep over the whole tour
+            active[:] = True
+            continue
+
+        # gain, stretch tour[lo], ..., tour[hi] changed, segment length (0 for 2-opt), i, j (or the position k of
+        # c) and whether the segment goes after c, of every move
+        gain, i, j = two_opt_moves(D, tour, position, candidates, I)
+        moves = [(gain, i, np.minimum(j + 1, n - 1), np.zeros(len(I), dtype=np.int64), i, j,
+                  np.zeros(len(I), dtype=bool))]
+        for length in range(1, min(max_length, n - 3) + 1):
+            gain, k, after = or_opt_moves(D, tour, position, candidates, length, I)
+            lo = np.minimum(I - 1, np.where(after, k, k - 1))
+            hi = np.maximum(I + length, np.where(after, k + 1, k))
+            # the stretch of the move wraps around the end of the tour
+            gain[(lo < 0) | (hi > n - 1)] = 0
+            moves.append((gain, lo, hi, np.full(len(I), length), I, k, after))
+
+        gain, lo, hi, kind, origin, target, after = (np.concatenate(values) for values in zip(*moves))
+        vertex = np.tile(tour[I], len(moves))
+        improving = np.flatnonzero(gain > 0)
+        if len(improving) == 0 and len(I) == n:
+            break
+        active[:] = False
+        changed = np.zeros(n, dtype=bool)
+        for move in improving[np.argsort(-gain[improving], kind="stable")]:
+            if changed[lo[move]:hi[move] + 1].any():
+                # tried again in the next sweep
+                active[vertex[move]] = True
+                continue
+            changed[lo[move]:hi[move] + 1] = True
+
+            i, k, length = origin[move], target[move], kind[move]
+            if length == 0:
+                # 2-opt
+                active[tour[[i, i + 1, k, (k + 1) % n]]] = True
+                tour[i + 1:k + 1] = tour[i + 1:k + 1][::-1]
+                continue
+
+            # Or-opt
+            active[tour[[i - 1, i, i + length - 1, i + length, k, k + 1 if after[move] else k - 1]]] = True
+            segment = tour[i:i + length].copy()
+            if not after[move]:
+                segment = segment[::-1]
+            if k > i:
+                end = k + 1 if after[move] else k
+                tour[i:end] = np.concatenate([tour[i + length:end], segment])
+            else:
+                start = k + 1 if after[move] else k
+                tour[start:i + length] = np.concatenate([segment, tour[start:i]])
+
+    return tour
+
+
+def double_bridge(tour, rng, window=50):
+    """Exchanges two consecutive segments of the tour inside a random window
+    of positions, then rotates the tour to a random vertex."""
+
+    n = len(tour)
+    if n < 8:
+        return np.roll(tour, rng.integers(n))
+
+    window = min(window, n - 1)
+    start = rng.integers(n)
+    a, b, c = np.sort(rng.choice(np.arange(1, window), size=3, replace=False))
+    tour = np.roll(tour, -start)
+    tour = np.concatenate([tour[:a], tour[b:c], tour[a:b], tour[c:]])
+    return np.roll(tour, rng.integers(n))
+
+
+def iterated_local_search(D, m: int, L: int, U: int, R: list, variant: str, objective: str, TimeLimit=60,
+                          iterations=1000, BestObjStop=None, k=10, seed=0, pool=None):
+    """Iterated local search over giant tours. Each giant tour is improved
+    with improve_tour, split with split_tour and accepted if its split is
+    not worse than the current one; perturbations are local double bridges.
+
+    Stops after TimeLimit seconds, after iterations consecutive iterations
+    without improving the best solution or when a solution as good as
+    BestObjStop is found. Returns the best routes, their
+    objective value, the time they were found and the convergence list of
+    [time, objective value] of the best solutions. The routes of every split
+    are added to pool (a RoutePool), if it is given."""
+
+    start_time = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    candidates = D.neighbors(k)
+
+    best_routes, best_objval, t_inc = None, math.inf, 0
+    convergence = []
+
+    # the local search leaves time for the split of its tour
+    deadline = start_time + TimeLimit
+    tour = nearest_neighbor_tour(D, R[0] if len(R) > 0 else 0, k)
+    for improve in [False, True]:
+        if improve:
+            tour = improve_tour(D, tour, candidates, deadline=deadline - split_time)
+        split_start = time.perf_counter()
+        routes = split_tour(D, tour, m, L, U, R, variant, objective)
+        split_time = time.perf_counter() - split_start
+        if pool is not None and routes is not None:
+            pool.add_routes(routes)
+        objval = math.inf if routes is None else objective_value(route_costs(D, routes, variant), objective)
+        if objval < best_objval:
+            best_routes, best_objval, t_inc = routes, objval, time.perf_counter() - start_time
+            convergence.append([t_inc, float(best_objval)])
+
+    target = -math.inf if BestObjStop is None else BestObjStop
+    stall = 0
+    while stall < iterations and best_objval > target and time.perf_counter() + split_time < deadline:
+        new_tour = improve_tour(D, double_bridge(tour, rng), candidates, deadline=deadline - split_time)
+        new_routes = split_tour(D, new_tour, m, L, U, R, variant, objective)
+        stall += 1
+        if new_routes is None:
+            continue
+        if pool is not None:
+            pool.add_routes(new_routes)
+
+        new_objval = objective_value(route_costs(D, new_routes, variant), objective)
+        if new_objval <= objval:
+            tour, routes, objval = new_tour, new_routes, new_objval
+
+        if new_objval < best_objval:
+            best_routes, best_objval = new_routes, new_objval
+            t_inc = time.perf_counter() - start_time
+            convergence.append([t_inc, float(best_objval)])
+            stall = 0
+
+    return best_routes, best_objval, t_inc, convergence
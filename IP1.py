@@ -3,301 +3,430 @@
 
 import math
 import os
+import time
 from pathlib import Path
 
 import gurobipy as gp
+import numpy as np
 from gurobipy import GRB, quicksum
 
-from TSPLIBReader import read_TSPLIB_instance
+from Decomposition import initial_routes
+from EnvironmentPool import default_pool
+from LocalSearch import IncumbentPolisher, post_optimize
+from LowerBound import held_karp_bound, lp_bound, reduced_cost_elimination
+from ModelBuilder import build_IP1_matrix, remove_arcs
+from Routes import route_costs, routes_from_successors, set_start, solution_values, successors
+from ResultStore import ResultCache, cache_path, run_key
+from RoutePool import RoutePool, recombine
+from TSPLIBReader import DummyDepotMatrix, instance_digest, read_TSPLIB_instance
+from Telemetry import SolveTelemetry
 
-convergence = []
-def callback_incumbent_logger(model, where):
-    if where == GRB.Callback.MIPSOL:
 
-        this_objval = model.cbGet(GRB.Callback.MIPSOL_OBJ)
-        this_time = model.cbGet(GRB.Callback.RUNTIME)
+def callback_incumbent_logger(model, where, telemetry, polisher=None, race=None, pool=None, decode=None):
+    telemetry.callback(model, where)
 
-        global t_inc, objval
-        if objval != this_objval:
-            objval = this_objval
-            t_inc = this_time
-            convergence.append([this_time, this_objval])
+    if where == GRB.Callback.MIPSOL and pool is not None:
+        pool.add_routes(decode(model))
 
+    if where == GRB.Callback.MIPSOL and polisher is not None:
+        polisher.polish(model)
 
-def build_path(edges: list, n: int):
-    endpoints = set(range(n))
-    track = []
+    if race is not None:
+        race.callback(model, where)
+
+
+def build_path(X, m: int):
+    """Paths between actual vertices from the values X of x (dummy depots are the first m indices)."""
+    I, J = np.nonzero(X[m:, m:].sum(axis=2) > 0.5)
+    return routes_from_successors(successors(len(X) - m, I, J))
+
+
+def build_model(model, C, n: int, m: int, L: int, U: int, R: list, IQP: bool, objective: str, variant: str):
+    # add variables
+    x = []
     for i in range(n):
-        track.append([])
+        x.append([0] * n)
     
-    for e in edges:
-        track[e[0]].append(e[1])
-        if len(track[e[0]]) == 2:
-            endpoints.remove(e[0])
-        
-        track[e[1]].append(e[0])
-        if len(track[e[1]]) == 2:
-            endpoints.remove(e[1])
+    for i in range(n):
+        for j in range(n):
+            xk = []
+            for k in range(m):
+                xk.append(model.addVar(vtype=GRB.BINARY,
+                                       name="x{},{},{}".format(i, j, k)))
+            x[i][j] = xk
     
-    tours = []
-    while len(endpoints) > 0:
-        v = endpoints.pop()
-        tour = [v, track[v][0]]
-        while len(track[tour[-1]]) == 2:
-            # there are two possible elements per track[i]
-            if track[tour[-1]][0] != tour[-2]:
-                v = track[tour[-1]][0]
-            else:
-                v = track[tour[-1]][1]
-            tour.append(v)
-        
-        # remove the last vertex of tour from endpoints
-        endpoints.remove(tour[-1])
-        tours.append(tour)
+    t = []
+    for i in range(n):
+        t.append(model.addVar(vtype=GRB.CONTINUOUS,
+                              name='t{}'.format(i)))
+    variables = {"x": x, "t": t}
     
-    return tours
-
-
-def solve(file_instance: str, m: int, L: int, U: int, R=[], IQP=True, BestObjStop=None, MemLimit=0.01, TimeLimit=5, objective="minsum",
-          variant="CP", presolve=2, MIPGap=0.0, outputFlag=0):
-    try:
-        global t_inc, objval
-        t_inc = math.inf
-        objval = math.inf
-        
-        C, I = read_TSPLIB_instance(file_instance)
-        n = len(C) + m
-        if U > n-m:
-            U = n-m
-            inputparams["U"] = U
-
-        if L > U:
-            L = 2
-            inputparams["L"] = L
-        
-        # add dummy depots
-        for i in range(m):
-            C.insert(0, [0] * n)
-        for i in range(m, n):
-            for j in range(m):
-                C[i].insert(0, 0)
-        
-        env = gp.Env(empty=True)
-        env.setParam("MemLimit", MemLimit)
-        env.start()
+    # constraints
+    D = []  # dummy depots set
+    V = []  # actual vertices in G=(V, E)
+    for i in range(n):
+        if i < m:
+            D.append(i)
+        else:
+            V.append(i)
+    
+    # (2)
+    for k in D:
+        model.addConstr(quicksum(x[k][j][k] for j in V) == 1)
+    
+    # (3)
+    for j in V:
+        model.addConstr(
+            quicksum(x[k][j][k] for k in D) +
+            quicksum(quicksum(x[i][j][k] for i in V) for k in D) == 1)
+    
+    # (4)
+    for j in V:
+        for k in D:
+            model.addConstr(
+                x[k][j][k] + quicksum(x[i][j][k] for i in V) -
+                x[j][k][k] - quicksum(x[j][i][k] for i in V) == 0)
+    
+    # (5)
+    for k in D:
+        model.addConstr(quicksum(x[k][j][k] for j in V) - quicksum(x[j][k][k] for j in V) == 0)
+    
+    # (6); (7); (8)
+    for i in V:
+        # (6)
+        model.addConstr(t[i] + (U - 2) * quicksum(x[k][i][k] for k in D) - quicksum(x[i][k][k] for k in D) <= U - 1)
         
-        model = gp.Model(env=env)
-        model.setParam("presolve", presolve)
-        model.Params.outputFlag = outputFlag
-        model.setParam("MIPGap", MIPGap)
-        model.setParam("TimeLimit", TimeLimit)
-
-        if BestObjStop is not None:
-            model.setParam("BestObjStop", BestObjStop)
+        # (7)
+        model.addConstr(t[i] + quicksum(x[k][i][k] for k in D) + (2 - L) * quicksum(x[i][k][k] for k in D) >= 2)
         
-        # add variables
-        x = []
+        # (8)
+        model.addConstr(quicksum(x[k][i][k] for k in D) + quicksum(x[i][k][k] for k in D) <= 1)
+    
+    # (9)
+    for i in V:
+        for j in V:
+            model.addConstr(t[i] - t[j] + U * quicksum(x[i][j][k] for k in D) +
+                            (U - 2) * quicksum(x[j][i][k] for k in D) <= U - 1)
+    
+    if variant == "CP" and IQP is False:
+        # add y variables
+        y = []
         for i in range(n):
-            x.append([0] * n)
+            y.append([0] * n)
         
         for i in range(n):
             for j in range(n):
-                xk = []
+                yk = []
                 for k in range(m):
-                    xk.append(model.addVar(vtype=GRB.BINARY,
-                                           name="x{},{},{}".format(i, j, k)))
-                x[i][j] = xk
-        
-        t = []
-        for i in range(n):
-            t.append(model.addVar(vtype=GRB.CONTINUOUS,
-                                  name='t{}'.format(i)))
-        
-        # constraints
-        D = []  # dummy depots set
-        V = []  # actual vertices in G=(V, E)
-        for i in range(n):
-            if i < m:
-                D.append(i)
-            else:
-                V.append(i)
-        
-        # (2)
-        for k in D:
-            model.addConstr(quicksum(x[k][j][k] for j in V) == 1)
-        
-        # (3)
-        for j in V:
-            model.addConstr(
-                quicksum(x[k][j][k] for k in D) +
-                quicksum(quicksum(x[i][j][k] for i in V) for k in D) == 1)
-        
-        # (4)
-        for j in V:
-            for k in D:
-                model.addConstr(
-                    x[k][j][k] + quicksum(x[i][j][k] for i in V) -
-                    x[j][k][k] - quicksum(x[j][i][k] for i in V) == 0)
+                    yk.append(model.addVar(vtype=GRB.BINARY, name="y{},{},{}".format(i, j, k)))
+                y[i][j] = yk
+        variables["y"] = y
         
-        # (5)
+        # new constraints for y variables
         for k in D:
-            model.addConstr(quicksum(x[k][j][k] for j in V) - quicksum(x[j][k][k] for j in V) == 0)
-        
-        # (6); (7); (8)
-        for i in V:
-            # (6)
-            model.addConstr(t[i] + (U - 2) * quicksum(x[k][i][k] for k in D) - quicksum(x[i][k][k] for k in D) <= U - 1)
-            
-            # (7)
-            model.addConstr(t[i] + quicksum(x[k][i][k] for k in D) + (2 - L) * quicksum(x[i][k][k] for k in D) >= 2)
-            
-            # (8)
-            model.addConstr(quicksum(x[k][i][k] for k in D) + quicksum(x[i][k][k] for k in D) <= 1)
-        
-        # (9)
-        for i in V:
             for j in V:
-                model.addConstr(t[i] - t[j] + U * quicksum(x[i][j][k] for k in D) +
-                                (U - 2) * quicksum(x[j][i][k] for k in D) <= U - 1)
+                for i in V:
+                    model.addConstr(y[i][j][k] >= x[i][k][k] + x[k][j][k] - 1)  # (16)
+                    model.addConstr(y[i][j][k] <= x[k][j][k])  # (17)
+                    model.addConstr(y[i][j][k] <= x[i][k][k])  # (18)
+                    
+                    # for FD-M+DL
+    if R is not None:
+        R = [x + m for x in R]
         
-        if variant == "CP" and IQP is False:
-            # add y variables
-            y = []
-            for i in range(n):
-                y.append([0] * n)
-            
-            for i in range(n):
-                for j in range(n):
-                    yk = []
-                    for k in range(m):
-                        yk.append(model.addVar(vtype=GRB.BINARY, name="y{},{},{}".format(i, j, k)))
-                    y[i][j] = yk
-            
-            # new constraints for y variables
-            for k in D:
-                for j in V:
-                    for i in V:
-                        model.addConstr(y[i][j][k] >= x[i][k][k] + x[k][j][k] - 1)  # (16)
-                        model.addConstr(y[i][j][k] <= x[k][j][k])  # (17)
-                        model.addConstr(y[i][j][k] <= x[i][k][k])  # (18)
-                        
-                        # for FD-M+DL
-        if R is not None:
-            R = [x + m for x in R]
-            
-            # (26)
-            model.addConstr(quicksum(quicksum(x[k][i][k] for i in R) for k in D) == len(R))
+        # (26)
+        model.addConstr(quicksum(quicksum(x[k][i][k] for i in R) for k in D) == len(R))
+    
+    if objective == "minsum":
         
-        if objective == "minsum":
-            
-            # quadratic objective function
-            if variant == "CP" and IQP is True:
-                # (1)
-                model.setObjective(
-                    quicksum(
-                        quicksum(
-                            C[i][j] * quicksum(x[i][j][k] + x[i][k][k] * x[k][j][k] for k in D)
-                            for j in V)
-                        for i in V)
-                )
-            
-            # linear objective function
-            elif variant == "CP" and IQP is False:
-                # (15)
-                model.setObjective(
-                    quicksum(
-                        quicksum(
-                            C[i][j] * quicksum(x[i][j][k] + y[i][j][k] for k in D)
-                            for j in V)
-                        for i in V)
-                )
-            
-            elif variant == "OP":
-                # (23)
-                model.setObjective(
+        # quadratic objective function
+        if variant == "CP" and IQP is True:
+            # (1)
+            model.setObjective(
+                quicksum(
                     quicksum(
-                        quicksum(
-                            C[i][j] * quicksum(x[i][j][k] for k in D)
-                            for j in V)
-                        for i in V)
-                )
+                        C[i, j] * quicksum(x[i][j][k] + x[i][k][k] * x[k][j][k] for k in D)
+                        for j in V)
+                    for i in V)
+            )
         
-        elif objective == "minmax":
-            Pmax = model.addVar(vtype=GRB.INTEGER, name="Pmax")
-            model.setObjective(Pmax)
-            
-            # quadratic objective function
-            if variant == "CP" and IQP is True:
-                # (21)
-                for k in range(m):
-                    model.addConstr(Pmax >=
-                                    quicksum(
-                                        quicksum(C[i][j] * (x[i][j][k] + x[i][k][k] * x[k][j][k]) for j in V)
-                                        for i in V))
-            
-            # linear objective function
-            elif variant == "CP" and IQP is False:
-                for k in range(m):
-                    model.addConstr(Pmax >=
-                                    quicksum(
-                                        quicksum(C[i][j] * (x[i][j][k] + y[i][j][k]) for j in V)
-                                        for i in V))
-            
-            elif variant == "OP":
-                # (25)
-                for k in range(m):
-                    model.addConstr(Pmax >=
-                                    quicksum(
-                                        quicksum(C[i][j] * x[i][j][k] for j in V)
-                                        for i in V))
-        
-        else:
-            raise ValueError("Invalid objective function!")
+        # linear objective function
+        elif variant == "CP" and IQP is False:
+            # (15)
+            model.setObjective(
+                quicksum(
+                    quicksum(
+                        C[i, j] * quicksum(x[i][j][k] + y[i][j][k] for k in D)
+                        for j in V)
+                    for i in V)
+            )
         
-        # attach callback for get incumbent time
-        model.optimize(callback_incumbent_logger)
-    
-    except gp.GurobiError as e:
-        if e.errno != 10001:
-            print('Error code ' + str() + ': ' + str(e))
-            raise RuntimeError("Error at solving procedure!")
-    
-    runtime = model.Runtime
-    fitness = model.objVal
-    gap = model.MIPGap
+        elif variant == "OP":
+            # (23)
+            model.setObjective(
+                quicksum(
+                    quicksum(
+                        C[i, j] * quicksum(x[i][j][k] for k in D)
+                        for j in V)
+                    for i in V)
+            )
     
-    if model.SolCount > 0:
-        # remove dummy depots
-        # for FD-M+DL
-        if R is not None:
-            R = [x - m for x in R]
-        n = n - m
-        for i in range(m):
-            del C[0]
-            del x[0]
-        for i in range(n):
-            for j in range(m):
-                del C[i][0]
-                del x[i][0]
+    elif objective == "minmax":
+        Pmax = model.addVar(vtype=GRB.INTEGER, name="Pmax")
+        variables["Pmax"] = Pmax
+        model.setObjective(Pmax)
         
-        edges = []
-        for i in range(n):
-            for j in range(n):
-                for k in range(m):
-                    if x[i][j][k].X > 0.9:
-                        edges.append((i, j))
+        # quadratic objective function
+        if variant == "CP" and IQP is True:
+            # (21)
+            for k in range(m):
+                model.addConstr(Pmax >=
+                                quicksum(
+                                    quicksum(C[i, j] * (x[i][j][k] + x[i][k][k] * x[k][j][k]) for j in V)
+                                    for i in V))
         
-        tours = build_path(edges, n)
+        # linear objective function
+        elif variant == "CP" and IQP is False:
+            for k in range(m):
+                model.addConstr(Pmax >=
+                                quicksum(
+                                    quicksum(C[i, j] * (x[i][j][k] + y[i][j][k]) for j in V)
+                                    for i in V))
+        
+        elif variant == "OP":
+            # (25)
+            for k in range(m):
+                model.addConstr(Pmax >=
+                                quicksum(
+                                    quicksum(C[i, j] * x[i][j][k] for j in V)
+                                    for i in V))
     
     else:
-        tours = []
+        raise ValueError("Invalid objective function!")
+
+    return variables
+
+
+def encode_routes(C, routes: list, m: int, variant: str):
+    """Values of every variable of the model for the routes (over actual
+    vertices). Dummy depots are the first m vertices of C."""
+
+    n = len(C)
+    routes = [np.asarray(route) + m for route in routes]
+    X = np.zeros((n, n, m))
+    T = np.zeros(n)
+    Y = np.zeros((n, n, m))
+    for k, route in enumerate(routes):
+        X[k, route[0], k] = 1
+        X[route[:-1], route[1:], k] = 1
+        X[route[-1], k, k] = 1
+        T[route] = np.arange(1, len(route) + 1)
+        Y[route[-1], route[0], k] = 1  # edge closing the path
+
+    return {"x": X, "t": T, "y": Y, "Pmax": route_costs(C, routes, variant).max()}
+
+
+def solve(file_instance: str, m: int, L: int, U: int, R=[], IQP=True, BestObjStop=None, MemLimit=0.01, TimeLimit=5, objective="minsum",
+          variant="CP", presolve=2, MIPGap=0.0, outputFlag=0, builder="matrix", MIPStart=False, localSearch=False,
+          polish=False, Threads=0, D=None,
+          resultCache=False, telemetryFile=None, routePool=False, lowerBound=False,
+          arcElimination=False, info=None, race=None):
+    start_time = time.perf_counter()
+    env = None
+    model = None
+    telemetry = None
+    try:
+        try:
+            telemetry = SolveTelemetry(telemetryFile, info)
+
+            if D is None:
+                with telemetry.timer("matrix"):
+                    D, I = read_TSPLIB_instance(file_instance)
+
+            # add dummy depots
+            C = DummyDepotMatrix(D, m)
+            n = len(C)
+            if U > n-m:
+                U = n-m
+
+            if L > U:
+                L = 2
+
+            # best known result of the same effective configuration
+            cache = None
+            cached = None
+            if resultCache:
+                cache = ResultCache(cache_path(file_instance))
+                key = run_key({"IP": "IP1", "m": m, "L": L, "U": U, "R": R, "IQP": IQP, "objective": objective,
+                               "variant": variant}, instance_digest(file_instance))
+                cached = cache.get(key)
+                if cached is not None and cached["gap"] == 0:
+                    # optimal, the model is not solved again
+                    telemetry.cached = True
+                    telemetry.t_inc = cached["t_inc"]
+                    telemetry.convergence = cached["convergence"]
+                    telemetry.close(objval=cached["objval"], gap=0.0, runtime=cached["runtime"], optimal=True)
+                    if race is not None:
+                        race.finish(True)
+                    return (cached["tours"], cached["objval"], cached["runtime"], 0.0, telemetry, cached["improved"],
+                            None, L, U)
+
+            # lower bound of the optimum, the solve stops once it is reached
+            if lowerBound:
+                telemetry.lower = held_karp_bound(D, m, variant, objective)
+
+            env = default_pool.acquire()
+
+            model = gp.Model(env=env)
+            model.setParam("MemLimit", MemLimit)
+            model.setParam("presolve", presolve)
+            model.Params.outputFlag = outputFlag
+            model.setParam("MIPGap", MIPGap)
+            model.setParam("TimeLimit", TimeLimit)
+            model.setParam("Threads", Threads)
+
+            if BestObjStop is not None:
+                model.setParam("BestObjStop", BestObjStop)
+
+            # arcs in no solution as good as a heuristic one
+            eliminated = None
+            if arcElimination:
+                result = reduced_cost_elimination(D, m, L, U, R if R is not None else [], variant, objective)
+                if result is not None:
+                    eliminated = result[0]
+                    telemetry.eliminated = float(eliminated.sum() / (len(D) * (len(D) - 1)))
+
+            with telemetry.timer("build"):
+                if builder == "matrix":
+                    # without the variables of the eliminated arcs
+                    variables = build_IP1_matrix(model, C, n, m, L, U, R, IQP, objective, variant, eliminated)
+                elif builder == "loop":
+                    variables = build_model(model, C, n, m, L, U, R, IQP, objective, variant)
+                    if eliminated is not None:
+                        tails, heads = np.nonzero(eliminated)
+                        for name in ["x", "y"]:
+                            if name in variables:
+                                remove_arcs(model, variables[name], tails + m, heads + m)
+                else:
+                    raise ValueError("Invalid model builder!")
+
+            if lowerBound == "LP":
+                # the LP relaxation of a linear model may be stronger
+                model.update()
+                if model.IsQP == 0:
+                    lower = lp_bound(model)
+                    if lower is not None:
+                        telemetry.lower = max(telemetry.lower, lower)
+
+            if telemetry.lower is not None and (BestObjStop is None or telemetry.lower > BestObjStop):
+                model.setParam("BestObjStop", telemetry.lower)
+
+            if MIPStart:
+                # split of a giant tour (or decomposition) over the actual vertices
+                routes = initial_routes(C.D, m, L, U, R if R is not None else [], variant, objective, MIPStart)
+                if routes is not None:
+                    set_start(model, variables, encode_routes(C, routes, m, variant))
+
+            if cached is not None and len(cached["tours"]) > 0:
+                # a previous (non-optimal) solution
+                set_start(model, variables, encode_routes(C, cached["tours"], m, variant))
+
+            # routes of an incumbent (in a MIPSOL callback) and values of the variables for some routes
+            decode = lambda model: build_path(solution_values(model, variables["x"], callback=True), m)
+            encode = lambda routes: encode_routes(C, routes, m, variant)
+
+            # local search over every new incumbent
+            polisher = None
+            if polish:
+                polisher = IncumbentPolisher(C.D, L, U, R if R is not None else [], variant, objective, variables,
+                                             decode, encode)
+
+            # incumbents shared with the other formulations of a race
+            if race is not None:
+                race.attach(variables, decode, encode)
+
+            # routes of the incumbents, recombined after the solve
+            pool = None
+            if routePool:
+                pool = RoutePool(C.D, variant, R if R is not None else [])
+
+            # attach callback for get incumbent time
+            with telemetry.timer("solve"):
+                model.optimize(lambda model, where: callback_incumbent_logger(model, where, telemetry, polisher, race,
+                                                                              pool, decode))
+
+        except gp.GurobiError as e:
+            if e.errno != 10001:
+                print('Error code ' + str() + ': ' + str(e))
+                raise RuntimeError("Error at solving procedure!")
+
+            if model is None or model.SolCount == 0:
+                # out of memory before any solution, the model may not even be built
+                runtime = time.perf_counter() - start_time
+                if race is not None:
+                    race.finish(False)
+                telemetry.close(objval=math.inf, gap=math.inf, runtime=runtime, optimal=False)
+                return [], math.inf, runtime, math.inf, telemetry, None, None, L, U
+
+        runtime = model.Runtime
+        if model.SolCount > 0:
+            fitness = model.objVal
+            gap = model.MIPGap
+        else:
+            # no incumbent within the limits
+            fitness = math.inf
+            gap = math.inf
+        if telemetry.lower is not None and model.SolCount > 0 and fitness != 0:
+            # gap to the best of the MIP bound and the lower bound
+            gap = min(gap, max(fitness - telemetry.lower, 0) / abs(fitness))
+
+        # an incumbent that reaches the lower bound (BestObjStop) is also optimal
+        optimal = model.Status == GRB.OPTIMAL or (model.SolCount > 0 and gap == 0)
+        if race is not None:
+            race.finish(optimal)
+
+        if model.SolCount > 0:
+            tours = build_path(solution_values(model, variables["x"]), m)
+
+        else:
+            tours = []
+    except BaseException as error:
+        # the stream of a failed (or interrupted) solve ends too
+        if telemetry is not None:
+            telemetry.abort(error)
+        raise
+    finally:
+        # the environment is kept for the next solves
+        if model is not None:
+            model.dispose()
+        if env is not None:
+            default_pool.release(env)
     
-    return tours, fitness, runtime, gap, t_inc
+    # post-optimization of the returned paths
+    improved = None
+    if localSearch:
+        improved = post_optimize(C.D, tours, L, U, R if R is not None else [], variant, objective)
+
+    # recombination of the routes of the incumbents
+    recombined = None
+    if pool is not None:
+        # within the time left of the run
+        remaining = max(TimeLimit - (time.perf_counter() - start_time), 0)
+        pool.add_routes(tours)
+        if improved is not None:
+            pool.add_routes(improved[0])
+        recombined = recombine(pool, len(C.D), m, L, U, objective, remaining, Threads)
+
+    if cache is not None and len(tours) > 0:
+        cache.put(key, {"tours": tours, "objval": fitness, "runtime": runtime, "gap": gap,
+                        "t_inc": telemetry.t_inc, "convergence": telemetry.convergence, "improved": improved})
 
+    telemetry.close(objval=fitness, gap=gap, runtime=runtime, optimal=optimal)
+    return tours, fitness, runtime, gap, telemetry, improved, recombined, L, U
 
-def run_IP1(conf):
 
-    global inputparams
+def run_IP1(conf, D=None, race=None):
+
     inputparams = {"IP":conf["IP"]} # register of input parameters
 
     output_file = conf["outputFile"]
@@ -350,13 +479,67 @@ def run_IP1(conf):
 
     outputFlag = conf["outputFlag"]
     inputparams["outputFlag"] = outputFlag
+
+    Threads = 0
+    if "Threads" in conf:
+        Threads = conf["Threads"]
+        inputparams["Threads"] = Threads
+
+    builder = "matrix"
+    if "builder" in conf:
+        builder = conf["builder"]
+        inputparams["builder"] = builder
+
+    MIPStart = False
+    if "MIPStart" in conf:
+        MIPStart = conf["MIPStart"]
+        inputparams["MIPStart"] = MIPStart
+
+    telemetryFile = None
+    if "telemetryFile" in conf:
+        telemetryFile = conf["telemetryFile"]
+        inputparams["telemetryFile"] = telemetryFile
+
+    resultCache = False
+    if "resultCache" in conf:
+        resultCache = conf["resultCache"]
+        inputparams["resultCache"] = resultCache
+
+    polish = False
+    if "polish" in conf:
+        polish = conf["polish"]
+        inputparams["polish"] = polish
     
-    tours, fitness, runtime, gap, t_inc = solve(file_instance=file_instance, m=m, L=L, U=U, R=R, IQP=IQP,
-                                                BestObjStop=BestObjStop, MemLimit=MemLimit,
-                                                TimeLimit=TimeLimit, objective=objective, variant=variant,
-                                                presolve=presolve, MIPGap=MIPGap, outputFlag=outputFlag)
+    lowerBound = False
+    if "lowerBound" in conf:
+        lowerBound = conf["lowerBound"]
+        inputparams["lowerBound"] = lowerBound
+
+    arcElimination = False
+    if "arcElimination" in conf:
+        arcElimination = conf["arcElimination"]
+        inputparams["arcElimination"] = arcElimination
+
+    routePool = False
+    if "routePool" in conf:
+        routePool = conf["routePool"]
+        inputparams["routePool"] = routePool
+
+    localSearch = False
+    if "localSearch" in conf:
+        localSearch = conf["localSearch"]
+        inputparams["localSearch"] = localSearch
+
+    tours, fitness, runtime, gap, telemetry, improved, recombined, L, U = solve(
+        file_instance=file_instance, m=m, L=L, U=U, R=R, IQP=IQP, BestObjStop=BestObjStop, MemLimit=MemLimit,
+        TimeLimit=TimeLimit, objective=objective, variant=variant, presolve=presolve, MIPGap=MIPGap,
+        outputFlag=outputFlag, builder=builder, MIPStart=MIPStart, localSearch=localSearch, polish=polish,
+        Threads=Threads, D=D, resultCache=resultCache, telemetryFile=telemetryFile, routePool=routePool,
+        lowerBound=lowerBound, arcElimination=arcElimination, info=dict(inputparams), race=race)
+    inputparams["L"] = L
+    inputparams["U"] = U
     
-    with open(output_file, "a") as writer:
+    with open(output_file + ".tmp", "w") as writer:
         ignored = conf.copy()
 
         output_dict = {}
@@ -383,14 +566,28 @@ def run_IP1(conf):
         OUTPUT_dict["objval"] = str(fitness)
         OUTPUT_dict["runtime"] = runtime
         OUTPUT_dict["gap"] = str(gap)
-        OUTPUT_dict["timeinc"] = str(t_inc)
+        if telemetry.lower is not None:
+            OUTPUT_dict["lowerbound"] = str(telemetry.lower)
+        if telemetry.eliminated is not None:
+            OUTPUT_dict["eliminated"] = telemetry.eliminated
+        OUTPUT_dict["timeinc"] = str(telemetry.t_inc)
         OUTPUT_dict["paths"] = tours
-        OUTPUT_dict["convergence"] = convergence
+        if improved is not None:
+            OUTPUT_dict["improvedobjval"] = str(improved[1])
+            OUTPUT_dict["improvedpaths"] = improved[0]
+        if recombined is not None:
+            OUTPUT_dict["recombinedobjval"] = str(recombined[1])
+            OUTPUT_dict["recombinedpaths"] = recombined[0]
+        OUTPUT_dict["convergence"] = telemetry.convergence
+        OUTPUT_dict["times"] = telemetry.times
+        if telemetry.cached:
+            OUTPUT_dict["cached"] = True
 
         output_dict["OUTPUT"] = OUTPUT_dict
 
         import json
         writer.write(json.dumps(output_dict))
+    os.replace(output_file + ".tmp", output_file)
 
     print("output printed in {}".format(output_file))
     
\ No newline at end of file
@@ -3,242 +3,524 @@
 
 import math
 import os
+import time
 from pathlib import Path
 
 import gurobipy as gp
+import numpy as np
+import scipy.sparse as sp
 from gurobipy import GRB, quicksum
 
-from TSPLIBReader import read_TSPLIB_instance
+from Decomposition import initial_routes
+from EnvironmentPool import default_pool
+from LocalSearch import IncumbentPolisher, post_optimize
+from LowerBound import held_karp_bound, lp_bound, reduced_cost_elimination
+from ModelBuilder import ColumnLayout, add_rows, remove_arcs
+from Routes import set_start, solution_values
+from ResultStore import ResultCache, cache_path, run_key
+from RoutePool import RoutePool, recombine
+from TSPLIBReader import DummyDepotMatrix, instance_digest, read_TSPLIB_instance
+from Telemetry import SolveTelemetry
 
 
-convergence = []
-def callback_incumbent_logger(model, where):
-    if where == GRB.Callback.MIPSOL:
+def callback_incumbent_logger(model, where, telemetry, polisher=None, race=None, pool=None, decode=None):
+    telemetry.callback(model, where)
 
-        this_objval = model.cbGet(GRB.Callback.MIPSOL_OBJ)
-        this_time = model.cbGet(GRB.Callback.RUNTIME)
+    if where == GRB.Callback.MIPSOL and pool is not None:
+        pool.add_routes(decode(model))
 
-        global t_inc, objval
-        if objval != this_objval:
-            objval = this_objval
-            t_inc = this_time
-            convergence.append([this_time, this_objval])
+    if where == GRB.Callback.MIPSOL and polisher is not None:
+        polisher.polish(model)
 
+    if race is not None:
+        race.callback(model, where)
 
-def build_path(n_prime: int, t: list, D: list):
-    single_tour = [0] * n_prime
-    for i in range(0, n_prime):
-        single_tour[int(t[i].X + 0.5)] = i  # round ti to the nearest integer
 
-    # remove first dummy depot in path
-    del single_tour[0]
-    del D[0]
-    tours = []
-    dummy_depot = D[0]
-    del D[0]
+def build_path(T, n: int):
+    """Paths from the values T of t, splitting the single tour at the dummy depots (indices n, ..., n'-1)."""
+    single_tour = np.argsort(np.rint(T), kind="stable")  # round ti to the nearest integer
+    tours = np.split(single_tour, np.flatnonzero(single_tour >= n))
 
-    tour = []
-    for v in single_tour:
-        if v != dummy_depot:
-            tour.append(v)
-        else:
-            if len(D) > 0:
-                dummy_depot = D[0]
-                del D[0]
-            tours.append(tour)
-            tour = []
-
-    tours.append(tour)
-    return tours
-
-
-def solve(file_instance: str, m: int, L: int, U: int, R=[], IQP=True, BestObjStop=None, MemLimit=0.01, TimeLimit=5, objective="minsum",
-          variant="CP", presolve=2, MIPGap=0.0, outputFlag=0):
-    try:
-        global t_inc, objval
-        t_inc = math.inf
-        objval = math.inf
-
-        C, I = read_TSPLIB_instance(file_instance)
-        n = len(C)
-        if U > n:
-            U = n
-            inputparams["U"] = U
-
-        if L > U:
-            L = 2
-            inputparams["L"] = L
-
-        # Add m dummy depots
-        for i in range(m):
-            [x.append(0) for x in C]
-        for i in range(m):
-            C.append([0] * (n + m))
-        n_prime = len(C)
-
-        env = gp.Env(empty=True)
-        env.setParam("MemLimit", MemLimit)
-        env.start()
-
-        model = gp.Model(env=env)
-        model.setParam("presolve", presolve)
-        model.Params.outputFlag = outputFlag
-        model.setParam("MIPGap", MIPGap)
-        model.setParam("TimeLimit", TimeLimit)
-        
-        if BestObjStop is not None:
-            model.setParam("BestObjStop", BestObjStop)
-
-        # add variables
-        x = []
-        for i in range(n_prime):
-            x.append([0] * n_prime)
-            for j in range(n_prime):
-                x[i][j] = model.addVar(
-                    vtype=GRB.BINARY, name="x{},{}".format(i, j))
+    # the single tour starts at the first dummy depot
+    return [tour[1:].tolist() for tour in tours[1:]]
 
-        t = []
-        for i in range(n_prime):
-            t.append(model.addVar(vtype=GRB.CONTINUOUS, name="t{}".format(i)))
-            if i != n:
-                # constraints (33)
-                model.addConstr(1 <= t[i])
-                model.addConstr(t[i] <= n_prime - 1)
-            else:
-                # first dummy depot must be the first vertex to be visited
-                # constraint (30)
-                model.addConstr(t[n] == 0)
 
-        if variant == "CP" and IQP is False:
-            y = []
-            for i in range(n_prime):
-                y.append([0] * n_prime)
-                for j in range(n_prime):
-                    y[i][j] = model.addVar(
-                        vtype=GRB.BINARY, name="y{},{}".format(i, j))
-
-        # FLOW CONSTRAINTS
-        # (28)
-        for i in range(n_prime):
-            model.addConstr(quicksum(x[i][j]
-                            for j in range(n_prime) if i != j) == 1)
-        # (29)
+def build_model(model, C, n: int, n_prime: int, L: int, U: int, R: list, IQP: bool, objective: str, variant: str):
+    # add variables
+    x = []
+    for i in range(n_prime):
+        x.append([0] * n_prime)
         for j in range(n_prime):
-            model.addConstr(quicksum(x[i][j]
-                            for i in range(n_prime) if i != j) == 1)
+            x[i][j] = model.addVar(
+                vtype=GRB.BINARY, name="x{},{}".format(i, j))
+
+    t = []
+    for i in range(n_prime):
+        t.append(model.addVar(vtype=GRB.CONTINUOUS, name="t{}".format(i)))
+        if i != n:
+            # constraints (33)
+            model.addConstr(1 <= t[i])
+            model.addConstr(t[i] <= n_prime - 1)
+        else:
+            # first dummy depot must be the first vertex to be visited
+            # constraint (30)
+            model.addConstr(t[n] == 0)
+    variables = {"x": x, "t": t}
 
-        # SEC MTZ
-        # (34)
+    if variant == "CP" and IQP is False:
+        y = []
         for i in range(n_prime):
+            y.append([0] * n_prime)
             for j in range(n_prime):
-                if i != n and j != n:
-                    model.addConstr(t[i] - t[j] + x[i][j] *
-                                    n_prime <= n_prime - 1)
-
-        # BOUNDING CONSTRAINTS
-        if 2 <= L <= U < n:
-            for k in range(n, n_prime - 1):
-                model.addConstr(t[k + 1] - t[k] <= U + 1)  # (38)
-                model.addConstr(t[k + 1] - t[k] >= L + 1)  # (39)
-
-            # last dummy depot
-            model.addConstr(n_prime - t[n_prime - 1] <= U + 1)  # (40)
-            model.addConstr(n_prime - t[n_prime - 1] >= L + 1)  # (41)
-
-        else:
-            # DEPOT ORDERING CONSTRAINTS
-            for k in range(n, n_prime - 1):
-                model.addConstr(t[k + 1] - t[k] >= 3)  # (31)
+                y[i][j] = model.addVar(
+                    vtype=GRB.BINARY, name="y{},{}".format(i, j))
+        variables["y"] = y
+
+    # FLOW CONSTRAINTS
+    # (28)
+    for i in range(n_prime):
+        model.addConstr(quicksum(x[i][j]
+                        for j in range(n_prime) if i != j) == 1)
+    # (29)
+    for j in range(n_prime):
+        model.addConstr(quicksum(x[i][j]
+                        for i in range(n_prime) if i != j) == 1)
+
+    # SEC MTZ
+    # (34)
+    for i in range(n_prime):
+        for j in range(n_prime):
+            if i != n and j != n:
+                model.addConstr(t[i] - t[j] + x[i][j] *
+                                n_prime <= n_prime - 1)
 
-            model.addConstr(n_prime - t[n_prime - 1] >= 3)  # (32)
+    # BOUNDING CONSTRAINTS
+    if 2 <= L <= U < n:
+        for k in range(n, n_prime - 1):
+            model.addConstr(t[k + 1] - t[k] <= U + 1)  # (38)
+            model.addConstr(t[k + 1] - t[k] >= L + 1)  # (39)
 
-        # # avoid two dummy depots to be connected
-        # for i in range(n, n_prime - 1):
-        #     model.addConstr(x[i][i+1] == 0)
-        # model.addConstr(x[n_prime - 1][n] == 0)
+        # last dummy depot
+        model.addConstr(n_prime - t[n_prime - 1] <= U + 1)  # (40)
+        model.addConstr(n_prime - t[n_prime - 1] >= L + 1)  # (41)
 
-        # # avoid a vertex i to be connected with two dummy depots
-        # for i in range(n):
-        #     for k in range(n, n_prime-1):
-        #         model.addConstr(x[k][i]+x[i][k+1] <= 1)
-        #     model.addConstr(x[n_prime - 1][i]+x[i][n] <= 1)
+    else:
+        # DEPOT ORDERING CONSTRAINTS
+        for k in range(n, n_prime - 1):
+            model.addConstr(t[k + 1] - t[k] >= 3)  # (31)
+
+        model.addConstr(n_prime - t[n_prime - 1] >= 3)  # (32)
+
+    # # avoid two dummy depots to be connected
+    # for i in range(n, n_prime - 1):
+    #     model.addConstr(x[i][i+1] == 0)
+    # model.addConstr(x[n_prime - 1][n] == 0)
+
+    # # avoid a vertex i to be connected with two dummy depots
+    # for i in range(n):
+    #     for k in range(n, n_prime-1):
+    #         model.addConstr(x[k][i]+x[i][k+1] <= 1)
+    #     model.addConstr(x[n_prime - 1][i]+x[i][n] <= 1)
+
+    # EDGES CLOSING PATHS (for linear objective function and closed paths)
+    if variant == "CP" and IQP is False:
+        for i in range(n):
+            for j in range(n):
+
+                # (45)
+                for k in range(n, n_prime - 1):
+                    model.addConstr(y[i][j] >= x[k][j] + x[i][k + 1] - 1)
+
+                # (46)
+                model.addConstr(y[i][j] >= x[n_prime - 1][j] + x[i][n] - 1)
+
+                # to avoid possible negative cost edges issues
+                model.addConstr(y[i][j] <= quicksum(x[i][k]
+                                for k in range(n, n_prime)))  # (47)
+                model.addConstr(y[i][j] <= quicksum(x[k][j]
+                                for k in range(n, n_prime)))  # (48)
+
+    if len(R) > 0:
+        # FD-M+DL
+        for i in R:
+            # (51)
+            model.addConstr(quicksum(x[k][i]
+                            for k in range(n, n_prime)) == 1)
+
+    if objective == "minsum" and (variant == "CP" or variant == "OP"):
 
-        # EDGES CLOSING PATHS (for linear objective function and closed paths)
         if variant == "CP" and IQP is False:
-            for i in range(n):
-                for j in range(n):
-
-                    # (45)
-                    for k in range(n, n_prime - 1):
-                        model.addConstr(y[i][j] >= x[k][j] + x[i][k + 1] - 1)
-
-                    # (46)
-                    model.addConstr(y[i][j] >= x[n_prime - 1][j] + x[i][n] - 1)
-
-                    # to avoid possible negative cost edges issues
-                    model.addConstr(y[i][j] <= quicksum(x[i][k]
-                                    for k in range(n, n_prime)))  # (47)
-                    model.addConstr(y[i][j] <= quicksum(x[k][j]
-                                    for k in range(n, n_prime)))  # (48)
-
-        if len(R) > 0:
-            # FD-M+DL
-            for i in R:
-                # (51)
-                model.addConstr(quicksum(x[k][i]
-                                for k in range(n, n_prime)) == 1)
-
-        if objective == "minsum" and (variant == "CP" or variant == "OP"):
-
-            if variant == "CP" and IQP is False:
-                # linear objective function
-                # (44)
-                model.setObjective(
-                    quicksum(quicksum(C[i][j] * (x[i][j] + y[i][j])
-                             for j in range(n_prime)) for i in range(n_prime))
-                )
-            elif variant == "CP" and IQP is True:
-                # quadratic objective function
-                # (27)
-                model.setObjective(
+            # linear objective function
+            # (44)
+            model.setObjective(
+                quicksum(quicksum(C[i, j] * (x[i][j] + y[i][j])
+                         for j in range(n_prime)) for i in range(n_prime))
+            )
+        elif variant == "CP" and IQP is True:
+            # quadratic objective function
+            # (27)
+            model.setObjective(
+                quicksum(
                     quicksum(
-                        quicksum(
-                            C[i][j] * (x[i][j] + x[n_prime - 1][j] * x[i][n] +
-                                       quicksum(x[k][j] * x[i][k + 1] for k in range(n, n_prime - 1)))
-                            for j in range(n_prime))
-                        for i in range(n_prime))
-                )
-            elif variant == "OP":
-                # (50)
-                model.setObjective(
-                    quicksum(quicksum(C[i][j] * x[i][j]
-                             for j in range(n_prime)) for i in range(n_prime))
-                )
-        else:
-            raise ValueError("Invalid objective function or variant!")
-
-        # attach callback for get incumbent time
-        model.optimize(callback_incumbent_logger)
-
-    except gp.GurobiError as e:
-        if e.errno != 10001:
-            print('Error code ' + str() + ': ' + str(e))
-            raise RuntimeError("Error at solving procedure!")
-
-    runtime = model.Runtime
-    fitness = model.objVal
-    gap = model.MIPGap
+                        C[i, j] * (x[i][j] + x[n_prime - 1][j] * x[i][n] +
+                                   quicksum(x[k][j] * x[i][k + 1] for k in range(n, n_prime - 1)))
+                        for j in range(n_prime))
+                    for i in range(n_prime))
+            )
+        elif variant == "OP":
+            # (50)
+            model.setObjective(
+                quicksum(quicksum(C[i, j] * x[i][j]
+                         for j in range(n_prime)) for i in range(n_prime))
+            )
+    else:
+        raise ValueError("Invalid objective function or variant!")
+
+    return variables
+
+
+def build_model_matrix(model, C, n: int, n_prime: int, L: int, U: int, R: list, IQP: bool, objective: str,
+                       variant: str, eliminated=None):
+    """Same model as build_model, built with the matrix API: a single
+    unnamed MVar z = (x, t, y) and one sparse coefficient matrix per family
+    of constraints. The arcs (i, j) between actual vertices where
+    eliminated[i][j] (a boolean matrix) is True get no x and y variables,
+    nor the rows only bounding them. Returns views of z with the shapes of
+    x, t and y."""
+
+    if not (objective == "minsum" and (variant == "CP" or variant == "OP")):
+        raise ValueError("Invalid objective function or variant!")
+
+    linear_CP = variant == "CP" and IQP is False
+
+    mask = np.ones((n_prime, n_prime), dtype=bool)
+    if eliminated is not None:
+        mask[:n, :n][np.asarray(eliminated, dtype=bool)] = False
+
+    # columns of the variables in z
+    layout = ColumnLayout()
+    X = layout.add("x", (n_prime, n_prime), GRB.BINARY, mask)
+    T = layout.add("t", (n_prime,), GRB.CONTINUOUS)
+    if linear_CP:
+        Y = layout.add("y", (n_prime, n_prime), GRB.BINARY, mask)
+    z = layout.create(model)
+
+    not_first = np.array([i for i in range(n_prime) if i != n])
+    depots = np.arange(n, n_prime)
+    actual = np.arange(n)
+    off_diagonal = ~np.eye(n_prime, dtype=bool)
+
+    # (33)
+    add_rows(model, z, T[not_first, None], 1, GRB.GREATER_EQUAL, 1)
+    add_rows(model, z, T[not_first, None], 1, GRB.LESS_EQUAL, n_prime - 1)
+    # (30)
+    add_rows(model, z, T[[n], None], 1, GRB.EQUAL, 0)
+
+    # FLOW CONSTRAINTS
+    # (28)
+    add_rows(model, z, X[off_diagonal].reshape(n_prime, n_prime - 1), 1, GRB.EQUAL, 1)
+    # (29)
+    add_rows(model, z, X.T[off_diagonal].reshape(n_prime, n_prime - 1), 1, GRB.EQUAL, 1)
+
+    # SEC MTZ
+    # (34), implied by the bounds of t without the arc (i, j)
+    I, J = np.meshgrid(not_first, not_first, indexing="ij")
+    I, J = I.ravel(), J.ravel()
+    I, J = I[mask[I, J]], J[mask[I, J]]
+    add_rows(model, z, np.stack([T[I], T[J], X[I, J]], axis=1), [1, -1, n_prime], GRB.LESS_EQUAL, n_prime - 1)
+
+    # BOUNDING CONSTRAINTS
+    consecutive = np.stack([T[n + 1:], T[n:-1]], axis=1)
+    if 2 <= L <= U < n:
+        add_rows(model, z, consecutive, [1, -1], GRB.LESS_EQUAL, U + 1)  # (38)
+        add_rows(model, z, consecutive, [1, -1], GRB.GREATER_EQUAL, L + 1)  # (39)
+
+        # last dummy depot
+        add_rows(model, z, T[[n_prime - 1], None], -1, GRB.LESS_EQUAL, U + 1 - n_prime)  # (40)
+        add_rows(model, z, T[[n_prime - 1], None], -1, GRB.GREATER_EQUAL, L + 1 - n_prime)  # (41)
 
-    if model.SolCount > 0:
-        tours = build_path(n_prime, t, [d for d in range(n, n_prime)])
     else:
-        tours = []
-    return tours, fitness, runtime, gap, t_inc
+        # DEPOT ORDERING CONSTRAINTS
+        add_rows(model, z, consecutive, [1, -1], GRB.GREATER_EQUAL, 3)  # (31)
+        add_rows(model, z, T[[n_prime - 1], None], -1, GRB.GREATER_EQUAL, 3 - n_prime)  # (32)
+
+    # EDGES CLOSING PATHS (for linear objective function and closed paths)
+    if linear_CP:
+        I, J = np.meshgrid(actual, actual, indexing="ij")
+        I, J = I.ravel(), J.ravel()
+
+        # (45)
+        for k in range(n, n_prime - 1):
+            add_rows(model, z, np.stack([Y[I, J], X[k, J], X[I, k + 1]], axis=1), [1, -1, -1],
+                     GRB.GREATER_EQUAL, -1)
+
+        # (46)
+        add_rows(model, z, np.stack([Y[I, J], X[n_prime - 1, J], X[I, n]], axis=1), [1, -1, -1],
+                 GRB.GREATER_EQUAL, -1)
+
+        # to avoid possible negative cost edges issues
+        I, J = I[mask[I, J]], J[mask[I, J]]
+        ones = np.ones(len(depots))
+        add_rows(model, z, np.column_stack([Y[I, J], X[I[:, None], depots[None, :]]]),
+                 np.concatenate([[1], -ones]), GRB.LESS_EQUAL, 0)  # (47)
+        add_rows(model, z, np.column_stack([Y[I, J], X[depots[None, :], J[:, None]]]),
+                 np.concatenate([[1], -ones]), GRB.LESS_EQUAL, 0)  # (48)
+
+    if len(R) > 0:
+        # FD-M+DL
+        # (51)
+        add_rows(model, z, X[depots[None, :], np.asarray(R)[:, None]], 1, GRB.EQUAL, 1)
+
+    # objective function
+    D = C.dense().astype(np.float64)
+    c = np.zeros(z.shape[0])
+    c[X[mask]] = D[mask]
+    Q = None
+
+    if linear_CP:
+        # (44)
+        c[Y[mask]] = D[mask]
+    elif variant == "CP" and IQP is True:
+        # (27), terms C[i, j] * x[n_prime - 1][j] * x[i][n] and
+        # C[i, j] * x[k][j] * x[i][k + 1] for every dummy depot k but the last
+        I, J = np.nonzero(D)
+        rows = [X[I, n]] + [X[I, k + 1] for k in range(n, n_prime - 1)]
+        cols = [X[n_prime - 1, J]] + [X[k, J] for k in range(n, n_prime - 1)]
+        Q = sp.csr_matrix((np.tile(D[I, J], len(rows)), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(z.shape[0], z.shape[0]))
+
+    model.setMObjective(Q, c, 0.0, sense=GRB.MINIMIZE)
+
+    variables = {"x": layout.view(z, X), "t": layout.view(z, T)}
+    if linear_CP:
+        variables["y"] = layout.view(z, Y)
+    return variables
+
+
+def encode_routes(n: int, routes: list):
+    """Values of every variable of the model for the routes (over actual
+    vertices). Route k follows the dummy depot n+k in the single tour."""
+
+    n_prime = n + len(routes)
+    single_tour = np.concatenate([np.concatenate([[n + k], route]) for k, route in enumerate(routes)]).astype(np.int64)
+    X = np.zeros((n_prime, n_prime))
+    X[single_tour, np.roll(single_tour, -1)] = 1
+    T = np.zeros(n_prime)
+    T[single_tour] = np.arange(n_prime)
+    Y = np.zeros((n_prime, n_prime))
+    for route in routes:
+        Y[route[-1], route[0]] = 1  # edge closing the path
+
+    return {"x": X, "t": T, "y": Y}
 
 
-def run_IP2(conf):
+def solve(file_instance: str, m: int, L: int, U: int, R=[], IQP=True, BestObjStop=None, MemLimit=0.01, TimeLimit=5, objective="minsum",
+          variant="CP", presolve=2, MIPGap=0.0, outputFlag=0, builder="matrix", MIPStart=False, localSearch=False,
+          polish=False, Threads=0, D=None,
+          resultCache=False, telemetryFile=None, routePool=False, lowerBound=False,
+          arcElimination=False, info=None, race=None):
+    start_time = time.perf_counter()
+    env = None
+    model = None
+    telemetry = None
+    try:
+        try:
+            telemetry = SolveTelemetry(telemetryFile, info)
+
+            if D is None:
+                with telemetry.timer("matrix"):
+                    D, I = read_TSPLIB_instance(file_instance)
+            n = len(D)
+            if U > n:
+                U = n
+
+            if L > U:
+                L = 2
+
+            # best known result of the same effective configuration
+            cache = None
+            cached = None
+            if resultCache:
+                cache = ResultCache(cache_path(file_instance))
+                key = run_key({"IP": "IP2", "m": m, "L": L, "U": U, "R": R, "IQP": IQP, "objective": objective,
+                               "variant": variant}, instance_digest(file_instance))
+                cached = cache.get(key)
+                if cached is not None and cached["gap"] == 0:
+                    # optimal, the model is not solved again
+                    telemetry.cached = True
+                    telemetry.t_inc = cached["t_inc"]
+                    telemetry.convergence = cached["convergence"]
+                    telemetry.close(objval=cached["objval"], gap=0.0, runtime=cached["runtime"], optimal=True)
+                    if race is not None:
+                        race.finish(True)
+                    return (cached["tours"], cached["objval"], cached["runtime"], 0.0, telemetry, cached["improved"],
+                            None, L, U)
+
+            # Add m dummy depots
+            C = DummyDepotMatrix(D, m, first=False)
+            n_prime = len(C)
+
+            # lower bound of the optimum, the solve stops once it is reached
+            if lowerBound:
+                telemetry.lower = held_karp_bound(D, m, variant, objective)
+
+            env = default_pool.acquire()
+
+            model = gp.Model(env=env)
+            model.setParam("MemLimit", MemLimit)
+            model.setParam("presolve", presolve)
+            model.Params.outputFlag = outputFlag
+            model.setParam("MIPGap", MIPGap)
+            model.setParam("TimeLimit", TimeLimit)
+            model.setParam("Threads", Threads)
+
+            if BestObjStop is not None:
+                model.setParam("BestObjStop", BestObjStop)
+
+            # the lengths of the paths are only bounded by (38)-(41)
+            if 2 <= L <= U < n:
+                L_path, U_path = L, U
+            else:
+                L_path, U_path = 2, n
+
+            # arcs in no solution as good as a heuristic one
+            eliminated = None
+            if arcElimination:
+                result = reduced_cost_elimination(D, m, L_path, U_path, R, variant, objective)
+                if result is not None:
+                    eliminated = result[0]
+                    telemetry.eliminated = float(eliminated.sum() / (len(D) * (len(D) - 1)))
+
+            with telemetry.timer("build"):
+                if builder == "matrix":
+                    # without the variables of the eliminated arcs
+                    variables = build_model_matrix(model, C, n, n_prime, L, U, R, IQP, objective, variant,
+                                                   eliminated)
+                elif builder == "loop":
+                    variables = build_model(model, C, n, n_prime, L, U, R, IQP, objective, variant)
+                    if eliminated is not None:
+                        tails, heads = np.nonzero(eliminated)
+                        for name in ["x", "y"]:
+                            if name in variables:
+                                remove_arcs(model, variables[name], tails, heads)
+                else:
+                    raise ValueError("Invalid model builder!")
+
+            if lowerBound == "LP":
+                # the LP relaxation of a linear model may be stronger
+                model.update()
+                if model.IsQP == 0:
+                    lower = lp_bound(model)
+                    if lower is not None:
+                        telemetry.lower = max(telemetry.lower, lower)
+
+            if telemetry.lower is not None and (BestObjStop is None or telemetry.lower > BestObjStop):
+                model.setParam("BestObjStop", telemetry.lower)
+
+            if MIPStart:
+                # split of a giant tour (or decomposition)
+                routes = initial_routes(C.D, m, L_path, U_path, R, variant, objective, MIPStart)
+                if routes is not None:
+                    set_start(model, variables, encode_routes(n, routes))
+
+            if cached is not None and len(cached["tours"]) > 0:
+                # a previous (non-optimal) solution
+                set_start(model, variables, encode_routes(n, cached["tours"]))
+
+            # routes of an incumbent (in a MIPSOL callback) and values of the variables for some routes
+            decode = lambda model: build_path(solution_values(model, variables["t"], callback=True), n)
+            encode = lambda routes: encode_routes(n, routes)
+
+            # local search over every new incumbent
+            polisher = None
+            if polish:
+                polisher = IncumbentPolisher(C.D, L_path, U_path, R, variant, objective, variables, decode, encode)
+
+            # incumbents shared with the other formulations of a race
+            if race is not None:
+                race.attach(variables, decode, encode)
+
+            # routes of the incumbents, recombined after the solve
+            pool = None
+            if routePool:
+                pool = RoutePool(C.D, variant, R)
+
+            # attach callback for get incumbent time
+            with telemetry.timer("solve"):
+                model.optimize(lambda model, where: callback_incumbent_logger(model, where, telemetry, polisher, race,
+                                                                              pool, decode))
+
+        except gp.GurobiError as e:
+            if e.errno != 10001:
+                print('Error code ' + str() + ': ' + str(e))
+                raise RuntimeError("Error at solving procedure!")
+
+            if model is None or model.SolCount == 0:
+                # out of memory before any solution, the model may not even be built
+                runtime = time.perf_counter() - start_time
+                if race is not None:
+                    race.finish(False)
+                telemetry.close(objval=math.inf, gap=math.inf, runtime=runtime, optimal=False)
+                return [], math.inf, runtime, math.inf, telemetry, None, None, L, U
+
+        runtime = model.Runtime
+        if model.SolCount > 0:
+            fitness = model.objVal
+            gap = model.MIPGap
+        else:
+            # no incumbent within the limits
+            fitness = math.inf
+            gap = math.inf
+        if telemetry.lower is not None and model.SolCount > 0 and fitness != 0:
+            # gap to the best of the MIP bound and the lower bound
+            gap = min(gap, max(fitness - telemetry.lower, 0) / abs(fitness))
+
+        # an incumbent that reaches the lower bound (BestObjStop) is also optimal
+        optimal = model.Status == GRB.OPTIMAL or (model.SolCount > 0 and gap == 0)
+        if race is not None:
+            race.finish(optimal)
+
+        if model.SolCount > 0:
+            tours = build_path(solution_values(model, variables["t"]), n)
+        else:
+            tours = []
+    except BaseException as error:
+        # the stream of a failed (or interrupted) solve ends too
+        if telemetry is not None:
+            telemetry.abort(error)
+        raise
+    finally:
+        # the environment is kept for the next solves
+        if model is not None:
+            model.dispose()
+        if env is not None:
+            default_pool.release(env)
+
+    # post-optimization of the returned paths
+    improved = None
+    if localSearch:
+        improved = post_optimize(C.D, tours, L_path, U_path, R, variant, objective)
+
+    # recombination of the routes of the incumbents
+    recombined = None
+    if pool is not None:
+        # within the time left of the run
+        remaining = max(TimeLimit - (time.perf_counter() - start_time), 0)
+        pool.add_routes(tours)
+        if improved is not None:
+            pool.add_routes(improved[0])
+        recombined = recombine(pool, n, m, L_path, U_path, objective, remaining, Threads)
+
+    if cache is not None and len(tours) > 0:
+        cache.put(key, {"tours": tours, "objval": fitness, "runtime": runtime, "gap": gap,
+                        "t_inc": telemetry.t_inc, "convergence": telemetry.convergence, "improved": improved})
+
+    telemetry.close(objval=fitness, gap=gap, runtime=runtime, optimal=optimal)
+    return tours, fitness, runtime, gap, telemetry, improved, recombined, L, U
+
+
+def run_IP2(conf, D=None, race=None):
 
-    global inputparams
     inputparams = {"IP": conf["IP"]}  # register of input parameters
 
     output_file = conf["outputFile"]
@@ -292,11 +574,65 @@ def run_IP2(conf):
     outputFlag = conf["outputFlag"]
     inputparams["outputFlag"] = outputFlag
 
-    tours, fitness, runtime, gap, t_inc = solve(file_instance=file_instance, m=m, L=L, U=U, R=R, IQP=IQP,
-                                                BestObjStop=BestObjStop, MemLimit=MemLimit,
-                                                TimeLimit=TimeLimit, objective=objective, variant=variant,
-                                                presolve=presolve, MIPGap=MIPGap, outputFlag=outputFlag)
-    with open(output_file, "a") as writer:
+    Threads = 0
+    if "Threads" in conf:
+        Threads = conf["Threads"]
+        inputparams["Threads"] = Threads
+
+    builder = "matrix"
+    if "builder" in conf:
+        builder = conf["builder"]
+        inputparams["builder"] = builder
+
+    MIPStart = False
+    if "MIPStart" in conf:
+        MIPStart = conf["MIPStart"]
+        inputparams["MIPStart"] = MIPStart
+
+    telemetryFile = None
+    if "telemetryFile" in conf:
+        telemetryFile = conf["telemetryFile"]
+        inputparams["telemetryFile"] = telemetryFile
+
+    resultCache = False
+    if "resultCache" in conf:
+        resultCache = conf["resultCache"]
+        inputparams["resultCache"] = resultCache
+
+    polish = False
+    if "polish" in conf:
+        polish = conf["polish"]
+        inputparams["polish"] = polish
+
+    lowerBound = False
+    if "lowerBound" in conf:
+        lowerBound = conf["lowerBound"]
+        inputparams["lowerBound"] = lowerBound
+
+    arcElimination = False
+    if "arcElimination" in conf:
+        arcElimination = conf["arcElimination"]
+        inputparams["arcElimination"] = arcElimination
+
+    routePool = False
+    if "routePool" in conf:
+        routePool = conf["routePool"]
+        inputparams["routePool"] = routePool
+
+    localSearch = False
+    if "localSearch" in conf:
+        localSearch = conf["localSearch"]
+        inputparams["localSearch"] = localSearch
+
+    tours, fitness, runtime, gap, telemetry, improved, recombined, L, U = solve(
+        file_instance=file_instance, m=m, L=L, U=U, R=R, IQP=IQP, BestObjStop=BestObjStop, MemLimit=MemLimit,
+        TimeLimit=TimeLimit, objective=objective, variant=variant, presolve=presolve, MIPGap=MIPGap,
+        outputFlag=outputFlag, builder=builder, MIPStart=MIPStart, localSearch=localSearch, polish=polish,
+        Threads=Threads, D=D, resultCache=resultCache, telemetryFile=telemetryFile, routePool=routePool,
+        lowerBound=lowerBound, arcElimination=arcElimination, info=dict(inputparams), race=race)
+    inputparams["L"] = L
+    inputparams["U"] = U
+    with open(output_file + ".tmp", "w") as writer:
         ignored = conf.copy()
 
         output_dict = {}
@@ -323,13 +659,27 @@ def run_IP2(conf):
         OUTPUT_dict["objval"] = str(fitness)
         OUTPUT_dict["runtime"] = runtime
         OUTPUT_dict["gap"] = str(gap)
-        OUTPUT_dict["timeinc"] = str(t_inc)
+        if telemetry.lower is not None:
+            OUTPUT_dict["lowerbound"] = str(telemetry.lower)
+        if telemetry.eliminated is not None:
+            OUTPUT_dict["eliminated"] = telemetry.eliminated
+        OUTPUT_dict["timeinc"] = str(telemetry.t_inc)
         OUTPUT_dict["paths"] = tours
-        OUTPUT_dict["convergence"] = convergence
+        if improved is not None:
+            OUTPUT_dict["improvedobjval"] = str(improved[1])
+            OUTPUT_dict["improvedpaths"] = improved[0]
+        if recombined is not None:
+            OUTPUT_dict["recombinedobjval"] = str(recombined[1])
+            OUTPUT_dict["recombinedpaths"] = recombined[0]
+        OUTPUT_dict["convergence"] = telemetry.convergence
+        OUTPUT_dict["times"] = telemetry.times
+        if telemetry.cached:
+            OUTPUT_dict["cached"] = True
 
         output_dict["OUTPUT"] = OUTPUT_dict
 
         import json
         writer.write(json.dumps(output_dict))
+    os.replace(output_file + ".tmp", output_file)
 
     print("output printed in {}".format(output_file))
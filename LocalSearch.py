@@ -0,0 +1,359 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import math
+from collections import deque
+
+from gurobipy import GRB
+
+from HeldKarp import HeldKarp
+from Routes import objective_value, route_costs, set_solution
+
+# end of an open path, at distance 0 from every vertex
+END = -1
+
+# up to this number of vertices, distances are looked up in nested lists
+DENSE_LIMIT = 2000
+
+
+class RouteSearch(object):
+    """Local search over the routes of a solution with 2-opt and Or-opt moves
+    inside a route, and relocate, cross-exchange and 2-opt* moves between
+    routes. Moves are only tried between a vertex and its k-nearest
+    neighbors, and vertices whose surroundings did not change since their
+    last unsuccessful try are skipped (don't-look bits).
+
+    Routes keep L to U vertices and every vertex of R stays at the start of
+    its route. A move is applied if it decreases the objective (for minmax,
+    the longest route and then the sum of the routes)."""
+
+    def __init__(self, D, routes: list, L: int, U: int, R: list, variant: str, objective: str, k=10) -> None:
+        if objective != "minsum" and objective != "minmax":
+            raise ValueError("Invalid objective function!")
+
+        self.D = D
+        self.rows = D.tolist() if len(D) <= DENSE_LIMIT else None
+        self.L = L
+        self.U = U
+        self.closed = variant == "CP"
+        self.minmax = objective == "minmax"
+        self.candidates = D.neighbors(k).tolist()
+        self.pinned = set(R)
+
+        self.routes = []
+        for route in routes:
+            route = [int(v) for v in route]
+            start = [p for p, v in enumerate(route) if v in self.pinned]
+            if self.closed and len(start) > 0:
+                # a closed path can start at any of its vertices
+                route = route[start[0]:] + route[:start[0]]
+            self.routes.append(route)
+
+        self.route_of = [END] * len(D)
+        self.position = [END] * len(D)
+        self.prefix = [None] * len(self.routes)
+        self.cost = [0] * len(self.routes)
+        for r in range(len(self.routes)):
+            self.update(r)
+
+    def c(self, a, b):
+        if a == END or b == END:
+            return 0
+        if self.rows is not None:
+            return self.rows[a][b]
+        return self.D.d(a, b)
+
+    def update(self, r):
+        route = self.routes[r]
+        prefix = [0] * len(route)
+        for p in range(len(route)):
+            self.route_of[route[p]] = r
+            self.position[route[p]] = p
+            if p > 0:
+                prefix[p] = prefix[p - 1] + self.c(route[p - 1], route[p])
+
+        # prefix[p] is the cost of the path route[0], ..., route[p]
+        self.prefix[r] = prefix
+        self.cost[r] = self.route_cost(prefix[-1], route[0], route[-1])
+
+    def route_cost(self, path, first, last):
+        if self.closed:
+            return path + self.c(last, first)
+        return path
+
+    def path(self, r):
+        return self.prefix[r][-1]
+
+    def at(self, route, p):
+        return route[p] if 0 <= p < len(route) else END
+
+    def segment(self, route, start, length):
+        return sum(self.c(route[p], route[p + 1]) for p in range(start, start + length - 1))
+
+    def objective(self):
+        if self.minmax:
+            return max(self.cost)
+        return sum(self.cost)
+
+    def improves(self, changes: dict):
+        """Whether changing the costs of some routes (route: new cost)
+        improves the objective."""
+
+        delta = sum(cost - self.cost[r] for r, cost in changes.items())
+        if not self.minmax:
+            return delta < 0
+
+        longest = max(self.cost)
+        others = [cost for r, cost in enumerate(self.cost) if r not in changes]
+        new_longest = max(others + list(changes.values()))
+        return new_longest < longest or (new_longest == longest and delta < 0)
+
+    def fits(self, size):
+        return self.L <= size <= self.U
+
+    def two_opt(self, v, w):
+        """Reverses the part of the route between v and w so they become
+        adjacent."""
+
+        r = self.route_of[v]
+        route = self.routes[r]
+        lo, hi = sorted((self.position[v], self.position[w]))
+        if hi <= lo + 1:
+            return None
+
+        # reverse route[lo+1], ..., route[hi]
+        a, b, x, y = route[lo], route[lo + 1], route[hi], self.at(route, hi + 1)
+        path = self.path(r) + self.c(a, x) + self.c(b, y) - self.c(a, b) - self.c(x, y)
+        last = b if y == END else route[-1]
+        if self.improves({r: self.route_cost(path, route[0], last)}):
+            route[lo + 1:hi + 1] = route[lo + 1:hi + 1][::-1]
+            self.update(r)
+            return [a, b, x, y]
+
+        # reverse route[lo], ..., route[hi-1]
+        if lo == 0 and route[0] in self.pinned:
+            return None
+        u, a, x, y = self.at(route, lo - 1), route[lo], route[hi - 1], route[hi]
+        path = self.path(r) + self.c(u, x) + self.c(a, y) - self.c(u, a) - self.c(x, y)
+        first = x if u == END else route[0]
+        if self.improves({r: self.route_cost(path, first, route[-1])}):
+            route[lo:hi] = route[lo:hi][::-1]
+            self.update(r)
+            return [u, a, x, y]
+
+        return None
+
+    def or_opt(self, v, w, length: int):
+        """Moves the segment of length vertices starting at v right after w,
+        or the one ending at v right before w, inside their route."""
+
+        r = self.route_of[v]
+        route = self.routes[r]
+        i, j = self.position[v], self.position[w]
+        n = len(route)
+
+        # route[i], ..., route[i+length-1] after w
+        if i + length <= n and not i <= j < i + length and j != i - 1 and not (i == 0 and route[0] in self.pinned):
+            p, q, e = self.at(route, i - 1), self.at(route, i + length), self.at(route, j + 1)
+            first, last = route[i], route[i + length - 1]
+            path = (self.path(r) + self.c(p, q) - self.c(p, first) - self.c(last, q) +
+                    self.c(w, first) + self.c(last, e) - self.c(w, e))
+            rest_last = route[-1] if i + length < n else route[i - 1]
+            new_first = route[0] if i > 0 else route[length]
+            new_last = last if w == rest_last else rest_last
+            if self.improves({r: self.route_cost(path, new_first, new_last)}):
+                segment = route[i:i + length]
+                del route[i:i + length]
+                k = route.index(w)
+                route[k + 1:k + 1] = segment
+                self.update(r)
+                return [p, q, w, e, first, last]
+
+        # route[i-length+1], ..., route[i] before w
+        s = i - length + 1
+        if s >= 0 and not s <= j <= i and j != i + 1 and not (s == 0 and route[0] in self.pinned) and \
+                not (j == 0 and route[0] in self.pinned):
+            p, q, b = self.at(route, s - 1), self.at(route, i + 1), self.at(route, j - 1)
+            first, last = route[s], route[i]
+            path = (self.path(r) + self.c(p, q) - self.c(p, first) - self.c(last, q) +
+                    self.c(b, first) + self.c(last, w) - self.c(b, w))
+            rest_first = route[0] if s > 0 else route[i + 1]
+            new_first = first if w == rest_first else rest_first
+            new_last = route[-1] if i < n - 1 else route[s - 1]
+            if self.improves({r: self.route_cost(path, new_first, new_last)}):
+                segment = route[s:i + 1]
+                del route[s:i + 1]
+                k = route.index(w)
+                route[k:k] = segment
+                self.update(r)
+                return [p, q, b, w, first, last]
+
+        return None
+
+    def cross(self, v, w, length: int, other: int):
+        """Exchanges the segment of length vertices starting at v with the
+        segment of other vertices (possibly none, which relocates the first
+        one) following w in another route."""
+
+        r, s = self.route_of[v], self.route_of[w]
+        route, target = self.routes[r], self.routes[s]
+        i, j = self.position[v], self.position[w]
+        n_r, n_s = len(route), len(target)
+        if i + length > n_r or j + other >= n_s or (i == 0 and route[0] in self.pinned):
+            return None
+        if not self.fits(n_r - length + other) or not self.fits(n_s + length - other):
+            return None
+
+        p, q, e = self.at(route, i - 1), self.at(route, i + length), self.at(target, j + other + 1)
+        first, last = route[i], route[i + length - 1]
+        inner = self.segment(route, i, length)
+        if other > 0:
+            first2, last2 = target[j + 1], target[j + other]
+            inner2 = self.segment(target, j + 1, other)
+            path_r = self.path(r) - self.c(p, first) - inner - self.c(last, q) + self.c(p, first2) + inner2 + \
+                self.c(last2, q)
+            path_s = self.path(s) - self.c(w, first2) - inner2 - self.c(last2, e) + self.c(w, first) + inner + \
+                self.c(last, e)
+            new_first_r = route[0] if i > 0 else first2
+            new_last_r = route[-1] if q != END else last2
+        else:
+            path_r = self.path(r) - self.c(p, first) - inner - self.c(last, q) + self.c(p, q)
+            path_s = self.path(s) - self.c(w, e) + self.c(w, first) + inner + self.c(last, e)
+            new_first_r = route[0] if i > 0 else q
+            new_last_r = route[-1] if q != END else p
+        new_last_s = target[-1] if e != END else last
+
+        changes = {r: self.route_cost(path_r, new_first_r, new_last_r),
+                   s: self.route_cost(path_s, target[0], new_last_s)}
+        if self.improves(changes):
+            segment = route[i:i + length]
+            segment2 = target[j + 1:j + other + 1]
+            route[i:i + length] = segment2
+            target[j + 1:j + other + 1] = segment
+            self.update(r)
+            self.update(s)
+            return [p, q, w, e, first, last] + ([first2, last2] if other > 0 else [])
+
+        return None
+
+    def two_opt_star(self, v, w):
+        """Exchanges the tails of two routes: the route of v continues at w
+        and the one of w continues after v."""
+
+        r, s = self.route_of[v], self.route_of[w]
+        route, target = self.routes[r], self.routes[s]
+        i, j = self.position[v], self.position[w]
+        if j == 0:
+            return None
+        if not self.fits(i + 1 + len(target) - j) or not self.fits(j + len(route) - i - 1):
+            return None
+
+        nv, pw = self.at(route, i + 1), target[j - 1]
+        path_r = self.prefix[r][i] + self.c(v, w) + self.path(s) - self.prefix[s][j]
+        path_s = self.prefix[s][j - 1] + self.c(pw, nv) + (self.path(r) - self.prefix[r][i + 1] if nv != END else 0)
+        changes = {r: self.route_cost(path_r, route[0], target[-1]),
+                   s: self.route_cost(path_s, target[0], route[-1] if nv != END else pw)}
+        if self.improves(changes):
+            tail = route[i + 1:]
+            route[i + 1:] = target[j:]
+            target[j:] = tail
+            self.update(r)
+            self.update(s)
+            return [v, nv, w, pw]
+
+        return None
+
+    def improve_vertex(self, v):
+        """Applies the first improving move between v and one of its
+        candidate neighbors. Returns the vertices whose surroundings
+        changed, or None."""
+
+        for w in self.candidates[v]:
+            if self.route_of[w] == END:
+                continue
+
+            if self.route_of[w] == self.route_of[v]:
+                moves = [(self.two_opt, (v, w))] + [(self.or_opt, (v, w, length)) for length in (1, 2, 3)]
+            else:
+                moves = [(self.two_opt_star, (v, w))] + \
+                        [(self.cross, (v, w, length, other)) for length in (1, 2, 3) for other in (0, 1, 2, 3)]
+
+            for move, args in moves:
+                touched = move(*args)
+                if touched is not None:
+                    return [u for u in touched if u != END] + [v, w]
+
+        return None
+
+    def run(self):
+        """Applies improving moves until none is found. Returns the routes."""
+
+        queue = deque(v for route in self.routes for v in route)
+        queued = set(queue)
+        while len(queue) > 0:
+            v = queue.popleft()
+            queued.discard(v)
+
+            touched = self.improve_vertex(v)
+            if touched is not None:
+                for u in touched:
+                    if u not in queued:
+                        queue.append(u)
+                        queued.add(u)
+
+        return self.routes
+
+
+def improve_routes(D, routes: list, L: int, U: int, R: list, variant: str, objective: str, k=10):
+    """Improved copy of the routes (see RouteSearch)."""
+
+    if len(routes) == 0:
+        return []
+    return RouteSearch(D, routes, L, U, R, variant, objective, k).run()
+
+
+def post_optimize(D, routes: list, L: int, U: int, R: list, variant: str, objective: str, exact=None):
+    """Improves the routes returned by a solver, then puts every route of up
+    to exact.limit vertices in an optimal order (exact is a HeldKarp, a new
+    one is created if it is None). Returns the improved routes and their
+    objective value."""
+
+    routes = improve_routes(D, routes, L, U, R, variant, objective)
+    if len(routes) == 0:
+        return routes, math.inf
+
+    if exact is None:
+        exact = HeldKarp(D, variant)
+    routes = exact.improve(routes, R)
+    return routes, float(objective_value(route_costs(D, routes, variant), objective))
+
+
+class IncumbentPolisher(object):
+    """Improves every new incumbent of a solve with improve_routes and passes
+    the improved solution back to the solver. Optimal orders of the routes
+    are kept between incumbents.
+
+    decode(model) returns the routes of the new incumbent (in a MIPSOL
+    callback) and encode(routes) the values of the variables of the model
+    for some routes."""
+
+    def __init__(self, D, L: int, U: int, R: list, variant: str, objective: str, variables: dict, decode,
+                 encode) -> None:
+        self.D = D
+        self.L = L
+        self.U = U
+        self.R = R
+        self.variant = variant
+        self.objective = objective
+        self.variables = variables
+        self.decode = decode
+        self.encode = encode
+        self.exact = HeldKarp(D, variant)
+
+    def polish(self, model):
+        routes, objval = post_optimize(self.D, self.decode(model), self.L, self.U, self.R, self.variant,
+                                       self.objective, self.exact)
+
+        # costs are integer
+        if objval < model.cbGet(GRB.Callback.MIPSOL_OBJ) - 0.5:
+            set_solution(model, self.variables, self.encode(routes))
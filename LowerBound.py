@@ -0,0 +1,205 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import math
+
+import gurobipy as gp
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB
+
+from EnvironmentPool import default_pool
+from Heuristics import initial_solution
+from LocalSearch import improve_routes
+from Routes import objective_value, route_costs
+
+
+def minimum_spanning_tree(c):
+    """Edges (I, J) of a minimum spanning tree of the dense cost matrix c,
+    with Prim's algorithm (one array operation per vertex)."""
+
+    N = len(c)
+    in_tree = np.zeros(N, dtype=bool)
+    in_tree[0] = True
+    best = c[0].copy()
+    parent = np.zeros(N, dtype=np.int64)
+    I = np.zeros(N - 1, dtype=np.int64)
+    J = np.zeros(N - 1, dtype=np.int64)
+    for e in range(N - 1):
+        j = int(np.argmin(np.where(in_tree, np.inf, best)))
+        I[e], J[e] = parent[j], j
+        in_tree[j] = True
+        closer = c[j] < best
+        best[closer] = c[j][closer]
+        parent[closer] = j
+
+    return I, J
+
+
+def forest_bound(c, k: int, repeats: bool):
+    """Minimum cost of a spanning forest of k trees plus k more edges (a
+    1-tree if k is 1), which relaxes any set of k disjoint cycles covering
+    every vertex. The k edges may repeat edges of the forest if repeats is
+    True (cycles of two vertices). Returns the cost and the degrees."""
+
+    N = len(c)
+    I, J = minimum_spanning_tree(c)
+    w = c[I, J]
+
+    # without its k-1 heaviest edges, the tree is a minimum forest of k trees
+    keep = np.argsort(w, kind="stable")[:N - k]
+    I, J = I[keep], J[keep]
+
+    U, V = np.triu_indices(N, 1)
+    weights = c[U, V]
+    r = min(len(weights), k if repeats else len(I) + k)
+    candidates = np.argpartition(weights, r - 1)[:r]
+    candidates = candidates[np.argsort(weights[candidates], kind="stable")]
+    if not repeats:
+        forest = np.minimum(I, J) * N + np.maximum(I, J)
+        candidates = candidates[~np.isin(U[candidates] * N + V[candidates], forest)]
+    extra = candidates[:k]
+
+    value = w[keep].sum() + weights[extra].sum()
+    degrees = np.bincount(np.concatenate([I, J, U[extra], V[extra]]), minlength=N)
+    return value, degrees
+
+
+def held_karp_bound(D, m: int, variant: str, objective: str, upper=None, iterations=200, patience=10):
+    """Lower bound of the optimum of D split into m routes (L, U and R are
+    relaxed) by subgradient optimization of the degree penalties of
+    forest_bound (Held and Karp).
+
+    Open paths (OP) are a Hamiltonian cycle of the graph with m dummy
+    depots, at distance 0 from every vertex and never consecutive (a
+    1-tree). Closed paths (CP) are m disjoint cycles. upper is an upper
+    bound of the total cost (by default, the split of a giant tour), used by
+    the step sizes. The bound of minmax is the one of minsum divided by m."""
+
+    if variant != "CP" and variant != "OP":
+        raise ValueError("Invalid variant!")
+
+    n = len(D)
+    c = np.array([D.row(i) for i in range(n)], dtype=np.float64)
+    if variant == "OP":
+        # dummy depots
+        c = np.pad(c, ((0, m), (0, m)))
+        c[n:, n:] = np.inf
+        k, repeats = 1, False
+    else:
+        k, repeats = m, True
+    np.fill_diagonal(c, np.inf)
+    N = len(c)
+
+    if upper is None:
+        routes = initial_solution(D, m, 2, n, [], variant, "minsum")
+        if routes is not None:
+            upper = float(route_costs(D, routes, variant).sum())
+
+    pi = np.zeros(N)
+    best = -math.inf
+    step = 2.0
+    stall = 0
+    for _ in range(iterations):
+        value, degrees = forest_bound(c + pi[:, None] + pi[None, :], k, repeats)
+        value -= 2 * pi.sum()
+        if value > best + 1e-9:
+            best = value
+            stall = 0
+        else:
+            stall += 1
+            if stall >= patience:
+                step /= 2
+                stall = 0
+
+        # the relaxation is a set of cycles (optimal) or the upper bound is reached
+        g = degrees - 2
+        if not g.any() or (upper is not None and best >= upper - 1e-6):
+            break
+
+        target = upper if upper is not None else 1.05 * abs(value) + 1
+        pi += step * (target - value) / (g @ g) * g
+
+    # costs are integer
+    lower = math.ceil(best - 1e-6)
+    if objective == "minmax":
+        lower = math.ceil(lower / m)
+    elif objective != "minsum":
+        raise ValueError("Invalid objective function!")
+    return lower
+
+
+def lp_bound(model):
+    """Optimum of the LP relaxation of a linear model (rounded up, since
+    costs are integer), or None if it is not solved."""
+
+    relaxed = model.relax()
+    try:
+        relaxed.Params.outputFlag = 0
+        relaxed.optimize()
+        return math.ceil(relaxed.ObjVal - 1e-6) if relaxed.SolCount > 0 else None
+    finally:
+        relaxed.dispose()
+
+
+def reduced_cost_elimination(D, m: int, L: int, U: int, R: list, variant: str, objective: str, upper=None):
+    """Edges between vertices of D that are in no solution as good as upper
+    (by default, the split of a giant tour under L, U and R improved with
+    improve_routes).
+
+    The relaxation is the LP of the degree constraints (every vertex has
+    degree 2) over the edges of D, plus m dummy depots for open paths (OP);
+    closed paths (CP) may use an edge twice if L is 2. An edge whose reduced
+    cost added to the LP bound exceeds the total cost of upper (m times its
+    maximum cost, for minmax) is eliminated.
+
+    Returns a symmetric nxn boolean matrix of the eliminated edges and the
+    lower bound of the LP, or None if there is no upper bound."""
+
+    n = len(D)
+    if upper is None:
+        routes = initial_solution(D, m, L, U, R, variant, objective)
+        if routes is None:
+            return None
+        routes = improve_routes(D, routes, L, U, R, variant, objective)
+        upper = objective_value(route_costs(D, routes, variant), objective)
+    total = upper if objective == "minsum" else m * upper
+
+    # edges (I, J) with I < J, dummy depots are the last m vertices
+    N = n + m if variant == "OP" else n
+    I, J = np.triu_indices(N, 1)
+    I, J = I[I < n], J[I < n]
+    actual = J < n
+    costs = np.zeros(len(I))
+    costs[actual] = D.pairs(I[actual], J[actual])
+
+    env = default_pool.acquire()
+    model = None
+    try:
+        model = gp.Model(env=env)
+        model.Params.outputFlag = 0
+        x = model.addMVar(len(I), ub=2 if variant == "CP" and L <= 2 else 1)
+        A = sp.csr_matrix((np.ones(2 * len(I)), (np.concatenate([I, J]), np.tile(np.arange(len(I)), 2))),
+                          shape=(N, len(I)))
+        model.addMConstr(A, x, GRB.EQUAL, np.full(N, 2.0))
+        model.setMObjective(None, costs, 0.0, sense=GRB.MINIMIZE)
+        model.optimize()
+
+        result = None
+        if model.Status == GRB.OPTIMAL:
+            value = model.ObjVal
+            out = actual & (value + x.RC > total + 1e-6 * max(1.0, total))
+            eliminated = np.zeros((n, n), dtype=bool)
+            eliminated[I[out], J[out]] = True
+            eliminated |= eliminated.T
+
+            # costs are integer
+            lower = math.ceil(value - 1e-6)
+            if objective == "minmax":
+                lower = math.ceil(lower / m)
+            result = eliminated, lower
+    finally:
+        if model is not None:
+            model.dispose()
+        default_pool.release(env)
+    return result
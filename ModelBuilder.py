@@ -0,0 +1,310 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import gurobipy as gp
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB
+
+
+class ColumnLayout(object):
+    """Layout of several blocks of variables stored in a single MVar.
+
+    add returns the array of columns of a new block (-1 for the entries
+    left out by its mask), and create adds the MVar to the model. Names are
+    only generated if names is True."""
+
+    def __init__(self, names=False) -> None:
+        self.names = names
+        self.size = 0
+        self.vtype = []
+        self.varnames = []
+
+    def add(self, name, shape, vtype, mask=None):
+        if mask is None:
+            mask = np.ones(shape, dtype=bool)
+        size = int(mask.sum())
+        columns = np.full(shape, -1, dtype=np.int64)
+        columns[mask] = np.arange(self.size, self.size + size)
+        self.size += size
+        self.vtype.append(np.full(size, vtype))
+        if self.names:
+            self.varnames += ["{}[{}]".format(name, ",".join(str(i) for i in index))
+                              for index in zip(*np.nonzero(mask))]
+        return columns
+
+    def view(self, z, columns):
+        """Variables of a block of columns: an MVar with its shape, or a
+        MaskedMVar if some of its entries were left out."""
+
+        kept = columns[columns >= 0]
+        mvar = z[kept[0]:kept[-1] + 1]
+        if len(kept) == columns.size:
+            return mvar.reshape(columns.shape)
+        return MaskedMVar(mvar, columns >= 0)
+
+    def create(self, model):
+        vtype = np.concatenate(self.vtype)
+        if self.names:
+            return model.addMVar(self.size, vtype=vtype, name=np.array(self.varnames))
+        return model.addMVar(self.size, vtype=vtype)
+
+
+class MaskedMVar(object):
+    """Array of variables of which only the entries in mask are in the
+    model, as the MVar of those entries in row-major order. The other
+    entries are 0."""
+
+    def __init__(self, mvar, mask) -> None:
+        self.mvar = mvar
+        self.mask = mask
+        self.shape = mask.shape
+
+
+def add_rows(model, z, cols, vals, sense, rhs):
+    """Adds one constraint per row of cols: sum(vals[r] * z[cols[r]]) sense rhs[r].
+    Columns -1 (variables left out of the model) are skipped."""
+
+    cols = np.atleast_2d(cols)
+    vals = np.broadcast_to(vals, cols.shape)
+    rows = np.repeat(np.arange(cols.shape[0]), cols.shape[1])
+    kept = cols.ravel() >= 0
+    A = sp.csr_matrix((vals.ravel()[kept], (rows[kept], cols.ravel()[kept])), shape=(cols.shape[0], z.shape[0]))
+    A.eliminate_zeros()
+    model.addMConstr(A, z, sense, np.full(cols.shape[0], rhs, dtype=np.float64))
+
+
+def remove_arcs(model, x, I, J):
+    """Fixes to 0 the variables x[I, J] (an MVar or nested lists of Var,
+    for every salesperson if x has a third index), so presolve drops them.
+    The matrix builders leave those variables out of the model instead."""
+
+    if isinstance(x, gp.MVar):
+        x[I, J].setAttr(GRB.Attr.UB, 0.0)
+    else:
+        variables = np.array(x, dtype=object)[I, J].ravel().tolist()
+        model.setAttr(GRB.Attr.UB, variables, [0.0] * len(variables))
+
+
+def add_quadratic_row(model, z, cols, vals, Q_rows, Q_cols, Q_vals, sense, rhs):
+    """Adds the constraint sum(vals * z[cols]) + sum(Q_vals * z[Q_rows] * z[Q_cols]) sense rhs,
+    skipping the terms of columns -1."""
+
+    size = z.shape[0]
+    c = np.zeros(size)
+    kept = cols >= 0
+    np.add.at(c, cols[kept], vals[kept])
+    kept = (Q_rows >= 0) & (Q_cols >= 0)
+    Q = sp.csr_matrix((Q_vals[kept], (Q_rows[kept], Q_cols[kept])), shape=(size, size))
+    model.addMQConstr(Q, c, sense, rhs, z, z, z)
+
+
+def build_IP1_matrix(model, C, n: int, m: int, L: int, U: int, R: list, IQP: bool, objective: str, variant: str,
+                     eliminated=None, names=False):
+    """Same model as IP1.build_model, with x as a single (n, n, m) block of
+    unnamed variables and every family of constraints added at once.
+    Dummy depots are the first m vertices of C. The arcs (i, j) between
+    actual vertices where eliminated[i][j] (a boolean matrix) is True get
+    no x and y variables, nor the rows only bounding them. Returns views of
+    the MVar with the shapes of x, t, y and Pmax."""
+
+    if objective != "minsum" and objective != "minmax":
+        raise ValueError("Invalid objective function!")
+
+    linear_CP = variant == "CP" and IQP is False
+
+    mask = np.ones((n, n, m), dtype=bool)
+    if eliminated is not None:
+        tails, heads = np.nonzero(eliminated)
+        mask[tails + m, heads + m] = False
+
+    layout = ColumnLayout(names)
+    X = layout.add("x", (n, n, m), GRB.BINARY, mask)
+    T = layout.add("t", (n,), GRB.CONTINUOUS)
+    if linear_CP:
+        Y = layout.add("y", (n, n, m), GRB.BINARY, mask)
+    if objective == "minmax":
+        P = layout.add("Pmax", (1,), GRB.INTEGER)
+    z = layout.create(model)
+
+    D = np.arange(m)  # dummy depots set
+    V = np.arange(m, n)  # actual vertices in G=(V, E)
+    ones_V = np.ones(len(V))
+    ones_D = np.ones(m)
+
+    # (2)
+    add_rows(model, z, X[D[:, None], V[None, :], D[:, None]], 1, GRB.EQUAL, 1)
+
+    # (3)
+    add_rows(model, z, np.concatenate([X[D[None, :], V[:, None], D[None, :]],
+                                       X[V[None, :, None], V[:, None, None], D[None, None, :]].reshape(len(V), -1)],
+                                      axis=1), 1, GRB.EQUAL, 1)
+
+    # (4)
+    J, K = np.meshgrid(V, D, indexing="ij")
+    J, K = J.ravel(), K.ravel()
+    add_rows(model, z, np.concatenate([X[K, J, K][:, None], X[V[None, :], J[:, None], K[:, None]],
+                                       X[J, K, K][:, None], X[J[:, None], V[None, :], K[:, None]]], axis=1),
+             np.concatenate([[1], ones_V, [-1], -ones_V]), GRB.EQUAL, 0)
+
+    # (5)
+    add_rows(model, z, np.concatenate([X[D[:, None], V[None, :], D[:, None]], X[V[None, :], D[:, None], D[:, None]]],
+                                      axis=1),
+             np.concatenate([ones_V, -ones_V]), GRB.EQUAL, 0)
+
+    # (6); (7); (8)
+    leaving = X[D[None, :], V[:, None], D[None, :]]  # x[k][i][k]
+    arriving = X[V[:, None], D[None, :], D[None, :]]  # x[i][k][k]
+    add_rows(model, z, np.concatenate([T[V][:, None], leaving, arriving], axis=1),
+             np.concatenate([[1], (U - 2) * ones_D, -ones_D]), GRB.LESS_EQUAL, U - 1)  # (6)
+    add_rows(model, z, np.concatenate([T[V][:, None], leaving, arriving], axis=1),
+             np.concatenate([[1], ones_D, (2 - L) * ones_D]), GRB.GREATER_EQUAL, 2)  # (7)
+    add_rows(model, z, np.concatenate([leaving, arriving], axis=1), 1, GRB.LESS_EQUAL, 1)  # (8)
+
+    # (9), implied by the bounds of t without the arcs (i, j) and (j, i)
+    I, J = np.meshgrid(V, V, indexing="ij")
+    I, J = I.ravel(), J.ravel()
+    arc = mask[I, J, 0] | mask[J, I, 0]
+    I, J = I[arc], J[arc]
+    add_rows(model, z, np.concatenate([T[I][:, None], T[J][:, None], X[I, J], X[J, I]], axis=1),
+             np.concatenate([[1, -1], U * ones_D, (U - 2) * ones_D]), GRB.LESS_EQUAL, U - 1)
+
+    if linear_CP:
+        # new constraints for y variables
+        K, J, I = [a.ravel() for a in np.meshgrid(D, V, V, indexing="ij")]
+        add_rows(model, z, np.stack([Y[I, J, K], X[I, K, K], X[K, J, K]], axis=1), [1, -1, -1],
+                 GRB.GREATER_EQUAL, -1)  # (16)
+        arc = mask[I, J, K]
+        I, J, K = I[arc], J[arc], K[arc]
+        add_rows(model, z, np.stack([Y[I, J, K], X[K, J, K]], axis=1), [1, -1], GRB.LESS_EQUAL, 0)  # (17)
+        add_rows(model, z, np.stack([Y[I, J, K], X[I, K, K]], axis=1), [1, -1], GRB.LESS_EQUAL, 0)  # (18)
+
+    # for FD-M+DL
+    if R is not None:
+        R = np.asarray(R, dtype=np.int64) + m
+
+        # (26)
+        add_rows(model, z, X[D[:, None], R[None, :], D[:, None]].reshape(1, -1), 1, GRB.EQUAL, len(R))
+
+    # costs between actual vertices, terms x[i][j][k] * C[i][j]
+    Cd = C.dense().astype(np.float64)
+    I, J = np.nonzero(Cd)
+    I, J, K = np.repeat(I, m), np.repeat(J, m), np.tile(D, len(I))
+    costs = Cd[I, J]
+    arc = mask[I, J, K]  # arcs with variables
+
+    if objective == "minsum":
+        c = np.zeros(z.shape[0])
+        Q = None
+        if variant == "CP" and IQP is True:
+            # (1)
+            c[X[I, J, K][arc]] = costs[arc]
+            Q = sp.csr_matrix((costs, (X[I, K, K], X[K, J, K])), shape=(z.shape[0], z.shape[0]))
+        elif linear_CP:
+            # (15)
+            c[X[I, J, K][arc]] = costs[arc]
+            c[Y[I, J, K][arc]] = costs[arc]
+        elif variant == "OP":
+            # (23)
+            c[X[I, J, K][arc]] = costs[arc]
+
+        model.setMObjective(Q, c, 0.0, sense=GRB.MINIMIZE)
+
+    elif objective == "minmax":
+        c = np.zeros(z.shape[0])
+        c[P] = 1
+        model.setMObjective(None, c, 0.0, sense=GRB.MINIMIZE)
+
+        for k in range(m):
+            at_k = K == k
+            if variant == "CP" and IQP is True:
+                # (21)
+                add_quadratic_row(model, z, np.concatenate([P, X[I, J, K][at_k]]),
+                                  np.concatenate([[1], -costs[at_k]]),
+                                  X[I, K, K][at_k], X[K, J, K][at_k], -costs[at_k], GRB.GREATER_EQUAL, 0)
+            elif linear_CP:
+                add_rows(model, z, np.concatenate([P, X[I, J, K][at_k], Y[I, J, K][at_k]])[None, :],
+                         np.concatenate([[1], -costs[at_k], -costs[at_k]]), GRB.GREATER_EQUAL, 0)
+            elif variant == "OP":
+                # (25)
+                add_rows(model, z, np.concatenate([P, X[I, J, K][at_k]])[None, :],
+                         np.concatenate([[1], -costs[at_k]]), GRB.GREATER_EQUAL, 0)
+
+    variables = {"x": layout.view(z, X), "t": layout.view(z, T)}
+    if linear_CP:
+        variables["y"] = layout.view(z, Y)
+    if objective == "minmax":
+        variables["Pmax"] = z[P]
+    return variables
+
+
+def build_karabulut_matrix(model, D, n: int, m: int, U: int, objective: str, eliminated=None, names=False):
+    """Same model as karabulut.build_model, with x as a single (n, n, m)
+    block of unnamed variables and every family of constraints added at
+    once. The arcs (i, j) where eliminated[i][j] (a boolean matrix) is True
+    get no x variables, nor rows (17). Returns views of the MVar with the
+    shapes of x, t, z and Smax."""
+
+    if objective != "minsum" and objective != "minmax":
+        raise ValueError("Invalid objective function!")
+
+    mask = np.ones((n, n, m), dtype=bool)
+    if eliminated is not None:
+        mask[np.asarray(eliminated, dtype=bool)] = False
+
+    layout = ColumnLayout(names)
+    X = layout.add("x", (n, n, m), GRB.BINARY, mask)
+    T = layout.add("t", (n,), GRB.CONTINUOUS)
+    Z = layout.add("z", (n,), GRB.BINARY)
+    if objective == "minmax":
+        S = layout.add("Smax", (1,), GRB.INTEGER)
+    z = layout.create(model)
+
+    off_diagonal = ~np.eye(n, dtype=bool)
+    # arcs (i, j) with i != j, indexed [i, position of j, k] and [j, position of i, k]
+    leaving = X[off_diagonal].reshape(n, n - 1, m)
+    entering = X.transpose(1, 0, 2)[off_diagonal].reshape(n, n - 1, m)
+
+    # (14)
+    add_rows(model, z, entering.reshape(n, -1), 1, GRB.EQUAL, 1)
+
+    # (15)
+    add_rows(model, z, np.concatenate([entering.transpose(0, 2, 1).reshape(n * m, n - 1),
+                                       leaving.transpose(0, 2, 1).reshape(n * m, n - 1)], axis=1),
+             np.concatenate([np.ones(n - 1), -np.ones(n - 1)]), GRB.EQUAL, 0)
+
+    # (16)
+    add_rows(model, z, leaving.reshape(-1, m).T, 1, GRB.GREATER_EQUAL, 1)
+
+    # (17), implied by the bounds of t without the arc (i, j)
+    I, J = np.nonzero(off_diagonal & mask[:, :, 0])
+    add_rows(model, z, np.concatenate([T[I][:, None], T[J][:, None], X[I, J], Z[J][:, None]], axis=1),
+             np.concatenate([[1, -1], U * np.ones(m), [-U]]), GRB.LESS_EQUAL, U - 1)
+
+    # (18)
+    add_rows(model, z, T[:, None], 1, GRB.GREATER_EQUAL, 1)
+    add_rows(model, z, T[:, None], 1, GRB.LESS_EQUAL, U)
+
+    # (19)
+    add_rows(model, z, Z[None, :], 1, GRB.EQUAL, m)
+
+    # costs of the arcs, terms x[i][j][k] * D[i][j]
+    Dd = np.asarray(D, dtype=np.float64)
+    costs = Dd[I, J]
+
+    c = np.zeros(z.shape[0])
+    if objective == "minsum":
+        c[X[I, J]] = costs[:, None]
+
+    elif objective == "minmax":
+        c[S] = 1
+        # (22)
+        add_rows(model, z, np.concatenate([np.repeat(S[None, :], m, axis=0), X[I, J].T], axis=1),
+                 np.concatenate([[1], -costs]), GRB.GREATER_EQUAL, 0)
+
+    model.setMObjective(None, c, 0.0, sense=GRB.MINIMIZE)
+
+    variables = {"x": layout.view(z, X), "t": layout.view(z, T), "z": layout.view(z, Z)}
+    if objective == "minmax":
+        variables["Smax"] = z[S]
+    return variables
@@ -0,0 +1,217 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import json
+import math
+import multiprocessing as mp
+import os
+import time
+
+from gurobipy import GRB
+
+from IP1 import run_IP1
+from IP2 import run_IP2
+from Routes import set_solution
+from TSPLIBReader import read_TSPLIB_instance
+from karabulut import run_karabulut
+
+# formulations that can take part in a race
+RUNNERS = {"karabulut": run_karabulut, "IP1": run_IP1, "IP2": run_IP2}
+
+
+class SharedIncumbent(object):
+    """Best incumbent of the solves of a race (one process per formulation)
+    kept in shared memory, and a flag raised when one of them is proven
+    optimal.
+
+    Every new incumbent of a solve better than the shared one replaces it
+    (MIPSOL), and a shared incumbent better than the best one of a solve is
+    passed to it as a new solution (MIPNODE), so it acts as a cutoff. Every
+    interval seconds, the solve is terminated if the flag is raised or the
+    deadline (time.time()) is reached.
+
+    The routes are stored in an array of n + m entries, each one followed by
+    -1."""
+
+    def __init__(self, n: int, m: int, deadline: float, interval=0.1) -> None:
+        self.lock = mp.Lock()
+        self.objval = mp.Value("d", math.inf, lock=False)
+        self.version = mp.Value("l", 0, lock=False)
+        self.optimal = mp.Value("b", 0, lock=False)
+        self.routes = mp.Array("l", n + m, lock=False)
+        self.deadline = deadline
+        self.interval = interval
+
+        # state of the solve of this process (see attach)
+        self.variables = None
+        self.decode = None
+        self.encode = None
+        self.seen = 0
+        self.best = math.inf
+        self.last_check = -math.inf
+
+    def attach(self, variables: dict, decode, encode):
+        """Attaches the solve of this process. decode(model) returns the
+        routes of a new incumbent (in a MIPSOL callback) and encode(routes)
+        the values of the variables of the model for some routes."""
+
+        self.variables = variables
+        self.decode = decode
+        self.encode = encode
+        self.seen = 0
+        self.best = math.inf
+        self.last_check = -math.inf
+
+    def publish(self, routes: list, objval: float):
+        with self.lock:
+            # costs are integer
+            if objval >= self.objval.value - 0.5:
+                return
+
+            flat = []
+            for route in routes:
+                flat += route + [-1]
+            self.routes[:len(flat)] = flat
+            self.objval.value = objval
+            self.version.value += 1
+            self.seen = self.version.value
+
+    def incumbent(self):
+        """Version, objective value and routes of the shared incumbent."""
+
+        with self.lock:
+            flat = self.routes[:]
+            routes = []
+            route = []
+            for vertex in flat:
+                if vertex == -1:
+                    routes.append(route)
+                    route = []
+                else:
+                    route.append(vertex)
+            return self.version.value, self.objval.value, routes
+
+    def callback(self, model, where):
+        if where == GRB.Callback.MIPSOL:
+            objval = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+            if objval < self.best:
+                self.best = objval
+                self.publish(self.decode(model), objval)
+
+        elif where == GRB.Callback.MIPNODE:
+            if self.version.value != self.seen and self.objval.value < self.best - 0.5:
+                self.seen, objval, routes = self.incumbent()
+                set_solution(model, self.variables, self.encode(routes))
+
+        now = time.time()
+        if now - self.last_check >= self.interval:
+            self.last_check = now
+            if self.optimal.value == 1 or now >= self.deadline:
+                model.terminate()
+
+    def finish(self, optimal: bool):
+        """Raises the flag if the solve of this process was proven optimal."""
+
+        if optimal:
+            self.optimal.value = 1
+
+
+def race_formulations(conf: dict, n: int):
+    """Formulations that solve the same problem as IP1 for conf: IP2 only
+    minimizes the total cost and ignores L if U >= n, karabulut only
+    handles closed paths without R and L = 2."""
+
+    formulations = ["IP1"]
+    if conf["objective"] == "minsum" and (conf["U"] < n or conf["L"] <= 2):
+        formulations.append("IP2")
+    if conf["variant"] == "CP" and len(conf["R"]) == 0 and conf["L"] <= 2:
+        formulations.append("karabulut")
+    return formulations
+
+
+def run_race(conf, D=None):
+    """Solves the instance with several formulations at the same time, one
+    process each, sharing their incumbents (see SharedIncumbent) within a
+    single TimeLimit. The output of each formulation is printed in
+    outputFile-<formulation>, and the best one in outputFile."""
+
+    output_file = conf["outputFile"]
+    if os.path.exists(output_file):
+        os.remove(output_file)
+
+    if D is None:
+        D, I = read_TSPLIB_instance(conf["instance"])
+    n = len(D)
+
+    formulations = conf["formulations"] if "formulations" in conf else race_formulations(conf, n)
+    for name in formulations:
+        if name not in RUNNERS:
+            raise ValueError("Invalid formulation in race!")
+
+    # threads of the solver split between the formulations
+    Threads = conf["Threads"] if "Threads" in conf else max(1, (os.cpu_count() or 1) // len(formulations))
+
+    race = SharedIncumbent(n, conf["m"], time.time() + conf["TimeLimit"])
+    base, extension = os.path.splitext(output_file)
+    processes = {}
+    for name in formulations:
+        formulation_conf = {key: value for key, value in conf.items() if key != "formulations"}
+        formulation_conf.update({"IP": name, "Threads": Threads,
+                                 "outputFile": "{}-{}{}".format(base, name, extension)})
+        processes[name] = (formulation_conf, mp.Process(target=RUNNERS[name], args=(formulation_conf, D, race)))
+
+    for formulation_conf, process in processes.values():
+        process.start()
+    for formulation_conf, process in processes.values():
+        process.join()
+
+    # the best objective value, proven optimal first
+    results = {}
+    for name, (formulation_conf, process) in processes.items():
+        if os.path.exists(formulation_conf["outputFile"]):
+            with open(formulation_conf["outputFile"]) as reader:
+                results[name] = json.load(reader)
+    if len(results) == 0:
+        raise RuntimeError("Error at solving procedure!")
+    outputs = {name: result["OUTPUT"] for name, result in results.items()}
+    winner = min(outputs, key=lambda name: (float(outputs[name]["objval"]), float(outputs[name]["gap"])))
+
+    # register of input parameters of the winner, for this run
+    inputparams = {key: value for key, value in results[winner]["INPUT"].items() if key != "default"}
+    inputparams["IP"] = conf["IP"]
+    inputparams["outputFile"] = output_file
+    if "formulations" in conf:
+        inputparams["formulations"] = conf["formulations"]
+
+    with open(output_file + ".tmp", "w") as writer:
+        ignored = conf.copy()
+
+        output_dict = {}
+        # input configuration
+        INPUT_dict = {}
+        INPUT_default = []
+        for key, value in inputparams.items():
+            INPUT_dict[key] = value
+            if key not in ignored or ignored[key] != value:
+                INPUT_default.append(key)
+            else:
+                del ignored[key]
+
+        if len(INPUT_default) > 0:
+            INPUT_dict["default"] = INPUT_default
+        output_dict["INPUT"] = INPUT_dict
+
+        # print ignored parameters
+        if len(ignored) > 0:
+            output_dict["IGNORED_PARAMETERS"] = ignored
+
+        OUTPUT_dict = dict(outputs[winner])
+        OUTPUT_dict["formulation"] = winner
+        OUTPUT_dict["race"] = {name: {"objval": output["objval"], "gap": output["gap"], "runtime": output["runtime"]}
+                               for name, output in outputs.items()}
+        output_dict["OUTPUT"] = OUTPUT_dict
+
+        writer.write(json.dumps(output_dict))
+    os.replace(output_file + ".tmp", output_file)
+
+    print("output printed in {}".format(output_file))
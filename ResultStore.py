@@ -0,0 +1,118 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from TSPLIBReader import CACHE_SUFFIX
+
+# parameters that do not change the result of a run
+IGNORED_KEYS = ["outputFile", "outputFlag"]
+
+# maximum number of results kept by a ResultCache
+CACHE_ENTRIES = 10000
+
+
+def run_key(conf: dict, digest: str):
+    """Key of a run: SHA-1 of its configuration (sorted, without
+    IGNORED_KEYS and without the path of the instance) and of the digest of
+    the content of its instance."""
+
+    normalized = {key: value for key, value in conf.items() if key not in IGNORED_KEYS and key != "instance"}
+    text = json.dumps(normalized, sort_keys=True) + digest
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class ResultStore(object):
+    """Runs of an experiment campaign stored in a SQLite database, one row
+    per run key. A run is either running, finished (with the json output of
+    the formulation) or failed, so an interrupted campaign can be resumed
+    by skipping its finished runs."""
+
+    def __init__(self, path: str) -> None:
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS runs (key TEXT PRIMARY KEY, name TEXT, instance TEXT, "
+                                "m INTEGER, conf TEXT, status TEXT, output TEXT, updated REAL)")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def record(self, key: str, name: str, conf: dict, status: str, output=None):
+        """Inserts or replaces the run key."""
+
+        self.connection.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                (key, name, conf["instance"], conf["m"], json.dumps(conf, sort_keys=True), status,
+                                 None if output is None else json.dumps(output), time.time()))
+        self.connection.commit()
+
+    def start(self, key: str, name: str, conf: dict):
+        self.record(key, name, conf, "running")
+
+    def finish(self, key: str, name: str, conf: dict, output: dict):
+        self.record(key, name, conf, "finished", output)
+
+    def fail(self, key: str, name: str, conf: dict, error: str):
+        self.record(key, name, conf, "failed", {"error": error})
+
+    def output(self, key: str):
+        """Output of the run key if it finished, None otherwise."""
+
+        row = self.connection.execute("SELECT output FROM runs WHERE key = ? AND status = 'finished'",
+                                      (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+
+def cache_path(file_instance: str):
+    """Path of the result cache of the instances in the folder of
+    file_instance, inside their cache folder (e.g., TSPLIB_cache)."""
+
+    folder = os.path.dirname(os.path.abspath(file_instance))
+    return os.path.join(folder + CACHE_SUFFIX, "results.db")
+
+
+class ResultCache(object):
+    """Best known result of every effective configuration of a formulation
+    (see run_key), stored in a SQLite database shared by concurrent solves.
+
+    A result is a dict with at least objval and gap. When there are more
+    than max_entries results, the least recently used ones are evicted."""
+
+    def __init__(self, path: str, max_entries=CACHE_ENTRIES) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self.connect()) as connection, connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT, "
+                               "objval REAL, gap REAL, used REAL)")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def get(self, key: str):
+        """Result stored for key, or None."""
+
+        with closing(self.connect()) as connection, connection:
+            row = connection.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+
+    def put(self, key: str, result: dict):
+        """Stores result for key, unless the stored one is optimal (gap 0) or
+        has a better objective value."""
+
+        with closing(self.connect()) as connection, connection:
+            row = connection.execute("SELECT objval, gap FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and (row[1] == 0 or (result["gap"] != 0 and row[0] <= result["objval"])):
+                return
+
+            connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                               (key, json.dumps(result), result["objval"], result["gap"], time.time()))
+            connection.execute("DELETE FROM results WHERE key IN "
+                               "(SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
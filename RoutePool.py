@@ -0,0 +1,109 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import gurobipy as gp
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB
+
+from EnvironmentPool import default_pool
+from Routes import route_costs
+
+
+class RoutePool(object):
+    """Routes found by the solves and the heuristics, deduplicated by vertex
+    set: only the cheapest route over each set is kept (as a closed path
+    (CP) or as an open path (OP)).
+
+    A route with a vertex of R must start at it, so closed paths are
+    rotated and open paths (and routes with two vertices of R) are
+    discarded otherwise."""
+
+    def __init__(self, D, variant: str, R=[]) -> None:
+        self.D = D
+        self.variant = variant
+        self.required = set(R)
+        self.routes = {}  # vertex set -> (cost, route)
+
+    def __len__(self):
+        return len(self.routes)
+
+    def add(self, route: list):
+        starts = [v for v in route if v in self.required]
+        if len(starts) > 1:
+            return
+        if len(starts) == 1 and route[0] != starts[0]:
+            if self.variant == "OP":
+                return
+            i = route.index(starts[0])
+            route = route[i:] + route[:i]
+
+        key = frozenset(route)
+        cost = float(route_costs(self.D, [route], self.variant)[0])
+        if key not in self.routes or cost < self.routes[key][0]:
+            self.routes[key] = (cost, list(route))
+
+    def add_routes(self, routes: list):
+        for route in routes:
+            self.add(route)
+
+
+def recombine(pool: RoutePool, n: int, m: int, L: int, U: int, objective: str, TimeLimit=60, Threads=0):
+    """Set-partitioning master problem over the routes of pool: exactly m
+    routes of L to U vertices covering each of the n vertices once, with
+    the minimum total cost (minsum) or maximum cost (minmax). The vertices
+    of R start their routes by construction of the pool.
+
+    Returns the routes and their objective value, or None if the pool has
+    no such routes (or they are not found within TimeLimit)."""
+
+    if objective != "minsum" and objective != "minmax":
+        raise ValueError("Invalid objective function!")
+
+    candidates = [(cost, route) for cost, route in pool.routes.values() if L <= len(route) <= U]
+    if len(candidates) == 0:
+        return None
+    k = len(candidates)
+    costs = np.array([cost for cost, route in candidates])
+
+    env = default_pool.acquire()
+    model = None
+    try:
+        model = gp.Model(env=env)
+        model.Params.outputFlag = 0
+        model.setParam("TimeLimit", TimeLimit)
+        model.setParam("Threads", Threads)
+
+        # z = (one binary per route, maximum cost)
+        z = model.addMVar(k + 1, vtype=np.array([GRB.BINARY] * k + [GRB.CONTINUOUS]))
+
+        # each vertex in exactly one route
+        rows = np.concatenate([route for cost, route in candidates])
+        cols = np.repeat(np.arange(k), [len(route) for cost, route in candidates])
+        A = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, k + 1))
+        model.addMConstr(A, z, GRB.EQUAL, np.ones(n))
+
+        # exactly m routes
+        model.addMConstr(sp.csr_matrix(np.concatenate([np.ones(k), [0]])), z, GRB.EQUAL, [m])
+
+        c = np.zeros(k + 1)
+        if objective == "minsum":
+            c[:k] = costs
+        else:
+            # cost of every chosen route below the maximum cost
+            A = sp.hstack([sp.diags(costs), -np.ones((k, 1))]).tocsr()
+            model.addMConstr(A, z, GRB.LESS_EQUAL, np.zeros(k))
+            c[k] = 1
+        model.setMObjective(None, c, 0.0, sense=GRB.MINIMIZE)
+
+        model.optimize()
+
+        result = None
+        if model.SolCount > 0:
+            chosen = np.flatnonzero(z.X[:k] > 0.5)
+            result = [candidates[i][1] for i in chosen], model.ObjVal
+    finally:
+        if model is not None:
+            model.dispose()
+        default_pool.release(env)
+    return result
@@ -0,0 +1,127 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import itertools
+
+import gurobipy as gp
+import numpy as np
+from gurobipy import GRB
+
+from ModelBuilder import MaskedMVar
+
+
+def solution_values(model, x, callback=False):
+    """Values of the variables in x (an MVar, a MaskedMVar or nested lists
+    of Var) as an array with the shape of x, read with a single attribute
+    query. If callback is True, the values of the new incumbent are read
+    with cbGetSolution (only valid at MIPSOL)."""
+
+    if isinstance(x, MaskedMVar):
+        values = np.zeros(x.shape)
+        values[x.mask] = solution_values(model, x.mvar, callback)
+        return values
+
+    if isinstance(x, gp.MVar):
+        return np.asarray(model.cbGetSolution(x) if callback else x.getAttr(GRB.Attr.X))
+
+    variables = np.array(x, dtype=object)
+    if callback:
+        values = model.cbGetSolution(variables.ravel().tolist())
+    else:
+        values = model.getAttr(GRB.Attr.X, variables.ravel().tolist())
+    return np.asarray(values, dtype=np.float64).reshape(variables.shape)
+
+
+def set_start(model, variables: dict, values: dict):
+    """Sets the MIP start of the variables (name: MVar, MaskedMVar or nested
+    lists of Var) to the values (name: array with the same shape). Values
+    of variables that are not in the model are skipped."""
+
+    for name, value in values.items():
+        if name not in variables:
+            continue
+
+        x = variables[name]
+        value = np.asarray(value, dtype=np.float64)
+        if isinstance(x, MaskedMVar):
+            x, value = x.mvar, value[x.mask]
+        if isinstance(x, gp.MVar):
+            x.setAttr(GRB.Attr.Start, value)
+        else:
+            model.setAttr(GRB.Attr.Start, np.array(x, dtype=object).ravel().tolist(), value.ravel().tolist())
+
+
+def set_solution(model, variables: dict, values: dict):
+    """Same as set_start, but the values are passed as a new solution from
+    a callback (cbSetSolution)."""
+
+    for name, value in values.items():
+        if name not in variables:
+            continue
+
+        x = variables[name]
+        value = np.asarray(value, dtype=np.float64)
+        if isinstance(x, MaskedMVar):
+            x, value = x.mvar, value[x.mask]
+        if isinstance(x, gp.MVar):
+            model.cbSetSolution(x, value.reshape(x.shape))
+        else:
+            model.cbSetSolution(np.array(x, dtype=object).ravel().tolist(), value.ravel().tolist())
+
+
+def route_costs(D, routes: list, variant: str):
+    """Cost of every route, closing it (from its last to its first vertex)
+    if variant is CP."""
+
+    costs = np.zeros(len(routes), dtype=np.int64)
+    for k, route in enumerate(routes):
+        costs[k] = D.pairs(route[:-1], route[1:]).sum()
+        if variant == "CP" and len(route) > 1:
+            costs[k] += D[route[-1], route[0]]
+    return costs
+
+
+def objective_value(costs, objective: str):
+    """Objective value of a solution given the costs of its routes."""
+
+    if objective == "minsum":
+        return int(np.sum(costs))
+    if objective == "minmax":
+        return int(np.max(costs))
+    raise ValueError("Invalid objective function!")
+
+
+def successors(n: int, I, J):
+    """Successor array of the arcs (I[a], J[a]) over n vertices, -1 if none."""
+
+    succ = np.full(n, -1, dtype=np.int64)
+    succ[I] = J
+    return succ
+
+
+def routes_from_successors(succ):
+    """Routes encoded by a successor array. Paths start at the vertices
+    without predecessor, the remaining vertices are walked as cycles
+    starting at their smallest vertex."""
+
+    succ = np.asarray(succ)
+    n = len(succ)
+    has_predecessor = np.zeros(n, dtype=bool)
+    has_predecessor[succ[succ >= 0]] = True
+
+    succ = succ.tolist()
+    visited = [False] * n
+    routes = []
+    for start in itertools.chain(np.flatnonzero(~has_predecessor).tolist(), range(n)):
+        if visited[start]:
+            continue
+
+        route = []
+        v = start
+        while v >= 0 and not visited[v]:
+            visited[v] = True
+            route.append(v)
+            v = succ[v]
+        routes.append(route)
+
+    return routes
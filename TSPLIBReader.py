@@ -1,11 +1,23 @@
 # This work is licensed under CC BY-NC 4.0 
 # Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
 
+import hashlib
+import json
 import math
+import os
+import re
+import warnings
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
 
 
 class InstanceTSPLIB(object):
 
+    __slots__ = ("EDGE_WEIGHT_TYPE", "DIMENSION", "EDGE_WEIGHT_FORMAT", "NODE_COORD_TYPE", "DISPLAY_DATA_TYPE",
+                 "DISPLAY_DATA_SECTION", "NODE_COORD_SECTION", "EDGE_WEIGHT_SECTION")
+
     def __init__(self) -> None:
         self.EDGE_WEIGHT_TYPE = None
         self.DIMENSION = None
@@ -45,123 +57,610 @@ class InstanceTSPLIB(object):
         self.EDGE_WEIGHT_SECTION.append(data)
 
 
+# maximum number of entries computed at once by the blocked distance engine
+BLOCK_SIZE = 1 << 22
+
+# constants of the TSPLIB GEO distance function
+PI = 3.141592
+RRR = 6378.388
+
+
+def geo_coordinates(node_data):
+    """Returns the (latitude, longitude) in radians of every node, as
+    defined by TSPLIB for GEO instances."""
+
+    node_data = np.asarray(node_data, dtype=np.float64)[:, :2]
+    deg = np.trunc(node_data)
+    min = node_data - deg
+    return PI * (deg + 5.0 * min / 3.0) / 180.0
+
+
+def distance(EDGE_WEIGHT_TYPE, P, Q):
+    """Returns the integer distances between the points of P and Q, which
+    are broadcastable arrays of 2D coordinates (already transformed by
+    geo_coordinates for GEO instances). The rounding rules are the TSPLIB
+    ones, so each entry is identical to its scalar computation."""
+
+    xd = P[..., 0] - Q[..., 0]
+    yd = P[..., 1] - Q[..., 1]
+
+    if EDGE_WEIGHT_TYPE == "EUC_2D":
+        dij = np.sqrt(xd * xd + yd * yd)
+        return np.floor(dij + 0.5).astype(np.int64)
+
+    if EDGE_WEIGHT_TYPE == "CEIL_2D":
+        dij = np.sqrt(xd * xd + yd * yd)
+        return np.ceil(dij).astype(np.int64)
+
+    if EDGE_WEIGHT_TYPE == "ATT":
+        rij = np.sqrt((xd * xd + yd * yd) / 10.0)
+        tij = np.floor(rij + 0.5)
+        return (tij + (tij < rij)).astype(np.int64)
+
+    if EDGE_WEIGHT_TYPE == "GEO":
+        q1 = np.cos(yd)
+        q2 = np.cos(xd)
+        q3 = np.cos(P[..., 0] + Q[..., 0])
+        arg = 0.5 * ((1.0 + q1) * q2 - (1.0 - q1) * q3)
+        with np.errstate(invalid="ignore"):
+            dij = RRR * np.arccos(arg) + 1.0
+        D = np.trunc(dij)
+
+        # numpy trigonometric kernels may differ from libm in the last ulp,
+        # thus, values close to an integer (or to the poles of acos) are
+        # recomputed with the scalar functions
+        frac = dij - D
+        suspicious = (frac < 1e-5) | (frac > 1 - 1e-5) | (np.abs(arg) > 1 - 1e-9) | np.isnan(dij)
+        P, Q = np.broadcast_arrays(P, Q)
+        for idx in zip(*np.nonzero(suspicious)):
+            q1 = math.cos(P[idx][1] - Q[idx][1])
+            q2 = math.cos(P[idx][0] - Q[idx][0])
+            q3 = math.cos(P[idx][0] + Q[idx][0])
+            D[idx] = int(RRR * math.acos(0.5*((1.0+q1)*q2 - (1.0-q1)*q3)) + 1.0)
+        return D.astype(np.int64)
+
+    raise Exception("Inconsistent EDGE_WEIGHT_TYPE!")
+
+
+def distance_block(EDGE_WEIGHT_TYPE, P, Q):
+    """Returns the |P|x|Q| integer distances between the points of P and Q."""
+
+    return distance(EDGE_WEIGHT_TYPE, P[:, None, :], Q[None, :, :])
+
+
+def smallest_dtype(min_value, max_value):
+    """Returns the smallest integer dtype holding every value in
+    [min_value, max_value]."""
+
+    return np.promote_types(np.min_scalar_type(min_value), np.min_scalar_type(max_value))
+
+
+def distance_bound(EDGE_WEIGHT_TYPE, P):
+    """Returns an upper bound of the distances between the points of P,
+    computed from their bounding box."""
+
+    if EDGE_WEIGHT_TYPE == "GEO":
+        return int(RRR * math.pi) + 2
+
+    span = np.ptp(P, axis=0) if len(P) > 0 else np.zeros(2)
+    squared = float(span[0] * span[0] + span[1] * span[1])
+    if EDGE_WEIGHT_TYPE == "ATT":
+        squared /= 10.0
+    return int(math.sqrt(squared)) + 2
+
+
+class SymmetricDistanceMatrix(object):
+    """Symmetric distance matrix with zero diagonal that stores only its
+    strict upper triangle, row by row, with the smallest integer dtype
+    holding its values.
+
+    d(i, j) (or D[i, j]) is an O(1) lookup and row(i) (or D[i]) returns the
+    i-th row as an int64 array, so D[i][j] also works."""
+
+    __slots__ = ("n", "data", "offsets")
+
+    def __init__(self, n, data) -> None:
+        self.n = n
+        self.data = data
+
+        # (i, j) with i < j is stored at offsets[i] + j
+        i = np.arange(n, dtype=np.int64)
+        self.offsets = i * n - i * (i + 1) // 2 - i - 1
+
+    @classmethod
+    def from_upper(cls, n, upper):
+        """Builds the matrix from its strict upper triangle (row-major),
+        stored with the smallest dtype holding its values."""
+
+        upper = np.asarray(upper)
+        if len(upper) == 0:
+            return cls(n, upper.astype(np.uint8))
+        return cls(n, upper.astype(smallest_dtype(upper.min(), upper.max())))
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.d(*key)
+        return self.row(key)
+
+    def __array__(self, dtype=None, copy=None):
+        D = self.dense()
+        return D if dtype is None else D.astype(dtype)
+
+    def d(self, i, j):
+        if i == j:
+            return 0
+        if i > j:
+            i, j = j, i
+        return int(self.data[self.offsets[i] + j])
+
+    def pairs(self, I, J):
+        """Returns the distances d(I[a], J[a]) as an int64 array."""
+
+        I = np.asarray(I, dtype=np.int64)
+        J = np.asarray(J, dtype=np.int64)
+        low, high = np.minimum(I, J), np.maximum(I, J)
+        diagonal = low == high
+        D = np.zeros(I.shape, dtype=np.int64)
+        D[~diagonal] = self.data[self.offsets[low[~diagonal]] + high[~diagonal]]
+        return D
+
+    def upper_row(self, i):
+        """Returns a view of the distances from i to i+1, ..., n-1."""
+
+        start = self.offsets[i] + i + 1
+        return self.data[start:start + self.n - i - 1]
+
+    def row(self, i):
+        row = np.zeros(self.n, dtype=np.int64)
+        row[:i] = self.data[self.offsets[:i] + i]
+        row[i + 1:] = self.upper_row(i)
+        return row
+
+    def dense(self, dtype=None):
+        D = np.zeros((self.n, self.n), dtype=self.data.dtype if dtype is None else dtype)
+        for i in range(self.n):
+            D[i, i + 1:] = D[i + 1:, i] = self.upper_row(i)
+        return D
+
+    def tolist(self):
+        return self.dense(np.int64).tolist()
+
+    def neighbors(self, k):
+        """Returns the nxk array of k-nearest neighbors, sorted by distance."""
+
+        k = min(k, self.n - 1)
+        neighbors = np.zeros((self.n, max(k, 0)), dtype=np.int64)
+        for i in range(self.n if k > 0 else 0):
+            row = self.row(i).astype(np.float64)
+            row[i] = np.inf
+            nearest = np.argpartition(row, k - 1)[:k]
+            neighbors[i] = nearest[np.argsort(row[nearest], kind="stable")]
+        return neighbors
+
+    def max(self):
+        return int(self.data.max()) if len(self.data) > 0 else 0
+
+
+def instance_points(instance: InstanceTSPLIB):
+    """Returns the nx2 array of points consumed by distance_block."""
+
+    if instance.EDGE_WEIGHT_TYPE == "GEO":
+        return geo_coordinates(instance.NODE_COORD_SECTION)
+    return np.asarray(instance.NODE_COORD_SECTION, dtype=np.float64)[:, :2]
+
+
 def compute_distance_matrix(instance: InstanceTSPLIB):
 
     n = instance.DIMENSION
 
-    # setup distance matrix
-    D = [[0] * n for i in range(0, n)]
-
     # distance functions
     if instance.EDGE_WEIGHT_TYPE == "EXPLICIT":
-        edge_weight_data = instance.EDGE_WEIGHT_SECTION
+        edge_weight_data = np.asarray(instance.EDGE_WEIGHT_SECTION, dtype=np.int64)
 
         if instance.EDGE_WEIGHT_FORMAT == "FULL_MATRIX":
-            idx_value = 0
-            for i in range(0, n):
-                for j in range(0, n):
-                    D[i][j] = edge_weight_data[idx_value]
-                    idx_value += 1
+            rows, cols = np.triu_indices(n, 1)
+            upper = edge_weight_data[:n * n].reshape(n, n)[rows, cols]
 
         elif instance.EDGE_WEIGHT_FORMAT == "UPPER_ROW":
-            idx_value = 0
-            for i in range(0, n):
-                for j in range(i+1, n):
-                    D[j][i] = D[i][j] = edge_weight_data[idx_value]
-                    idx_value += 1
+            upper = edge_weight_data[:n * (n - 1) // 2]
 
         elif instance.EDGE_WEIGHT_FORMAT == "UPPER_DIAG_ROW":
-            idx_value = 0
-            for i in range(0, n):
-                for j in range(i, n):
-                    D[j][i] = D[i][j] = edge_weight_data[idx_value]
-                    idx_value += 1
-
+            rows, cols = np.triu_indices(n)
+            upper = edge_weight_data[:len(rows)][rows != cols]
 
         elif instance.EDGE_WEIGHT_FORMAT == "LOWER_DIAG_ROW":
-            idx_value = 0
-            for i in range(0, n):
-                for j in range(0, i+1):
-                    D[j][i] = D[i][j] = edge_weight_data[idx_value]
-                    idx_value += 1
+            # the lower entry (i, j) is the upper entry (j, i)
+            rows, cols = np.tril_indices(n)
+            strict = rows != cols
+            order = np.lexsort((rows[strict], cols[strict]))
+            upper = edge_weight_data[:len(rows)][strict][order]
         else:
             raise Exception("Inconsistent EDGE_WEIGHT_FORMAT!")
 
+        return SymmetricDistanceMatrix.from_upper(n, upper)
 
     # compute distances from NODE_COORD_SECTION
-    node_data = instance.NODE_COORD_SECTION
-    if instance.EDGE_WEIGHT_TYPE == "EUC_2D":
-        for i in range(0, n):
-            for j in range(i + 1, n):
-                dij = math.sqrt((node_data[i][0] - node_data[j][0])
-                                ** 2 + (node_data[i][1] - node_data[j][1]) ** 2)
-                D[j][i] = D[i][j] = int(dij + 0.5)
-
-    if instance.EDGE_WEIGHT_TYPE == "CEIL_2D":
-        for i in range(0, n):
-            for j in range(i + 1, n):
-                dij = math.sqrt((node_data[i][0] - node_data[j][0])
-                                ** 2 + (node_data[i][1] - node_data[j][1]) ** 2)
-                D[j][i] = D[i][j] = math.ceil(dij)
-
-    if instance.EDGE_WEIGHT_TYPE == "ATT":
-        for i in range(0, n):
-            for j in range(i + 1, n):
-
-                xd = node_data[i][0] - node_data[j][0]
-                yd = node_data[i][1] - node_data[j][1]
-                rij = math.sqrt((xd*xd + yd*yd) / 10.0)
-                tij = int(rij + 0.5)
-                if (tij < rij):
-                    dij = tij + 1
-                else:
-                    dij = tij
-                D[j][i] = D[i][j] = dij
+    if instance.EDGE_WEIGHT_TYPE in ("EUC_2D", "CEIL_2D", "ATT", "GEO"):
+        P = instance_points(instance)
+
+        # the dtype is chosen from a bound, then shrunk to the actual maximum
+        dtype = smallest_dtype(0, distance_bound(instance.EDGE_WEIGHT_TYPE, P))
+        D = SymmetricDistanceMatrix(n, np.zeros(n * (n - 1) // 2, dtype=dtype))
+
+        # strict upper triangle by blocks of rows
+        block = max(1, BLOCK_SIZE // max(n, 1))
+        for i in range(0, n, block):
+            Dij = distance_block(instance.EDGE_WEIGHT_TYPE, P[i:i + block], P[i:])
+            upper = np.arange(Dij.shape[1])[None, :] > np.arange(Dij.shape[0])[:, None]
+            start = D.offsets[i] + i + 1
+            D.data[start:start + np.count_nonzero(upper)] = Dij[upper]
+
+        dtype = smallest_dtype(0, D.max())
+        if dtype != D.data.dtype:
+            D.data = D.data.astype(dtype)
+        return D
+
+    return SymmetricDistanceMatrix(n, np.zeros(n * (n - 1) // 2, dtype=np.uint8))
+
+
+def nearest_neighbors(EDGE_WEIGHT_TYPE, P, k):
+    """Returns an nxk array with the k nearest neighbors of every point of
+    P, sorted by distance.
+
+    The lists are exact for EUC_2D, CEIL_2D and ATT (up to ties of the
+    rounded distances); for GEO, the 2k nearest points in (latitude,
+    longitude) are ranked, which is a good approximation."""
+
+    n = len(P)
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.zeros((n, 0), dtype=np.int64)
+    if EDGE_WEIGHT_TYPE == "GEO":
+        candidates = grid_neighbors(P, min(2 * k, n - 1))
+    else:
+        candidates = grid_neighbors(P, k)
+
+    # sort each list by its actual distance
+    d = distance(EDGE_WEIGHT_TYPE, P[:, None, :], P[candidates])
+    candidates = np.take_along_axis(candidates, np.argsort(d, axis=1, kind="stable"), axis=1)
+    return candidates[:, :k]
+
+
+def grid_neighbors(P, k):
+    """Returns an nxk array with the k nearest (euclidean) neighbors of every
+    point of P, in no particular order.
+
+    Points are bucketed in a uniform grid of about k points per cell, and
+    the cells around each query cell are scanned in growing rings until the
+    k-th nearest candidate is closer than the unscanned cells."""
+
+    n = len(P)
+
+    # uniform grid
+    low = P.min(axis=0)
+    span = np.ptp(P, axis=0)
+    cell = max(float(span.max()) / max(1, int(math.sqrt(n / k))), 1e-9)
+    gx, gy = (span // cell).astype(np.int64) + 1
+    cx = np.minimum(((P[:, 0] - low[0]) // cell).astype(np.int64), gx - 1)
+    cy = np.minimum(((P[:, 1] - low[1]) // cell).astype(np.int64), gy - 1)
+
+    # points sorted by cell; cells of a grid column are contiguous
+    cell_id = cx * gy + cy
+    order = np.argsort(cell_id, kind="stable")
+    starts = np.searchsorted(cell_id[order], np.arange(gx * gy + 1))
+
+    neighbors = np.zeros((n, k), dtype=np.int64)
+    for c in np.unique(cell_id):
+        x, y = divmod(int(c), int(gy))
+        pending = order[starts[c]:starts[c + 1]]
+
+        r = 1
+        while len(pending) > 0:
+            x0, x1 = max(0, x - r), min(gx - 1, x + r)
+            y0, y1 = max(0, y - r), min(gy - 1, y + r)
+            candidates = np.concatenate([order[starts[i * gy + y0]:starts[i * gy + y1 + 1]]
+                                         for i in range(x0, x1 + 1)])
+            covers_all = x0 == 0 and y0 == 0 and x1 == gx - 1 and y1 == gy - 1
+            if len(candidates) <= k and not covers_all:
+                r += 1
+                continue
+
+            d2 = ((P[pending, None, :] - P[None, candidates, :]) ** 2).sum(axis=2)
+            d2[pending[:, None] == candidates[None, :]] = np.inf
+            nearest = np.argpartition(d2, k - 1, axis=1)[:, :k]
+            kth = np.take_along_axis(d2, nearest, axis=1).max(axis=1)
+
+            # distance from each query to the unscanned part of the plane
+            Q = P[pending]
+            margin = np.full(len(pending), np.inf)
+            if x0 > 0:
+                margin = np.minimum(margin, Q[:, 0] - (low[0] + x0 * cell))
+            if x1 < gx - 1:
+                margin = np.minimum(margin, low[0] + (x1 + 1) * cell - Q[:, 0])
+            if y0 > 0:
+                margin = np.minimum(margin, Q[:, 1] - (low[1] + y0 * cell))
+            if y1 < gy - 1:
+                margin = np.minimum(margin, low[1] + (y1 + 1) * cell - Q[:, 1])
+
+            done = kth <= margin * margin
+            neighbors[pending[done]] = candidates[nearest[done]]
+            pending = pending[~done]
+            r += 1
+
+    return neighbors
+
+
+class LazyDistanceMatrix(object):
+    """Distance matrix of a coordinate-based instance that is never
+    materialized. Distances are computed on demand from the coordinates and
+    the last cache_rows rows are kept in an LRU cache.
+
+    It has the same lookup interface of SymmetricDistanceMatrix (d(i, j),
+    D[i, j], row(i), D[i]), plus k-nearest neighbor candidate lists."""
+
+    def __init__(self, instance: InstanceTSPLIB, cache_rows=256) -> None:
+        self.n = instance.DIMENSION
+        self.EDGE_WEIGHT_TYPE = instance.EDGE_WEIGHT_TYPE
+        self.P = instance_points(instance)
+        self.cache_rows = cache_rows
+        self.rows = OrderedDict()
+        self.candidates = {}
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.d(*key)
+        return self.row(key)
+
+    def d(self, i, j):
+        if i == j:
+            return 0
+        if i in self.rows:
+            return int(self.rows[i][j])
+        if j in self.rows:
+            return int(self.rows[j][i])
+        return int(distance_block(self.EDGE_WEIGHT_TYPE, self.P[i:i + 1], self.P[j:j + 1])[0, 0])
+
+    def pairs(self, I, J):
+        """Returns the distances d(I[a], J[a]) as an int64 array."""
+
+        I = np.asarray(I, dtype=np.int64)
+        J = np.asarray(J, dtype=np.int64)
+        D = distance(self.EDGE_WEIGHT_TYPE, self.P[I], self.P[J])
+        D[I == J] = 0
+        return D
+
+    def row(self, i):
+        if i in self.rows:
+            self.rows.move_to_end(i)
+            return self.rows[i]
+
+        row = distance_block(self.EDGE_WEIGHT_TYPE, self.P[i:i + 1], self.P)[0]
+        row[i] = 0
+        row.flags.writeable = False
+        self.rows[i] = row
+        if len(self.rows) > self.cache_rows:
+            self.rows.popitem(last=False)
+        return row
+
+    def neighbors(self, k):
+        """Returns the (memoized) nxk array of k-nearest neighbors."""
+
+        if k not in self.candidates:
+            self.candidates[k] = nearest_neighbors(self.EDGE_WEIGHT_TYPE, self.P, k)
+        return self.candidates[k]
+
+    def tolist(self):
+        return [self.row(i).tolist() for i in range(self.n)]
+
+
+class DummyDepotMatrix(object):
+    """Read-only view of a distance matrix D augmented with m dummy depots,
+    which are at distance 0 from every vertex. Depots take the first m
+    indices if first is True, or the last m ones otherwise.
+
+    Nothing is copied, so D can be shared between solves."""
+
+    __slots__ = ("D", "n", "m", "offset")
 
-    if instance.EDGE_WEIGHT_TYPE == "GEO":
-        PI = 3.141592
-        RRR = 6378.388
-        for i in range(0, n):
-            for j in range(i + 1, n):
-
-                # compute lat and lng of i
-                # deg = int(node_data[i][0] + 0.5)
-                deg = int(node_data[i][0])
-                min = node_data[i][0] - deg
-                latitudei = PI * (deg + 5.0 * min / 3.0) / 180.0
-                #deg = int(node_data[i][1] + 0.5)
-                deg = int(node_data[i][1])
-                min = node_data[i][1] - deg
-                longitudei = PI * (deg + 5.0 * min / 3.0) / 180.0
-
-                # compute lat and lng of j
-                # deg = int(node_data[j][0] + 0.5)
-                deg = int(node_data[j][0])
-                min = node_data[j][0] - deg
-                latitudej = PI * (deg + 5.0 * min / 3.0) / 180.0
-                # deg = int(node_data[j][1] + 0.5)
-                deg = int(node_data[j][1])
-                min = node_data[j][1] - deg
-                longitudej = PI * (deg + 5.0 * min / 3.0) / 180.0
-
-                # compute distance between i and j
-                q1 = math.cos(longitudei - longitudej)
-                q2 = math.cos(latitudei - latitudej)
-                q3 = math.cos(latitudei + latitudej)
-                dij = int(RRR * math.acos(0.5*((1.0+q1)*q2 - (1.0-q1)*q3)) + 1.0)
-
-                D[j][i] = D[i][j] = dij
-
-    return D
-            
-        
+    def __init__(self, D, m, first=True) -> None:
+        self.D = D
+        self.m = m
+        self.n = len(D) + m
+
+        # index of the first actual vertex
+        self.offset = m if first else 0
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.d(*key)
+        return self.row(key)
+
+    def is_depot(self, i):
+        return (i < self.offset) | (i >= self.offset + self.n - self.m)
 
+    def d(self, i, j):
+        if self.is_depot(i) or self.is_depot(j):
+            return 0
+        return int(self.D[i - self.offset, j - self.offset])
 
-"""Returns an nxn distance matrix of integers, the list
-of coordinates of the nodes (if possible) for plotting, and the EDGE_WEIGHT_TYPE"""
+    def pairs(self, I, J):
+        """Returns the distances d(I[a], J[a]) as an int64 array."""
 
+        I = np.asarray(I, dtype=np.int64)
+        J = np.asarray(J, dtype=np.int64)
+        actual = ~(self.is_depot(I) | self.is_depot(J))
+        D = np.zeros(I.shape, dtype=np.int64)
+        D[actual] = self.D.pairs(I[actual] - self.offset, J[actual] - self.offset)
+        return D
 
-def read_TSPLIB_instance(input_file):
+    def row(self, i):
+        row = np.zeros(self.n, dtype=np.int64)
+        if not self.is_depot(i):
+            row[self.offset:self.offset + self.n - self.m] = self.D[i - self.offset]
+        return row
+
+    def dense(self):
+        D = np.zeros((self.n, self.n), dtype=np.int64)
+        actual = slice(self.offset, self.offset + self.n - self.m)
+        D[actual, actual] = np.asarray(self.D)
+        return D
+
+
+# shared memory segments attached by this process, by name
+attached_segments = {}
+
+
+def share_distance_matrix(D: SymmetricDistanceMatrix):
+    """Copies the packed data of D into a new shared memory segment. Returns
+    the segment (its creator must close and unlink it) and a picklable
+    handle for attach_distance_matrix."""
+
+    data = np.asarray(D.data)
+    segment = shared_memory.SharedMemory(create=True, size=max(1, data.nbytes))
+    np.ndarray(data.shape, dtype=data.dtype, buffer=segment.buf)[:] = data
+    return segment, (segment.name, D.n, data.dtype.str)
+
+
+def attach_distance_matrix(handle):
+    """Returns a read-only SymmetricDistanceMatrix over the shared memory
+    segment of handle, without copying it. Each segment is attached once
+    per process."""
+
+    name, n, dtype = handle
+    if name not in attached_segments:
+        attached_segments[name] = shared_memory.SharedMemory(name=name)
+    data = np.ndarray((n * (n - 1) // 2,), dtype=dtype, buffer=attached_segments[name].buf)
+    data.flags.writeable = False
+    return SymmetricDistanceMatrix(n, data)
+
+
+# folder of the cache, next to the folder of the instances
+CACHE_SUFFIX = "_cache"
+
+# header fields of InstanceTSPLIB stored in the cache
+CACHED_FIELDS = ["DIMENSION", "EDGE_WEIGHT_TYPE", "EDGE_WEIGHT_FORMAT", "NODE_COORD_TYPE",
+                 "DISPLAY_DATA_TYPE", "NODE_COORD_SECTION", "DISPLAY_DATA_SECTION"]
+
+
+def instance_digest(input_file):
+    """Returns the SHA-1 of the content of input_file."""
+
+    with open(input_file, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def cache_entry(input_file):
+    """Returns the path (without extension) of the cache entry of input_file,
+    keyed by the SHA-1 of its content."""
+
+    digest = instance_digest(input_file)
+    folder = os.path.dirname(os.path.abspath(input_file))
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(folder + CACHE_SUFFIX, "{}-{}".format(name, digest))
+
+
+def load_cached_instance(entry):
+    """Returns the cached (D, I) pair of entry, or None if it is not cached.
+    The packed data of D is memory-mapped read-only and I has no
+    EDGE_WEIGHT_SECTION, since its values are already in D."""
+
+    if not (os.path.exists(entry + ".npy") and os.path.exists(entry + ".json")):
+        return None
+
+    try:
+        with open(entry + ".json", "r") as file:
+            fields = json.load(file)
+        data = np.load(entry + ".npy", mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+    n = fields["DIMENSION"]
+    if data.ndim != 1 or len(data) != n * (n - 1) // 2:
+        return None
+    D = SymmetricDistanceMatrix(n, data)
+
+    I = InstanceTSPLIB()
+    I.set_DIMENSION(fields["DIMENSION"])
+    I.set_EDGE_WEIGHT_TYPE(fields["EDGE_WEIGHT_TYPE"])
+    I.set_EDGE_WEIGHT_FORMAT(fields["EDGE_WEIGHT_FORMAT"])
+    I.set_NODE_COORD_TYPE(fields["NODE_COORD_TYPE"])
+    I.NODE_COORD_SECTION = fields["NODE_COORD_SECTION"]
+    I.set_DISPLAY_DATA_TYPE(fields["DISPLAY_DATA_TYPE"])
+    if I.DISPLAY_DATA_TYPE != "COORD_DISPLAY":
+        I.DISPLAY_DATA_SECTION = fields["DISPLAY_DATA_SECTION"]
+
+    return D, I
+
+
+def store_cached_instance(entry, D, I: InstanceTSPLIB):
+    """Stores the (D, I) pair in entry and removes the stale entries of the
+    same instance. Files are written to a temporary name and then renamed, so
+    concurrent readers never see partial entries."""
+
+    folder, name = os.path.split(entry)
+    instance_name = name.rsplit("-", 1)[0]
+    try:
+        os.makedirs(folder, exist_ok=True)
+
+        tmp = "{}.{}.tmp".format(entry, os.getpid())
+        with open(tmp + ".npy", "wb") as file:
+            np.save(file, D.data)
+        with open(tmp + ".json", "w") as file:
+            json.dump({field: np.asarray(getattr(I, field)).tolist() if field.endswith("_SECTION")
+                       else getattr(I, field) for field in CACHED_FIELDS}, file)
+        os.replace(tmp + ".npy", entry + ".npy")
+        os.replace(tmp + ".json", entry + ".json")
+
+        for stale in os.listdir(folder):
+            if stale.rsplit("-", 1)[0] == instance_name and not stale.startswith(name):
+                os.remove(os.path.join(folder, stale))
+    except OSError:
+        # the cache is an optimization, a read-only folder is not an error
+        pass
+
+
+"""Returns an nxn SymmetricDistanceMatrix of integers, the list
+of coordinates of the nodes (if possible) for plotting, and the EDGE_WEIGHT_TYPE.
+If cache is True, the pair is loaded from (or stored in) the on-disk cache.
+If lazy is True, coordinate-based instances get a LazyDistanceMatrix instead."""
+
+
+def read_TSPLIB_instance(input_file, cache=True, bulk=True, lazy=False):
+
+    # coordinate-based instances can skip the matrix
+    if lazy:
+        I = parse_TSPLIB_instance_bulk(input_file) if bulk else parse_TSPLIB_instance(input_file)
+        if I.EDGE_WEIGHT_TYPE in ("EUC_2D", "CEIL_2D", "ATT", "GEO"):
+            return LazyDistanceMatrix(I), I
+
+    if cache:
+        entry = cache_entry(input_file)
+        cached = load_cached_instance(entry)
+        if cached is not None:
+            return cached
+
+    if bulk:
+        I = parse_TSPLIB_instance_bulk(input_file)
+    else:
+        I = parse_TSPLIB_instance(input_file)
+    D = compute_distance_matrix(I)
+
+    if cache:
+        store_cached_instance(entry, D, I)
+
+    return D, I
+
+
+def parse_TSPLIB_instance(input_file):
 
     I = InstanceTSPLIB()
 
@@ -216,11 +715,81 @@ def read_TSPLIB_instance(input_file):
             arr_line = line.split(":")
             I.set_EDGE_WEIGHT_FORMAT(arr_line[1].strip())
 
+    file.close()
+    return I
 
-    D = compute_distance_matrix(I)
 
-    file.close()
-    return D, I
+# lines starting a data section (or ending the file)
+SECTION_PATTERN = re.compile(r"^[ \t]*(NODE_COORD_SECTION|DISPLAY_DATA_SECTION|EDGE_WEIGHT_SECTION|EOF)\b.*$",
+                             re.MULTILINE)
+
+
+def parse_section(data, dtype):
+    """Returns the values of a data section as a flat array of dtype,
+    tokenized in a single pass."""
+
+    # old numpy versions only warn on unmatched data
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(data, dtype=dtype, sep=" ")
+        except (ValueError, DeprecationWarning):
+            raise Exception("Inconsistent data section!")
+
+
+def parse_TSPLIB_instance_bulk(input_file):
+    """Same as parse_TSPLIB_instance, but every data section is read at once
+    into a typed array. EDGE_WEIGHT_SECTION is a flat int64 array (in the
+    order given by EDGE_WEIGHT_FORMAT) and the coordinate sections are
+    float64 arrays with one row per node."""
+
+    I = InstanceTSPLIB()
+
+    with open(input_file, "r") as file:
+        text = file.read()
+
+    # text is split in [header, keyword, data, keyword, data, ...]
+    blocks = SECTION_PATTERN.split(text)
+
+    for line in blocks[0].splitlines():
+        arr_line = line.split(":", 1)
+        if len(arr_line) != 2:
+            continue
+        key = arr_line[0].strip()
+        value = arr_line[1].strip()
+
+        if key == "DIMENSION":
+            I.set_DIMENSION(int(value))
+        elif key == "EDGE_WEIGHT_TYPE":
+            I.set_EDGE_WEIGHT_TYPE(value)
+        elif key == "DISPLAY_DATA_TYPE":
+            I.set_DISPLAY_DATA_TYPE(value)
+        elif key == "EDGE_WEIGHT_FORMAT":
+            I.set_EDGE_WEIGHT_FORMAT(value)
+
+    for data_type, data in zip(blocks[1::2], blocks[2::2]):
+        if data_type == "EOF":
+            break
+
+        if data_type == "EDGE_WEIGHT_SECTION":
+            if I.EDGE_WEIGHT_TYPE == "EXPLICIT":
+                I.EDGE_WEIGHT_SECTION = parse_section(data, np.int64)
+            continue
+
+        # drop the node numbers of the coordinate sections
+        values = parse_section(data, np.float64)
+        values = values.reshape(I.DIMENSION, -1)[:, 1:]
+
+        if data_type == "NODE_COORD_SECTION":
+            I.NODE_COORD_SECTION = values
+            I.set_NODE_COORD_TYPE("TWOD_COORDS")
+            I.set_DISPLAY_DATA_TYPE("COORD_DISPLAY")
+        else:
+            if I.DISPLAY_DATA_TYPE == "COORD_DISPLAY" or I.DISPLAY_DATA_TYPE == "NO_DISPLAY":
+                raise Exception("Inconsistent DISPLAY_DATA!!")
+            I.DISPLAY_DATA_SECTION = values
+
+    return I
 
 
 # test code
@@ -5,30 +5,43 @@ import json
 import math
 import os
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ResultStore import ResultStore, run_key
+from TSPLIBReader import attach_distance_matrix, instance_digest, read_TSPLIB_instance, share_distance_matrix
+from main import run
+
+
+# experiment grid: every formulation is run for every instance and m
+experiment = {
+    "instances": ["dantzig42",
+                  "swiss42",
+                  "att48",
+                  "gr48",
+                  "hk48"
+                  #  "kroA100",
+                  #  "kroB100",
+                  #  "kroC100",
+                  #  "kroD100",
+                  #  "kroE100"
+                  ],
+    "m": [3, 5],
+    # name: parameters of the formulation, in the order of the columns of the results
+    "formulations": {"karabulut": {"IP": "karabulut", "IQP": False},
+                     "IQP1": {"IP": "IP1", "IQP": True},
+                     "ILP1": {"IP": "IP1", "IQP": False},
+                     "IQP2": {"IP": "IP2", "IQP": True},
+                     "ILP2": {"IP": "IP2", "IQP": False}}
+}
 
-
-mvals = [3, 5]
-
-instances = ["dantzig42",
-             "swiss42",
-             "att48",
-             "gr48",
-             "hk48"
-            #  "kroA100",
-            #  "kroB100",
-            #  "kroC100",
-            #  "kroD100",
-            #  "kroE100"
-             ]
-
-jsoninputname = "tmpinput.json"
 output_folder = "may_experiments_tight"
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
 output_path = "experiments.csv"
-with open("{}/{}".format(output_folder, output_path), "a") as writer:
-    # IP1IQP			IP1ILP			IP2IQP			IP2ILP
-    writer.write("instance,n,m,U,f,t,g,f,t,g,f,t,g,f,t,g\n")
+store_path = "experiments.db"
+
+# gurobi threads of every job, and jobs run at the same time
+threads = 4
+workers = max(1, (os.cpu_count() or 1) // threads)
 
 basic_conf = {
     "L": 2,
@@ -40,9 +53,10 @@ basic_conf = {
     "TimeLimit": 7200,
     "presolve": -1,
     "MIPGap": 0,
-    "outputFlag": 1
+    "outputFlag": 0,  # logs of parallel jobs would be interleaved
+    "Threads": threads
 }
-          
+
 
 def parse_input_file(input_file):
     with open(input_file, 'r') as f:
@@ -50,98 +64,136 @@ def parse_input_file(input_file):
         return data
 
 
-for ins in instances:
-    n = int(re.findall(r'\d+', ins)[0])
-
-    for m in mvals:
-        U = int(math.ceil(n / m))
-
-        basic_conf["m"] = m
-        basic_conf["U"] = U
-        basic_conf["instance"] = "TSPLIB/{}.tsp".format(ins)
-
-        curr_line = "{},{},{},{},".format(ins, n, m, U)
-
-         # karabulut
-        outputsolver = "{}/karabulut-{}-{}.json".format(output_folder, ins, m)
-        conf = basic_conf.copy()
-        conf["IP"] = "karabulut"
-        conf["IQP"] = False
-        conf["outputFile"] = outputsolver
-
-        with open(jsoninputname, "w") as write_file:
-            json.dump(conf, write_file, indent=4)
-        os.system("python main.py {}".format(jsoninputname))
-
-        jsonoutput = parse_input_file(outputsolver)
-        objval = jsonoutput["OUTPUT"]["objval"]
-        timeinc = jsonoutput["OUTPUT"]["timeinc"]
-        curr_line += "{},{},".format(objval, timeinc)
-
-        # IQP1
-        outputsolver = "{}/IQP1-{}-{}.json".format(output_folder, ins, m)
-        conf = basic_conf.copy()
-        conf["IP"] = "IP1"
-        conf["IQP"] = True
-        conf["outputFile"] = outputsolver
-
-        with open(jsoninputname, "w") as write_file:
-            json.dump(conf, write_file, indent=4)
-        os.system("python main.py {}".format(jsoninputname))
-
-        jsonoutput = parse_input_file(outputsolver)
-        objval = jsonoutput["OUTPUT"]["objval"]
-        timeinc = jsonoutput["OUTPUT"]["timeinc"]
-        curr_line += "{},{},".format(objval, timeinc)
-
-        # ILP1
-        outputsolver = "{}/ILP1-{}-{}.json".format(output_folder, ins, m)
-        conf = basic_conf.copy()
-        conf["IP"] = "IP1"
-        conf["IQP"] = False
-        conf["outputFile"] = outputsolver
-
-        with open(jsoninputname, "w") as write_file:
-            json.dump(conf, write_file, indent=4)
-        os.system("python main.py {}".format(jsoninputname))
-
-        jsonoutput = parse_input_file(outputsolver)
-        objval = jsonoutput["OUTPUT"]["objval"]
-        timeinc = jsonoutput["OUTPUT"]["timeinc"]
-        curr_line += "{},{},".format(objval, timeinc)
-
-        # IQP2
-        outputsolver = "{}/IQP2-{}-{}.json".format(output_folder, ins, m)
-        conf = basic_conf.copy()
-        conf["IP"] = "IP2"
-        conf["IQP"] = True
-        conf["outputFile"] = outputsolver
-
-        with open(jsoninputname, "w") as write_file:
-            json.dump(conf, write_file, indent=4)
-        os.system("python main.py {}".format(jsoninputname))
-
-        jsonoutput = parse_input_file(outputsolver)
-        objval = jsonoutput["OUTPUT"]["objval"]
-        timeinc = jsonoutput["OUTPUT"]["timeinc"]
-        curr_line += "{},{},".format(objval, timeinc)
-
-        # ILP2
-        outputsolver = "{}/ILP2-{}-{}.json".format(output_folder, ins, m)
-        conf = basic_conf.copy()
-        conf["IP"] = "IP2"
-        conf["IQP"] = False
-        conf["outputFile"] = outputsolver
-
-        with open(jsoninputname, "w") as write_file:
-            json.dump(conf, write_file, indent=4)
-        os.system("python main.py {}".format(jsoninputname))
-
-        jsonoutput = parse_input_file(outputsolver)
-        objval = jsonoutput["OUTPUT"]["objval"]
-        timeinc = jsonoutput["OUTPUT"]["timeinc"]
-        curr_line += "{},{}\n".format(objval, timeinc)
-
-        # write results of all solvers
-        with open("{}/{}".format(output_folder, output_path), "a") as results_file:
-            results_file.write(curr_line)
+def experiment_jobs(experiment):
+    """Configurations of the experiment grid, as a dict (instance, m): list
+    of (formulation name, configuration)."""
+
+    jobs = {}
+    for ins in experiment["instances"]:
+        n = int(re.findall(r'\d+', ins)[0])
+
+        for m in experiment["m"]:
+            U = int(math.ceil(n / m))
+
+            jobs[ins, m] = []
+            for name, params in experiment["formulations"].items():
+                conf = basic_conf.copy()
+                conf.update(params)
+                conf["m"] = m
+                conf["U"] = U
+                conf["instance"] = "TSPLIB/{}.tsp".format(ins)
+                conf["outputFile"] = "{}/{}-{}-{}.json".format(output_folder, name, ins, m)
+                jobs[ins, m].append((name, conf))
+
+    return jobs
+
+
+def run_job(conf, handle):
+    """Runs a configuration in a worker process, over the shared distance
+    matrix of handle (or reading the instance, if handle is None). The
+    output file is written atomically by the formulation, so it is either
+    complete or missing."""
+
+    run(conf, attach_distance_matrix(handle) if handle is not None else None)
+    return parse_input_file(conf["outputFile"])
+
+
+def experiment_keys(jobs):
+    """Run keys of the jobs, as a dict (instance, m, formulation name): key."""
+
+    digests = {}
+    keys = {}
+    for cell, cell_jobs in jobs.items():
+        for name, conf in cell_jobs:
+            if conf["instance"] not in digests:
+                digests[conf["instance"]] = instance_digest(conf["instance"])
+            keys[cell + (name,)] = run_key(conf, digests[conf["instance"]])
+    return keys
+
+
+def run_experiment(experiment, workers=workers):
+    """Runs every configuration of the experiment in a pool of workers and
+    records it in the results store. Runs that already finished (with the
+    same configuration and instance content) are skipped, so an interrupted
+    campaign resumes where it stopped. The csv table is written at the end."""
+
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    store = ResultStore("{}/{}".format(output_folder, store_path))
+    jobs = experiment_jobs(experiment)
+    keys = experiment_keys(jobs)
+    pending = [(cell, name, conf) for cell, cell_jobs in jobs.items() for name, conf in cell_jobs
+               if store.output(keys[cell + (name,)]) is None]
+    print("{} of {} runs pending".format(len(pending), len(keys)))
+
+    # distance matrices are published once and shared (read-only) by the workers,
+    # lazy runs compute their distances from the coordinates instead
+    segments = {}
+    handles = {}
+    try:
+        for cell, name, conf in pending:
+            if conf["instance"] not in segments and not ("lazy" in conf and conf["lazy"]):
+                D, I = read_TSPLIB_instance(conf["instance"])
+                segments[conf["instance"]], handles[conf["instance"]] = share_distance_matrix(D)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for cell, name, conf in pending:
+                store.start(keys[cell + (name,)], name, conf)
+                handle = None if "lazy" in conf and conf["lazy"] else handles[conf["instance"]]
+                futures[executor.submit(run_job, conf, handle)] = (cell, name, conf)
+
+            for future in as_completed(futures):
+                cell, name, conf = futures[future]
+                key = keys[cell + (name,)]
+                try:
+                    store.finish(key, name, conf, future.result())
+                    print("{} {} m={} finished".format(name, *cell))
+                except Exception as e:
+                    # a failed job does not stop the other ones
+                    store.fail(key, name, conf, str(e))
+                    print("{} {} m={} failed: {}".format(name, *cell, e))
+    finally:
+        for segment in segments.values():
+            segment.close()
+            segment.unlink()
+        store.close()
+
+    write_results(experiment)
+
+
+def write_results(experiment):
+    """Writes the csv table of the experiment from the results store, one
+    row per (instance, m). Runs that did not finish have empty columns."""
+
+    store = ResultStore("{}/{}".format(output_folder, store_path))
+    jobs = experiment_jobs(experiment)
+    keys = experiment_keys(jobs)
+
+    results_path = "{}/{}".format(output_folder, output_path)
+    with open(results_path + ".tmp", "w") as writer:
+        columns = ",".join("f,t" for _ in experiment["formulations"])
+        writer.write("instance,n,m,U,{}\n".format(columns))
+
+        for (ins, m), cell_jobs in jobs.items():
+            curr_line = "{},{},{},{}".format(ins, int(re.findall(r'\d+', ins)[0]), m, cell_jobs[0][1]["U"])
+            for name, conf in cell_jobs:
+                jsonoutput = store.output(keys[ins, m, name])
+                if jsonoutput is None:
+                    curr_line += ",,"
+                else:
+                    curr_line += ",{},{}".format(jsonoutput["OUTPUT"]["objval"], jsonoutput["OUTPUT"]["timeinc"])
+            writer.write(curr_line + "\n")
+
+    os.replace(results_path + ".tmp", results_path)
+    store.close()
+    print("results printed in {}".format(results_path))
+
+
+if __name__ == '__main__':
+    # "python TSPLIB_runner.py csv" only writes the csv table of the finished runs
+    if len(sys.argv) > 1 and sys.argv[1] == "csv":
+        write_results(experiment)
+    else:
+        run_experiment(experiment)
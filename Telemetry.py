@@ -0,0 +1,106 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import json
+import math
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from gurobipy import GRB
+
+
+class SolveTelemetry(object):
+    """Record of a single solve.
+
+    convergence keeps the [time, objval] pairs of the incumbents (times are
+    solver runtimes), t_inc the time of the last one, and times the
+    seconds spent reading the matrix, building the model and solving it.
+    lower is the lower bound of the optimum computed before the solve, if
+    any (see LowerBound), and eliminated the fraction of the arcs removed
+    from the model by reduced_cost_elimination.
+
+    If stream is the path of a JSONL file, every event is appended to it as
+    one line tagged with the id of the solve: the start (with info), the
+    incumbents (MIPSOL) and, at most once per interval seconds, the progress
+    of the search (MIP: incumbent, bound, gap, nodes and simplex
+    iterations), and a summary at the end (with the error of a solve that
+    raised one). Progress events are only
+    streamed, never kept in memory."""
+
+    def __init__(self, stream=None, info=None, interval=1.0) -> None:
+        self.id = uuid.uuid4().hex
+        self.convergence = []
+        self.objval = math.inf
+        self.t_inc = math.inf
+        self.times = {"matrix": 0.0, "build": 0.0, "solve": 0.0}
+        self.cached = False
+        self.lower = None
+        self.eliminated = None
+        self.interval = interval
+        self.last_progress = -math.inf
+
+        self.file = None
+        if stream is not None:
+            folder = os.path.dirname(os.path.abspath(stream))
+            os.makedirs(folder, exist_ok=True)
+            self.file = open(stream, "a")
+        self.event("start", info=info)
+
+    def event(self, name: str, **fields):
+        if self.file is None:
+            return
+        fields.update({"solve": self.id, "event": name, "clock": time.time()})
+        self.file.write(json.dumps(fields) + "\n")
+        self.file.flush()
+
+    @contextmanager
+    def timer(self, name: str):
+        """Adds the seconds spent in the block to times[name]."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] += time.perf_counter() - start
+
+    def callback(self, model, where):
+        """Records the MIP and MIPSOL callbacks of a gurobi solve."""
+
+        if where == GRB.Callback.MIPSOL:
+            this_objval = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+            this_time = model.cbGet(GRB.Callback.RUNTIME)
+            if self.objval != this_objval:
+                self.objval = this_objval
+                self.t_inc = this_time
+                self.convergence.append([this_time, this_objval])
+
+            self.event("MIPSOL", time=this_time, objval=this_objval,
+                       bound=model.cbGet(GRB.Callback.MIPSOL_OBJBND), nodes=model.cbGet(GRB.Callback.MIPSOL_NODCNT))
+
+        elif where == GRB.Callback.MIP and self.file is not None:
+            this_time = model.cbGet(GRB.Callback.RUNTIME)
+            if this_time - self.last_progress < self.interval:
+                return
+            self.last_progress = this_time
+
+            incumbent = model.cbGet(GRB.Callback.MIP_OBJBST)
+            bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+            gap = abs(incumbent - bound) / abs(incumbent) if 0 < abs(incumbent) < GRB.INFINITY else None
+            self.event("MIP", time=this_time, objval=incumbent, bound=bound, gap=gap,
+                       nodes=model.cbGet(GRB.Callback.MIP_NODCNT), iterations=model.cbGet(GRB.Callback.MIP_ITRCNT))
+
+    def close(self, **summary):
+        """Streams the summary of the solve and closes the stream."""
+
+        self.event("end", times=self.times, cached=self.cached, t_inc=self.t_inc, lower=self.lower,
+                   eliminated=self.eliminated, **summary)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def abort(self, error):
+        """Streams the end of a solve that raised error and closes the stream."""
+
+        self.close(error=repr(error))
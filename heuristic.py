@@ -0,0 +1,190 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import math
+import os
+import time
+
+from Heuristics import iterated_local_search
+from LocalSearch import post_optimize
+from LowerBound import held_karp_bound
+from RoutePool import RoutePool, recombine
+from TSPLIBReader import read_TSPLIB_instance
+
+
+def solve(file_instance: str, m: int, L: int, U: int, R=[], BestObjStop=None, TimeLimit=5, objective="minsum",
+          variant="CP", iterations=1000, seed=0, localSearch=False, routePool=False, lowerBound=False,
+          lazy=False, D=None):
+    start_time = time.perf_counter()
+
+    if D is None:
+        D, I = read_TSPLIB_instance(file_instance, lazy=lazy)
+    n = len(D)
+    if U > n:
+        U = n
+
+    if L > U:
+        L = 2
+
+    # lower bound of the optimum, the search stops once it is reached
+    lower = None
+    if lowerBound:
+        lower = held_karp_bound(D, m, variant, objective)
+        if BestObjStop is None or lower > BestObjStop:
+            BestObjStop = lower
+
+    # routes of every split, recombined after the search
+    pool = RoutePool(D, variant, R) if routePool else None
+
+    tours, fitness, t_inc, convergence = iterated_local_search(D, m, L, U, R, variant, objective,
+                                                               TimeLimit=TimeLimit, iterations=iterations,
+                                                               BestObjStop=BestObjStop, seed=seed, pool=pool)
+    if tours is None:
+        tours = []
+    runtime = time.perf_counter() - start_time
+
+    # there is no lower bound to measure the gap, unless it is computed
+    gap = math.inf
+    if lower is not None and fitness != 0:
+        gap = max(float(fitness) - lower, 0) / abs(float(fitness))
+
+    # post-optimization of the returned paths
+    improved = None
+    if localSearch:
+        improved = post_optimize(D, tours, L, U, R, variant, objective)
+
+    # recombination of the routes of the splits
+    recombined = None
+    if pool is not None:
+        # within the time left of the run
+        remaining = max(TimeLimit - (time.perf_counter() - start_time), 0)
+        if improved is not None:
+            pool.add_routes(improved[0])
+        recombined = recombine(pool, n, m, L, U, objective, remaining)
+
+    return tours, float(fitness), runtime, gap, t_inc, convergence, improved, recombined, lower, L, U
+
+
+def run_heuristic(conf, D=None):
+
+    inputparams = {"IP": conf["IP"]}  # register of input parameters
+
+    output_file = conf["outputFile"]
+    inputparams["outputFile"] = output_file
+    if os.path.exists(output_file):
+        os.remove(output_file)
+
+    file_instance = conf["instance"]
+    inputparams["instance"] = file_instance
+
+    m = conf["m"]
+    inputparams["m"] = m
+
+    L = conf["L"]
+    if L < 2:
+        L = 2
+    inputparams["L"] = L
+
+    U = conf["U"]
+    inputparams["U"] = U
+
+    R = conf["R"]
+    inputparams["R"] = R
+
+    objective = conf["objective"]
+    inputparams["objective"] = objective
+
+    variant = conf["variant"]
+    inputparams["variant"] = variant
+
+    BestObjStop = None
+    if "BestObjStop" in conf:
+        BestObjStop = conf["BestObjStop"]
+        inputparams["BestObjStop"] = BestObjStop
+
+    TimeLimit = conf["TimeLimit"]
+    inputparams["TimeLimit"] = TimeLimit
+
+    iterations = 1000
+    if "iterations" in conf:
+        iterations = conf["iterations"]
+        inputparams["iterations"] = iterations
+
+    seed = 0
+    if "seed" in conf:
+        seed = conf["seed"]
+        inputparams["seed"] = seed
+
+    lowerBound = False
+    if "lowerBound" in conf:
+        lowerBound = conf["lowerBound"]
+        inputparams["lowerBound"] = lowerBound
+
+    routePool = False
+    if "routePool" in conf:
+        routePool = conf["routePool"]
+        inputparams["routePool"] = routePool
+
+    localSearch = False
+    if "localSearch" in conf:
+        localSearch = conf["localSearch"]
+        inputparams["localSearch"] = localSearch
+
+    lazy = False
+    if "lazy" in conf:
+        lazy = conf["lazy"]
+        inputparams["lazy"] = lazy
+
+    tours, fitness, runtime, gap, t_inc, convergence, improved, recombined, lower, L, U = solve(
+        file_instance=file_instance, m=m, L=L, U=U, R=R, BestObjStop=BestObjStop, TimeLimit=TimeLimit,
+        objective=objective, variant=variant, iterations=iterations, seed=seed, localSearch=localSearch,
+        routePool=routePool, lowerBound=lowerBound, lazy=lazy, D=D)
+    inputparams["L"] = L
+    inputparams["U"] = U
+
+    with open(output_file + ".tmp", "w") as writer:
+        ignored = conf.copy()
+
+        output_dict = {}
+        # input configuration
+        INPUT_dict = {}
+        INPUT_default = []
+        for key, value in inputparams.items():
+            INPUT_dict[key] = value
+            if ignored[key] != value:
+                INPUT_default.append(key)
+            else:
+                del ignored[key]
+
+        if len(INPUT_default) > 0:
+            INPUT_dict["default"] = INPUT_default
+        output_dict["INPUT"] = INPUT_dict
+
+        # print ignored parameters
+        if len(ignored) > 0:
+            output_dict["IGNORED_PARAMETERS"] = ignored
+
+        OUTPUT_dict = {}
+        # output
+        OUTPUT_dict["objval"] = str(fitness)
+        OUTPUT_dict["runtime"] = runtime
+        OUTPUT_dict["gap"] = str(gap)
+        if lower is not None:
+            OUTPUT_dict["lowerbound"] = str(lower)
+        OUTPUT_dict["timeinc"] = str(t_inc)
+        OUTPUT_dict["paths"] = tours
+        if improved is not None:
+            OUTPUT_dict["improvedobjval"] = str(improved[1])
+            OUTPUT_dict["improvedpaths"] = improved[0]
+        if recombined is not None:
+            OUTPUT_dict["recombinedobjval"] = str(recombined[1])
+            OUTPUT_dict["recombinedpaths"] = recombined[0]
+        OUTPUT_dict["convergence"] = convergence
+
+        output_dict["OUTPUT"] = OUTPUT_dict
+
+        import json
+        writer.write(json.dumps(output_dict))
+    os.replace(output_file + ".tmp", output_file)
+
+    print("output printed in {}".format(output_file))
@@ -3,206 +3,340 @@
 
 import math
 import os
+import time
 import sys
 from pathlib import Path
 
 import gurobipy as gp
+import numpy as np
 from gurobipy import GRB, quicksum
-from TSPLIBReader import read_TSPLIB_instance
+from Decomposition import initial_routes
+from EnvironmentPool import default_pool
+from LocalSearch import IncumbentPolisher, post_optimize
+from LowerBound import held_karp_bound, lp_bound, reduced_cost_elimination
+from ModelBuilder import build_karabulut_matrix, remove_arcs
+from Routes import route_costs, routes_from_successors, set_start, solution_values, successors
+from ResultStore import ResultCache, cache_path, run_key
+from RoutePool import RoutePool, recombine
+from TSPLIBReader import instance_digest, read_TSPLIB_instance
+from Telemetry import SolveTelemetry
 
 
-convergence = []
-def callback_incumbent_logger(model, where):
-    if where == GRB.Callback.MIPSOL:
+def callback_incumbent_logger(model, where, telemetry, polisher=None, race=None, pool=None, decode=None):
+    telemetry.callback(model, where)
 
-        this_objval = model.cbGet(GRB.Callback.MIPSOL_OBJ)
-        this_time = model.cbGet(GRB.Callback.RUNTIME)
+    if where == GRB.Callback.MIPSOL and pool is not None:
+        pool.add_routes(decode(model))
 
-        global t_inc, objval
-        if objval != this_objval:
-            objval = this_objval
-            t_inc = this_time
-            convergence.append([this_time, this_objval])
+    if where == GRB.Callback.MIPSOL and polisher is not None:
+        polisher.polish(model)
 
+    if race is not None:
+        race.callback(model, where)
 
-def build_path(edges: list, n: int):
-    not_routed = set(range(n))
-    track = []
-    for i in range(n):
-        track.append([])
-
-    for e in edges:
-        track[e[0]].append(e[1])
-        track[e[1]].append(e[0])
-
-    tours = []
-    while len(not_routed) > 0:
-        v = not_routed.pop()
-        tour = [v, track[v][0]]
-        not_routed.remove(track[v][0])
-
-        while tour[-1] != tour[0]:
-            # there are two possible elements per track[i]
-            if track[tour[-1]][0] != tour[-2]:
-                v = track[tour[-1]][0]
-            else:
-                v = track[tour[-1]][1]
 
-            tour.append(v)
-            if tour[0] != v:
-                not_routed.remove(v)
+def build_path(X):
+    """Cycles of the salespersons from the values X of x."""
+    I, J = np.nonzero(X.sum(axis=2) > 0.5)
+    return routes_from_successors(successors(len(X), I, J))
 
-        # remove repeated vertex from tour
-        tour.pop()
-        tours.append(tour)
 
-    return tours
+def build_model(model, D, n: int, m: int, U: int, objective: str):
+    # add variables
+    x = []
+    for i in range(n):
+        x.append([0] * n)
 
+    for i in range(n):
+        for j in range(n):
+            xk = []
+            for k in range(m):
+                xk.append(model.addVar(vtype=GRB.BINARY,
+                          name="x{}{}{}".format(i, j, k)))
+            x[i][j] = xk
 
-def solve(file_instance: str, m: int, U: int, BestObjStop=None, MemLimit=0.01, TimeLimit=5, objective="minsum", presolve=2, MIPGap=0.0,
-          outputFlag=0):
-    try:
-        global t_inc, objval
-        t_inc = math.inf
-        objval = math.inf
-
-        D, I = read_TSPLIB_instance(file_instance)
-        n = len(D)
-        if U > n:
-            U = n
-        inputparams["U"] = U
-
-        env = gp.Env(empty=True)
-        env.setParam("MemLimit", MemLimit)
-        env.start()
-
-        model = gp.Model(env=env)
-        model.setParam("presolve", presolve)
-        model.Params.outputFlag = outputFlag
-        model.setParam("MIPGap", MIPGap)
-        model.setParam("TimeLimit", TimeLimit)
-
-        if BestObjStop is not None:
-            model.setParam("BestObjStop", BestObjStop)
-
-        # add variables
-        x = []
-        for i in range(n):
-            x.append([0] * n)
+    t = []
+    z = []
+    for i in range(n):
+        t.append(model.addVar(vtype=GRB.CONTINUOUS, name='t{}'.format(i)))
+        z.append(model.addVar(vtype=GRB.BINARY, name='z{}'.format(i)))
+    variables = {"x": x, "t": t, "z": z}
 
-        for i in range(n):
-            for j in range(n):
-                x.append([0] * m)
+    # constraints
 
+    # (14)
+    for j in range(n):
+        cs14 = 0
         for i in range(n):
-            for j in range(n):
-                xk = []
-                for k in range(m):
-                    xk.append(model.addVar(vtype=GRB.BINARY,
-                              name="x{}{}{}".format(i, j, k)))
-                x[i][j] = xk
-
-        t = []
-        z = []
-        for i in range(n):
-            t.append(model.addVar(vtype=GRB.CONTINUOUS, name='t{}'.format(i)))
-            z.append(model.addVar(vtype=GRB.BINARY, name='z{}'.format(i)))
+            if i != j:
+                cs14 += quicksum(x[i][j][k] for k in range(m))
+        model.addConstr(cs14 == 1)
+
+    # (15)
+    for p in range(n):
+        for k in range(m):
+            model.addConstr(quicksum(x[i][p][k] for i in range(n) if i != p) -
+                            quicksum(x[p][j][k] for j in range(n) if j != p) == 0)
 
-        # constraints
+    # (16)
+    for k in range(m):
+        cs16 = 0
+        for i in range(n):
+            cs16 += quicksum(x[i][j][k] for j in range(n) if i != j)
+        model.addConstr(cs16 >= 1)
 
-        # (14)
+    # (17)
+    for i in range(n):
         for j in range(n):
-            cs14 = 0
-            for i in range(n):
-                if i != j:
-                    cs14 += quicksum(x[i][j][k] for k in range(m))
-            model.addConstr(cs14 == 1)
+            if i != j:
+                model.addConstr(t[i] - t[j] + U * quicksum(x[i][j][k]
+                                for k in range(m)) <= U - 1 + U * z[j])
 
-        # (15)
-        for p in range(n):
-            for k in range(m):
-                model.addConstr(quicksum(x[i][p][k] for i in range(n) if i != p) -
-                                quicksum(x[p][j][k] for j in range(n) if j != p) == 0)
+    # (18)
+    for i in range(n):
+        model.addConstr(1 <= t[i])
+        model.addConstr(t[i] <= U)
 
-        # (16)
-        for k in range(m):
-            cs16 = 0
-            for i in range(n):
-                cs16 += quicksum(x[i][j][k] for j in range(n) if i != j)
-            model.addConstr(cs16 >= 1)
+    # (19)
+    model.addConstr(quicksum(z) == m)
 
-        # (17)
+    if objective == "minsum":
+        minsum = 0
         for i in range(n):
             for j in range(n):
                 if i != j:
-                    model.addConstr(t[i] - t[j] + U * quicksum(x[i][j][k]
-                                    for k in range(m)) <= U - 1 + U * z[j])
-
-        # (18)
-        for i in range(n):
-            model.addConstr(1 <= t[i])
-            model.addConstr(t[i] <= U)
+                    minsum += D[i, j] * \
+                        quicksum(x[i][j][k] for k in range(m))
 
-        # (19)
-        model.addConstr(quicksum(z) == m)
+        # minsum objective function
+        model.setObjective(minsum)
 
-        if objective == "minsum":
-            minsum = 0
+    elif objective == "minmax":
+        Smax = model.addVar(vtype=GRB.INTEGER, name="Smax")
+        variables["Smax"] = Smax
+        # (22)
+        for k in range(m):
+            cs22 = 0
             for i in range(n):
-                for j in range(n):
-                    if i != j:
-                        minsum += D[i][j] * \
-                            quicksum(x[i][j][k] for k in range(m))
-
-            # minsum objective function
-            model.setObjective(minsum)
-
-        elif objective == "minmax":
-            Smax = model.addVar(vtype=GRB.INTEGER, name="Smax")
-            # (22)
-            for k in range(m):
-                cs22 = 0
-                for i in range(n):
-                    cs22 += quicksum(D[i][j] * x[i][j][k]
-                                     for j in range(n) if i != j)
-                model.addConstr(Smax >= cs22)
-
-            # minmax objective function
-            model.setObjective(Smax)
+                cs22 += quicksum(D[i, j] * x[i][j][k]
+                                 for j in range(n) if i != j)
+            model.addConstr(Smax >= cs22)
 
-        else:
-            raise ValueError("Invalid objective function!")
+        # minmax objective function
+        model.setObjective(Smax)
 
-        # attach callback for get incumbent time
-        model.optimize(callback_incumbent_logger)
+    else:
+        raise ValueError("Invalid objective function!")
 
-    except gp.GurobiError as e:
-        if e.errno != 10001:
-            print('Error code ' + str() + ': ' + str(e))
-            raise RuntimeError("Error at solving procedure!")
+    return variables
 
-    runtime = model.Runtime
-    fitness = model.objVal
-    gap = model.MIPGap
 
-    if model.SolCount > 0:
-        edges = []
-        for i in range(n):
-            for j in range(n):
-                for k in range(m):
-                    if x[i][j][k].X > 0.9:
-                        edges.append((i, j))
-                        # print(str(i) + ', ' + str(j))
+def encode_routes(D, routes: list, m: int):
+    """Values of every variable of the model for the routes, the first
+    vertex of each cycle is its root (z)."""
 
-        tours = build_path(edges, n)
-    else:
-        tours = []
+    n = len(D)
+    X = np.zeros((n, n, m))
+    T = np.zeros(n)
+    Z = np.zeros(n)
+    for k, route in enumerate(routes):
+        route = np.asarray(route)
+        X[route, np.roll(route, -1), k] = 1
+        T[route] = np.arange(1, len(route) + 1)
+        Z[route[0]] = 1
 
-    return tours, fitness, runtime, gap, t_inc
+    return {"x": X, "t": T, "z": Z, "Smax": route_costs(D, routes, "CP").max()}
 
 
-def run_karabulut(conf):
-    global inputparams
+def solve(file_instance: str, m: int, U: int, BestObjStop=None, MemLimit=0.01, TimeLimit=5, objective="minsum", presolve=2, MIPGap=0.0,
+          outputFlag=0, builder="matrix", MIPStart=False, localSearch=False, polish=False, Threads=0, D=None,
+          resultCache=False, telemetryFile=None, routePool=False, lowerBound=False,
+          arcElimination=False, info=None, race=None):
+    start_time = time.perf_counter()
+    env = None
+    model = None
+    telemetry = None
+    try:
+        try:
+            telemetry = SolveTelemetry(telemetryFile, info)
+
+            if D is None:
+                with telemetry.timer("matrix"):
+                    D, I = read_TSPLIB_instance(file_instance)
+            n = len(D)
+            if U > n:
+                U = n
+
+            # best known result of the same effective configuration
+            cache = None
+            cached = None
+            if resultCache:
+                cache = ResultCache(cache_path(file_instance))
+                key = run_key({"IP": "karabulut", "m": m, "U": U, "objective": objective},
+                              instance_digest(file_instance))
+                cached = cache.get(key)
+                if cached is not None and cached["gap"] == 0:
+                    # optimal, the model is not solved again
+                    telemetry.cached = True
+                    telemetry.t_inc = cached["t_inc"]
+                    telemetry.convergence = cached["convergence"]
+                    telemetry.close(objval=cached["objval"], gap=0.0, runtime=cached["runtime"], optimal=True)
+                    if race is not None:
+                        race.finish(True)
+                    return (cached["tours"], cached["objval"], cached["runtime"], 0.0, telemetry, cached["improved"],
+                            None, U)
+
+            # lower bound of the optimum, the solve stops once it is reached
+            if lowerBound:
+                telemetry.lower = held_karp_bound(D, m, "CP", objective)
+
+            env = default_pool.acquire()
+
+            model = gp.Model(env=env)
+            model.setParam("MemLimit", MemLimit)
+            model.setParam("presolve", presolve)
+            model.Params.outputFlag = outputFlag
+            model.setParam("MIPGap", MIPGap)
+            model.setParam("TimeLimit", TimeLimit)
+            model.setParam("Threads", Threads)
+
+            if BestObjStop is not None:
+                model.setParam("BestObjStop", BestObjStop)
+
+            # arcs in no solution as good as a heuristic one
+            eliminated = None
+            if arcElimination:
+                result = reduced_cost_elimination(D, m, 2, U, [], "CP", objective)
+                if result is not None:
+                    eliminated = result[0]
+                    telemetry.eliminated = float(eliminated.sum() / (len(D) * (len(D) - 1)))
+
+            with telemetry.timer("build"):
+                if builder == "matrix":
+                    # without the variables of the eliminated arcs
+                    variables = build_karabulut_matrix(model, D, n, m, U, objective, eliminated)
+                elif builder == "loop":
+                    variables = build_model(model, D, n, m, U, objective)
+                    if eliminated is not None:
+                        tails, heads = np.nonzero(eliminated)
+                        remove_arcs(model, variables["x"], tails, heads)
+                else:
+                    raise ValueError("Invalid model builder!")
+
+            if lowerBound == "LP":
+                # the LP relaxation of a linear model may be stronger
+                model.update()
+                if model.IsQP == 0:
+                    lower = lp_bound(model)
+                    if lower is not None:
+                        telemetry.lower = max(telemetry.lower, lower)
+
+            if telemetry.lower is not None and (BestObjStop is None or telemetry.lower > BestObjStop):
+                model.setParam("BestObjStop", telemetry.lower)
+
+            if MIPStart:
+                # split of a giant tour (or decomposition) into cycles
+                routes = initial_routes(D, m, 2, U, [], "CP", objective, MIPStart)
+                if routes is not None:
+                    set_start(model, variables, encode_routes(D, routes, m))
+
+            if cached is not None and len(cached["tours"]) > 0:
+                # a previous (non-optimal) solution
+                set_start(model, variables, encode_routes(D, cached["tours"], m))
+
+            # routes of an incumbent (in a MIPSOL callback) and values of the variables for some routes
+            decode = lambda model: build_path(solution_values(model, variables["x"], callback=True))
+            encode = lambda routes: encode_routes(D, routes, m)
+
+            # local search over every new incumbent
+            polisher = None
+            if polish:
+                polisher = IncumbentPolisher(D, 2, U, [], "CP", objective, variables, decode, encode)
+
+            # incumbents shared with the other formulations of a race
+            if race is not None:
+                race.attach(variables, decode, encode)
+
+            # routes of the incumbents, recombined after the solve
+            pool = None
+            if routePool:
+                pool = RoutePool(D, "CP")
+
+            # attach callback for get incumbent time
+            with telemetry.timer("solve"):
+                model.optimize(lambda model, where: callback_incumbent_logger(model, where, telemetry, polisher, race,
+                                                                              pool, decode))
+
+        except gp.GurobiError as e:
+            if e.errno != 10001:
+                print('Error code ' + str() + ': ' + str(e))
+                raise RuntimeError("Error at solving procedure!")
+
+            if model is None or model.SolCount == 0:
+                # out of memory before any solution, the model may not even be built
+                runtime = time.perf_counter() - start_time
+                if race is not None:
+                    race.finish(False)
+                telemetry.close(objval=math.inf, gap=math.inf, runtime=runtime, optimal=False)
+                return [], math.inf, runtime, math.inf, telemetry, None, None, U
+
+        runtime = model.Runtime
+        if model.SolCount > 0:
+            fitness = model.objVal
+            gap = model.MIPGap
+        else:
+            # no incumbent within the limits
+            fitness = math.inf
+            gap = math.inf
+        if telemetry.lower is not None and model.SolCount > 0 and fitness != 0:
+            # gap to the best of the MIP bound and the lower bound
+            gap = min(gap, max(fitness - telemetry.lower, 0) / abs(fitness))
+
+        # an incumbent that reaches the lower bound (BestObjStop) is also optimal
+        optimal = model.Status == GRB.OPTIMAL or (model.SolCount > 0 and gap == 0)
+        if race is not None:
+            race.finish(optimal)
+
+        if model.SolCount > 0:
+            tours = build_path(solution_values(model, variables["x"]))
+        else:
+            tours = []
+    except BaseException as error:
+        # the stream of a failed (or interrupted) solve ends too
+        if telemetry is not None:
+            telemetry.abort(error)
+        raise
+    finally:
+        # the environment is kept for the next solves
+        if model is not None:
+            model.dispose()
+        if env is not None:
+            default_pool.release(env)
+
+    # post-optimization of the returned paths
+    improved = None
+    if localSearch:
+        improved = post_optimize(D, tours, 2, U, [], "CP", objective)
+
+    # recombination of the routes of the incumbents
+    recombined = None
+    if pool is not None:
+        # within the time left of the run
+        remaining = max(TimeLimit - (time.perf_counter() - start_time), 0)
+        pool.add_routes(tours)
+        if improved is not None:
+            pool.add_routes(improved[0])
+        recombined = recombine(pool, n, m, 2, U, objective, remaining, Threads)
+
+    if cache is not None and len(tours) > 0:
+        cache.put(key, {"tours": tours, "objval": fitness, "runtime": runtime, "gap": gap,
+                        "t_inc": telemetry.t_inc, "convergence": telemetry.convergence, "improved": improved})
+
+    telemetry.close(objval=fitness, gap=gap, runtime=runtime, optimal=optimal)
+    return tours, fitness, runtime, gap, telemetry, improved, recombined, U
+
+
+def run_karabulut(conf, D=None, race=None):
     inputparams = {"IP": conf["IP"]}  # register of input parameters
 
     output_file = conf["outputFile"]
@@ -252,11 +386,65 @@ def run_karabulut(conf):
     outputFlag = conf["outputFlag"]
     inputparams["outputFlag"] = outputFlag
 
-    tours, fitness, runtime, gap, t_inc = solve(file_instance=file_instance, m=m, U=U, BestObjStop=BestObjStop, MemLimit=MemLimit,
-                                                TimeLimit=TimeLimit, objective=objective,
-                                                presolve=presolve, MIPGap=MIPGap, outputFlag=outputFlag)
+    Threads = 0
+    if "Threads" in conf:
+        Threads = conf["Threads"]
+        inputparams["Threads"] = Threads
+
+    builder = "matrix"
+    if "builder" in conf:
+        builder = conf["builder"]
+        inputparams["builder"] = builder
+
+    MIPStart = False
+    if "MIPStart" in conf:
+        MIPStart = conf["MIPStart"]
+        inputparams["MIPStart"] = MIPStart
+
+    telemetryFile = None
+    if "telemetryFile" in conf:
+        telemetryFile = conf["telemetryFile"]
+        inputparams["telemetryFile"] = telemetryFile
+
+    resultCache = False
+    if "resultCache" in conf:
+        resultCache = conf["resultCache"]
+        inputparams["resultCache"] = resultCache
+
+    polish = False
+    if "polish" in conf:
+        polish = conf["polish"]
+        inputparams["polish"] = polish
+
+    lowerBound = False
+    if "lowerBound" in conf:
+        lowerBound = conf["lowerBound"]
+        inputparams["lowerBound"] = lowerBound
+
+    arcElimination = False
+    if "arcElimination" in conf:
+        arcElimination = conf["arcElimination"]
+        inputparams["arcElimination"] = arcElimination
+
+    routePool = False
+    if "routePool" in conf:
+        routePool = conf["routePool"]
+        inputparams["routePool"] = routePool
+
+    localSearch = False
+    if "localSearch" in conf:
+        localSearch = conf["localSearch"]
+        inputparams["localSearch"] = localSearch
+
+    tours, fitness, runtime, gap, telemetry, improved, recombined, U = solve(
+        file_instance=file_instance, m=m, U=U, BestObjStop=BestObjStop, MemLimit=MemLimit, TimeLimit=TimeLimit,
+        objective=objective, presolve=presolve, MIPGap=MIPGap, outputFlag=outputFlag, builder=builder,
+        MIPStart=MIPStart, localSearch=localSearch, polish=polish, Threads=Threads, D=D, resultCache=resultCache,
+        telemetryFile=telemetryFile, routePool=routePool, lowerBound=lowerBound, arcElimination=arcElimination,
+        info=dict(inputparams), race=race)
+    inputparams["U"] = U
 
-    with open(output_file, "a") as writer:
+    with open(output_file + ".tmp", "w") as writer:
         ignored = conf.copy()
 
         output_dict = {}
@@ -283,13 +471,27 @@ def run_karabulut(conf):
         OUTPUT_dict["objval"] = str(fitness)
         OUTPUT_dict["runtime"] = runtime
         OUTPUT_dict["gap"] = str(gap)
-        OUTPUT_dict["timeinc"] = str(t_inc)
+        if telemetry.lower is not None:
+            OUTPUT_dict["lowerbound"] = str(telemetry.lower)
+        if telemetry.eliminated is not None:
+            OUTPUT_dict["eliminated"] = telemetry.eliminated
+        OUTPUT_dict["timeinc"] = str(telemetry.t_inc)
         OUTPUT_dict["paths"] = tours
-        OUTPUT_dict["convergence"] = convergence
+        if improved is not None:
+            OUTPUT_dict["improvedobjval"] = str(improved[1])
+            OUTPUT_dict["improvedpaths"] = improved[0]
+        if recombined is not None:
+            OUTPUT_dict["recombinedobjval"] = str(recombined[1])
+            OUTPUT_dict["recombinedpaths"] = recombined[0]
+        OUTPUT_dict["convergence"] = telemetry.convergence
+        OUTPUT_dict["times"] = telemetry.times
+        if telemetry.cached:
+            OUTPUT_dict["cached"] = True
 
         output_dict["OUTPUT"] = OUTPUT_dict
 
         import json
         writer.write(json.dumps(output_dict))
+    os.replace(output_file + ".tmp", output_file)
 
     print("output printed in {}".format(output_file))
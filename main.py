@@ -4,10 +4,35 @@
 import json
 import sys
 
+from Decomposition import run_decomposition
 from IP1 import run_IP1
 from IP2 import run_IP2
+from Race import run_race
+from heuristic import run_heuristic
 from karabulut import run_karabulut
 
+
+def run(conf, D=None):
+    """Runs the formulation (the heuristic, the decomposition, or a race of
+    formulations) given by conf["IP"]. If D is given, it is used as the
+    distance matrix of the instance instead of reading it."""
+
+    if conf["IP"] == "karabulut":
+        run_karabulut(conf, D)
+    elif conf["IP"] == "IP1":
+        run_IP1(conf, D)
+    elif conf["IP"] == "IP2":
+        run_IP2(conf, D)
+    elif conf["IP"] == "heuristic":
+        run_heuristic(conf, D)
+    elif conf["IP"] == "race":
+        run_race(conf, D)
+    elif conf["IP"] == "decomposition":
+        run_decomposition(conf, D)
+    else:
+        raise Exception("Wrong formulation!")
+
+
 if __name__ == '__main__':
     if len(sys.argv) != 2:
         raise Exception("Wrong number of arguments!")
@@ -17,12 +42,4 @@ if __name__ == '__main__':
         file_contents = user_file.read()
 
     conf = json.loads(file_contents)
-
-    if conf["IP"] == "karabulut":
-        run_karabulut(conf)
-    elif conf["IP"] == "IP1":
-        run_IP1(conf)
-    elif conf["IP"] == "IP2":
-        run_IP2(conf)
-    else:
-        raise Exception("Wrong formulation!")
+    run(conf)
@@ -0,0 +1,217 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import itertools
+
+import gurobipy as gp
+import numpy as np
+import pytest
+from gurobipy import GRB
+
+import IP1
+import IP2
+import karabulut
+from ModelBuilder import build_IP1_matrix, build_karabulut_matrix
+from TSPLIBReader import DummyDepotMatrix, SymmetricDistanceMatrix, read_TSPLIB_instance
+
+
+def small_instance(n):
+    """First n vertices of burma14."""
+
+    D, I = read_TSPLIB_instance("TSPLIB/burma14.tsp")
+    I, J = np.triu_indices(n, 1)
+    return SymmetricDistanceMatrix.from_upper(n, D.pairs(I, J))
+
+
+def model_size(build):
+    with gp.Env(params={"OutputFlag": 0}) as env, gp.Model(env=env) as model:
+        build(model)
+        model.update()
+        return model.NumVars, model.NumConstrs, model.NumQConstrs, model.NumNZs, model.IsQP
+
+
+def canonical_row(terms, sense, rhs):
+    """Row as sorted (column, coefficient) pairs without zeros, its sense
+    and right-hand side, with >= rows negated into <= rows and equality rows
+    scaled so that their first coefficient is positive."""
+
+    terms = sorted((column, value) for column, value in terms if value != 0)
+    if sense == GRB.GREATER_EQUAL or (sense == GRB.EQUAL and len(terms) > 0 and terms[0][1] < 0):
+        terms = [(column, -value) for column, value in terms]
+        rhs = -rhs
+        if sense == GRB.GREATER_EQUAL:
+            sense = GRB.LESS_EQUAL
+    return tuple(terms), sense, rhs
+
+
+def quadratic_terms(pairs):
+    """Sum of the coefficients of every unordered pair of columns, without zeros."""
+
+    terms = {}
+    for i, j, value in pairs:
+        key = (min(i, j), max(i, j))
+        terms[key] = terms.get(key, 0) + value
+    return [(key, value) for key, value in sorted(terms.items()) if value != 0]
+
+
+def model_data(build):
+    """Variables, constraints and objective of the model built by build.
+    Columns are numbered in the order of the variables it returns (by name,
+    then index), so models built in a different order are equal."""
+
+    with gp.Env(params={"OutputFlag": 0}) as env, gp.Model(env=env) as model:
+        variables = build(model)
+        model.update()
+
+        order = []
+        for name, x in sorted(variables.items()):
+            x = x.tolist() if isinstance(x, gp.MVar) else x
+            order += [var.index for var in np.array(x, dtype=object).ravel()]
+        assert sorted(order) == list(range(model.NumVars))
+        column = np.empty(model.NumVars, dtype=np.int64)
+        column[order] = np.arange(model.NumVars)
+
+        def by_column(values):
+            ordered = np.empty(len(values), dtype=object)
+            ordered[column] = values
+            return ordered.tolist()
+
+        allvars = model.getVars()
+        A = model.getA().tocsr()
+        senses = model.getAttr(GRB.Attr.Sense, model.getConstrs())
+        rhs = model.getAttr(GRB.Attr.RHS, model.getConstrs())
+        rows = sorted(canonical_row(zip(column[A.indices[A.indptr[r]:A.indptr[r + 1]]].tolist(),
+                                        A.data[A.indptr[r]:A.indptr[r + 1]].tolist()), senses[r], rhs[r])
+                      for r in range(A.shape[0]))
+
+        quadratic_rows = []
+        for qc in model.getQConstrs():
+            expr = model.getQCRow(qc)
+            linear = expr.getLinExpr()
+            terms = quadratic_terms((column[expr.getVar1(i).index], column[expr.getVar2(i).index], expr.getCoeff(i))
+                                    for i in range(expr.size()))
+            terms += [((-1, column[linear.getVar(i).index]), linear.getCoeff(i)) for i in range(linear.size())]
+            quadratic_rows.append(canonical_row(terms, qc.QCSense, qc.QCRHS))
+
+        Q = model.getQ().tocoo() if model.IsQP else None
+        return {"vtype": by_column(model.getAttr(GRB.Attr.VType, allvars)),
+                "lb": by_column(model.getAttr(GRB.Attr.LB, allvars)),
+                "ub": by_column(model.getAttr(GRB.Attr.UB, allvars)),
+                "rows": rows,
+                "quadratic rows": sorted(quadratic_rows),
+                "obj": by_column(model.getAttr(GRB.Attr.Obj, allvars)),
+                "Q": [] if Q is None else quadratic_terms(zip(column[Q.row], column[Q.col], Q.data)),
+                "sense": model.ModelSense}
+
+
+@pytest.mark.parametrize("objective, U", list(itertools.product(["minsum", "minmax"], [5, 10])))
+def test_karabulut_builders_build_the_same_model(objective, U):
+    D = small_instance(10)
+    n, m = len(D), 3
+    assert (model_data(lambda model: karabulut.build_model(model, D, n, m, U, objective)) ==
+            model_data(lambda model: build_karabulut_matrix(model, D, n, m, U, objective)))
+
+
+@pytest.mark.parametrize("objective, variant, IQP, R, bounds",
+                         list(itertools.product(["minsum", "minmax"], ["CP", "OP"], [True, False], [[], [1, 4]],
+                                                [(2, 5), (3, 10)])))
+def test_IP1_builders_build_the_same_model(objective, variant, IQP, R, bounds):
+    D = small_instance(10)
+    m = 3
+    C = DummyDepotMatrix(D, m)
+    n = len(C)
+    L, U = bounds
+    assert (model_data(lambda model: IP1.build_model(model, C, n, m, L, U, R, IQP, objective, variant)) ==
+            model_data(lambda model: build_IP1_matrix(model, C, n, m, L, U, R, IQP, objective, variant)))
+
+
+@pytest.mark.parametrize("objective", ["minsum", "minmax"])
+def test_builders_find_the_same_optimum(objective):
+    D = small_instance(6)
+    for solve in [lambda builder: IP1.solve(None, 2, 2, 4, IQP=False, objective=objective, builder=builder,
+                                            localSearch=False, TimeLimit=60, D=D),
+                  lambda builder: karabulut.solve(None, 2, 4, objective=objective, builder=builder,
+                                                  localSearch=False, TimeLimit=60, D=D)]:
+        loop, matrix = solve("loop"), solve("matrix")
+        assert loop[3] == matrix[3] == 0
+        assert loop[1] == matrix[1]
+
+
+def test_matrix_builders_leave_out_eliminated_arcs():
+    D = small_instance(10)
+    n, m = len(D), 3
+    eliminated = np.random.default_rng(0).random((n, n)) < 0.3
+    np.fill_diagonal(eliminated, False)
+    C = DummyDepotMatrix(D, m)
+
+    # x and y variables of every salesperson, and the rows bounding them
+    full = model_size(lambda model: build_IP1_matrix(model, C, n + m, m, 2, 5, [], False, "minsum", "CP"))
+    reduced = model_size(lambda model: build_IP1_matrix(model, C, n + m, m, 2, 5, [], False, "minsum", "CP",
+                                                        eliminated))
+    assert full[0] - reduced[0] == 2 * m * eliminated.sum()
+    assert reduced[1] < full[1]
+
+    full = model_size(lambda model: build_karabulut_matrix(model, D, n, m, 5, "minsum"))
+    reduced = model_size(lambda model: build_karabulut_matrix(model, D, n, m, 5, "minsum", eliminated))
+    assert full[0] - reduced[0] == m * eliminated.sum()
+    assert full[1] - reduced[1] == eliminated.sum()
+
+    C = DummyDepotMatrix(D, m, first=False)
+    full = model_size(lambda model: IP2.build_model_matrix(model, C, n, n + m, 2, 5, [], False, "minsum", "CP"))
+    reduced = model_size(lambda model: IP2.build_model_matrix(model, C, n, n + m, 2, 5, [], False, "minsum", "CP",
+                                                              eliminated))
+    assert full[0] - reduced[0] == 2 * eliminated.sum()
+    assert reduced[1] < full[1]
+
+
+@pytest.mark.parametrize("solve", [IP1.solve, IP2.solve])
+def test_builders_eliminate_the_same_arcs(solve):
+    D = small_instance(6)
+    loop, matrix = (solve(None, 2, 2, 4, IQP=False, builder=builder, localSearch=False, TimeLimit=60, D=D,
+                          arcElimination=True) for builder in ["loop", "matrix"])
+    assert loop[4].eliminated == matrix[4].eliminated > 0
+    assert loop[3] == matrix[3] == 0
+    assert loop[1] == matrix[1]
+
+
+# variant, IQP, R and whether the lengths of the paths are bounded by (38)-(41)
+IP2_GRID = list(itertools.product(["CP", "OP"], [True, False], [[], [1, 4]], [True, False]))
+
+
+@pytest.mark.parametrize("variant, IQP, R, bounded", IP2_GRID)
+def test_IP2_builders_build_the_same_model(variant, IQP, R, bounded):
+    D = small_instance(10)
+    n, m = len(D), 3
+    C = DummyDepotMatrix(D, m, first=False)
+    L, U = (2, 5) if bounded else (2, n)
+    assert (model_data(lambda model: IP2.build_model(model, C, n, n + m, L, U, R, IQP, "minsum", variant)) ==
+            model_data(lambda model: IP2.build_model_matrix(model, C, n, n + m, L, U, R, IQP, "minsum", variant)))
+
+
+@pytest.mark.parametrize("build", [IP2.build_model, IP2.build_model_matrix])
+def test_IP2_builders_are_minsum_only(build):
+    D = small_instance(10)
+    C = DummyDepotMatrix(D, 3, first=False)
+    with pytest.raises(ValueError):
+        model_size(lambda model: build(model, C, 10, 13, 2, 5, [], False, "minmax", "CP"))
+
+
+@pytest.mark.parametrize("variant, IQP, R, bounded", IP2_GRID)
+def test_IP2_builders_find_the_same_optimum(variant, IQP, R, bounded):
+    D = small_instance(6)
+    L, U = (2, 4) if bounded else (2, 6)
+    loop, matrix = (IP2.solve(None, 2, L, U, R=R, IQP=IQP, variant=variant, builder=builder,
+                              localSearch=False, TimeLimit=60, D=D) for builder in ["loop", "matrix"])
+    assert loop[3] == matrix[3] == 0
+    assert loop[1] == matrix[1]
+
+
+@pytest.mark.parametrize("builder", ["loop", "matrix"])
+def test_solves_without_memory_return_no_solution(builder):
+    D = small_instance(6)
+    # out of memory (errno 10001) before the model is built
+    for tours, fitness in [IP1.solve(None, 2, 2, 4, builder=builder, MemLimit=1e-6, D=D)[:2],
+                           IP2.solve(None, 2, 2, 4, builder=builder, MemLimit=1e-6, D=D)[:2],
+                           karabulut.solve(None, 2, 4, builder=builder, MemLimit=1e-6, D=D)[:2]]:
+        assert tours == []
+        assert fitness == float("inf")
@@ -0,0 +1,18 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+import pytest
+
+from Decomposition import route_group, submatrix
+from TSPLIBReader import read_TSPLIB_instance
+
+
+@pytest.mark.parametrize("routing", ["IP2", "exact"])
+def test_route_group_without_solver_solution(routing):
+    # 25 vertices, beyond Held-Karp and a size-limited Gurobi license
+    D, I = read_TSPLIB_instance("TSPLIB/eil51.tsp")
+    group = submatrix(D, list(range(25)))
+    route = route_group(group, True, "CP", routing, TimeLimit=2, MemLimit=0.01)
+
+    assert route[0] == 0
+    assert sorted(route) == list(range(25))
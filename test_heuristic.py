@@ -0,0 +1,51 @@
+# This work is licensed under CC BY-NC 4.0 
+# Authors: Cornejo-Acosta, J.A.; Garcia-Diaz, J.; Perez-Sansalvador, J.C.; Segura, C. 
+
+from heuristic import solve
+from Routes import objective_value, route_costs
+from TSPLIBReader import LazyDistanceMatrix, read_TSPLIB_instance
+
+
+def test_heuristic_on_lazy_distance_matrix():
+    D, I = read_TSPLIB_instance("TSPLIB/a280.tsp", lazy=True)
+    assert isinstance(D, LazyDistanceMatrix)
+
+    m, L, U = 3, 50, 120
+    tours, fitness = solve(None, m, L, U, TimeLimit=60, objective="minmax", variant="OP", iterations=20,
+                           localSearch=False, D=D)[:2]
+
+    # m paths covering every vertex once, under L and U
+    assert len(tours) == m
+    assert sorted(v for tour in tours for v in tour) == list(range(len(D)))
+    assert all(L <= len(tour) <= U for tour in tours)
+
+    # same objective value over the stored distance matrix
+    P, I = read_TSPLIB_instance("TSPLIB/a280.tsp")
+    assert fitness == objective_value(route_costs(P, tours, "OP"), "minmax")
+
+
+def test_explicit_instances_are_not_lazy():
+    # explicit instances have no coordinates to compute the distances from
+    D, I = read_TSPLIB_instance("TSPLIB/bays29.tsp", lazy=True)
+    assert not isinstance(D, LazyDistanceMatrix)
+
+
+def test_solves_keep_their_own_convergence():
+    D, I = read_TSPLIB_instance("TSPLIB/burma14.tsp")
+    first = solve(None, 3, 2, 14, TimeLimit=60, iterations=20, localSearch=False, D=D)
+    second = solve(None, 3, 2, 14, TimeLimit=60, iterations=20, localSearch=False, D=D)
+
+    # the same search, traced from its first incumbent
+    assert [objval for time, objval in first[5]] == [objval for time, objval in second[5]]
+    assert first[5][-1][1] == first[1]
+
+
+def test_lazy_heuristic_within_time_limit():
+    # 33810 vertices, too many to store their distance matrix
+    TimeLimit = 5
+    tours, fitness, runtime = solve("TSPLIB/pla33810.tsp", 3, 2, 33810, TimeLimit=TimeLimit, localSearch=False,
+                                    lazy=True)[:3]
+
+    assert sorted(v for tour in tours for v in tour) == list(range(33810))
+    # the runtime includes reading the instance
+    assert runtime <= TimeLimit + 0.5